@@ -0,0 +1,182 @@
+"""
+Measure the throughput (lines and MB per second) and peak memory of parsing
+the bundled test logs with the full Molcas / Gaussian `LogRule` trees, in
+every way a Parser can read its input. Larger synthetic logs can be generated
+with `--sizes` (see `molextract.synthetic`), whose parsed output is checked
+against the known output of the generator in every mode before timing.
+
+Results can be stored as a baseline and later runs compared against it, a run
+that is slower or uses more memory than the baseline by more than
+`--threshold` exits with a non-zero status
+
+    python benchmarks/parse.py --save baseline.json
+    python benchmarks/parse.py --compare baseline.json
+    python benchmarks/parse.py --sizes 100,2000 --modes stream,mmap
+
+Throughput is the best of `--repeat` runs, which should be compared on the
+same quiet machine. Peak memory is measured with tracemalloc in a separate
+run, so it covers the memory allocated by Python but not the pages of memory
+mapped files.
+"""
+import argparse
+import json
+import os
+import pathlib
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from molextract import synthetic
+from molextract.parser import Parser
+
+TEST_FILES_DIR = pathlib.Path(__file__).parent.parent / 'test' / 'test_files'
+LOGS = {
+    'molcas': ['styrene.log', 'FMNhq_Ph-2.log'],
+    'gaussian': ['b-carotene.log'],
+}
+MODES = ['feed', 'stream', 'mmap', 'bytes']
+MB = 1 << 20
+
+
+def iter_runs(factory, path, mode):
+    # Parse every run in the file, so concatenated logs are parsed in full
+    parser = Parser(factory(), binary=mode == 'bytes')
+    if mode == 'feed':
+        return parser.iter_feed(pathlib.Path(path).read_text())
+    return parser.iter_feed_file(path, use_mmap=mode == 'mmap')
+
+
+def parse(factory, path, mode):
+    for _ in iter_runs(factory, path, mode):
+        pass
+
+
+def validate(factory, path, mode, expected):
+    """
+    Exit if the output of any run of the log is not the expected output
+    """
+    count = 0
+    for count, out in enumerate(iter_runs(factory, path, mode), 1):
+        if count > len(expected) or out != expected[count - 1]:
+            sys.exit(f'{path}:{mode}: run {count} does not match the '
+                     'output expected by the generator')
+    if count != len(expected):
+        sys.exit(f'{path}:{mode}: parsed {count} of {len(expected)} runs')
+
+
+def measure(factory, path, mode, repeat):
+    with open(path, 'rb') as f:
+        lines = sum(
+            chunk.count(b'\n') for chunk in iter(lambda: f.read(MB), b''))
+    size = os.path.getsize(path)
+
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        parse(factory, path, mode)
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    parse(factory, path, mode)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        'seconds': best,
+        'lines_per_s': lines / best,
+        'mb_per_s': size / MB / best,
+        'peak_bytes': peak,
+    }
+
+
+def compare(results, baseline, threshold):
+    """
+    Print how every result compares to the baseline, and return whether any
+    result regressed by more than the threshold
+    """
+    regressed = False
+    print(f'{"benchmark":<40}{"lines/s":>10}{"peak":>10}')
+    for key, result in results.items():
+        base = baseline.get(key)
+        if base is None:
+            print(f'{key:<40}{"new":>10}{"new":>10}')
+            continue
+
+        speed = result['lines_per_s'] / base['lines_per_s']
+        memory = result['peak_bytes'] / max(base['peak_bytes'], 1)
+        flags = ''
+        if speed < 1 - threshold or memory > 1 + threshold:
+            regressed = True
+            flags = '  REGRESSION'
+        print(f'{key:<40}{speed:>9.2f}x{memory:>9.2f}x{flags}')
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--modes',
+                        default=','.join(MODES),
+                        help='the comma separated ways of reading the input '
+                        f'to benchmark, of {", ".join(MODES)}')
+    parser.add_argument('--sizes',
+                        default='',
+                        help='comma separated sizes in MB of generated logs '
+                        'to benchmark as well')
+    parser.add_argument('--save', help='store the results as a baseline')
+    parser.add_argument('--compare', help='compare against a baseline')
+    parser.add_argument('--threshold',
+                        type=float,
+                        default=0.1,
+                        help='the slowdown / memory growth allowed compared '
+                        'to the baseline, defaults to 0.1')
+    args = parser.parse_args()
+    modes = args.modes.split(',')
+    sizes = [int(size) for size in args.sizes.split(',') if size]
+
+    results = {}
+    print(f'{"benchmark":<40}{"lines/s":>12}{"MB/s":>8}{"peak MB":>10}')
+    with tempfile.TemporaryDirectory() as tmp:
+        workloads = []
+        for program, names in LOGS.items():
+            factory = synthetic.RULES[program]
+            for name in names:
+                workloads.append((name, factory, TEST_FILES_DIR / name, None))
+            for size in sizes:
+                path = pathlib.Path(tmp) / f'synthetic-{program}-{size}MB.log'
+                expected = synthetic.write_log(str(path), program, size_mb=size)
+                workloads.append((path.name, factory, path, expected))
+
+        for name, factory, path, expected in workloads:
+            for mode in modes:
+                if mode == 'feed' and os.path.getsize(path) > 100 * MB:
+                    # Reading a giant log into a single string is not a
+                    # realistic use
+                    continue
+                if expected is not None:
+                    validate(factory, str(path), mode, expected)
+                key = f'{name}:{mode}'
+                result = measure(factory, str(path), mode, args.repeat)
+                results[key] = result
+                print(f'{key:<40}{result["lines_per_s"]:>12.0f}'
+                      f'{result["mb_per_s"]:>8.1f}'
+                      f'{result["peak_bytes"] / MB:>10.1f}')
+
+    if args.save is not None:
+        baseline = {'python': platform.python_version(), 'results': results}
+        with open(args.save, 'w') as f:
+            json.dump(baseline, f, indent=4)
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        print()
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
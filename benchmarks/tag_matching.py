@@ -0,0 +1,84 @@
+"""
+Measure the per-line cost of testing the start / end tags of the bundled
+Molcas and Gaussian rules against every line of the test logs, comparing
+`Rule.start_tag_matches` / `end_tag_matches` with running the plain regex.
+
+    python benchmarks/tag_matching.py
+"""
+import argparse
+import pathlib
+import timeit
+
+from molextract.rule import Rule
+from molextract.rules.gaussian import general as gaussian_general
+from molextract.rules.gaussian import log as gaussian_log
+from molextract.rules.gaussian import tddft
+from molextract.rules.molcas import general, log, mcpdft, rasscf, rassi
+
+TEST_FILES_DIR = pathlib.Path(__file__).parent.parent / 'test' / 'test_files'
+LOGS = ['styrene.log', 'FMNhq_Ph-2.log', 'b-carotene.log']
+
+
+def all_rules():
+    return [
+        log.LogRule(),
+        log.ModuleRule("rasscf"),
+        general.MolProps(),
+        mcpdft.MCPDFTEnergy(),
+        mcpdft.MCPDFTRefEnergy(),
+        rasscf.RASSCFEnergy(),
+        rasscf.RASSCFOccupation(),
+        rasscf.RASSCFCiCoeff(),
+        rasscf.RASSCFOrbSpec(),
+        rasscf.RASSCFCIExpansionSpec(),
+        rasscf.RASSCFCartesianCoords(),
+        rassi.RASSIDipoleStrengths(),
+        gaussian_log.LogRule(),
+        gaussian_general.DipoleMoment(),
+        tddft.TDDFTExcitedState(),
+    ]
+
+
+def regex_matcher(rule: Rule, compiled_re):
+    match = compiled_re.match
+    if not rule._check_only_beginning:
+        match = compiled_re.search
+    return lambda line: match(line) is not None
+
+
+def time_per_line(matcher, lines, repeat):
+
+    def run():
+        for line in lines:
+            matcher(line)
+
+    best = min(timeit.repeat(run, number=1, repeat=repeat))
+    return best / len(lines) * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    for name in LOGS:
+        with open(TEST_FILES_DIR / name) as f:
+            lines = f.read().split('\n')
+
+        print(f'{name} ({len(lines)} lines), ns per line')
+        print(f'{"rule":<24}{"tag":<6}{"regex":>10}{"rule":>10}{"speedup":>10}')
+        for rule in all_rules():
+            for tag, compiled_re, matcher in [
+                ('start', rule._start_tag, rule._start_matches),
+                ('end', rule._end_tag, rule._end_matches),
+            ]:
+                base = time_per_line(regex_matcher(rule, compiled_re), lines,
+                                     args.repeat)
+                fast = time_per_line(matcher, lines, args.repeat)
+                print(f'{rule.rule_id():<24}{tag:<6}{base:>10.1f}{fast:>10.1f}'
+                      f'{base / fast:>9.2f}x')
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -5,4 +5,5 @@ rules = [rasscf.RASSCFModule(), mcpdft.MCPDFTModule(), rassi.RASSIModule()]
 log_rule = log.LogRule(rules)
 
 parser = me.Parser(log_rule)
-parser.cli()
+if __name__ == "__main__":
+    parser.cli()
@@ -3,4 +3,5 @@ from molextract.rules.molcas import rasscf, log
 
 rlr = log.LogRule(rules=[rasscf.RASSCFEnergy()])
 parser = me.Parser(rlr)
-parser.cli()
+if __name__ == "__main__":
+    parser.cli()
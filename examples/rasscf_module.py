@@ -2,4 +2,5 @@ import molextract as me
 from molextract.rules.molcas import rasscf
 
 parser = me.Parser(rasscf.RASSCFModule())
-parser.cli()
+if __name__ == "__main__":
+    parser.cli()
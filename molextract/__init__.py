@@ -1,4 +1,6 @@
 from .rule import Rule  # noqa
 from .parser import Parser  # noqa
+from .multi import MultiParser  # noqa
+from .spec import RuleSpec  # noqa
 
 __version__ = '1.0.0'
@@ -0,0 +1,161 @@
+"""
+Parse many files with the same Parser across a pool of worker processes
+"""
+import concurrent.futures
+from concurrent.futures.process import BrokenProcessPool
+import glob
+import itertools
+import os
+import pickle
+from typing import (TYPE_CHECKING, Any, Dict, Generator, Iterable, Iterator,
+                    List, Optional, Tuple)
+
+if TYPE_CHECKING:
+    from molextract.parser import Parser
+
+GLOB_CHARS = "*?["
+
+# The outcome of parsing a single file: (path, parsed data, error message)
+FileResult = Tuple[str, Any, Optional[str]]
+
+_worker_parser: Optional["Parser"] = None
+_worker_snapshot = b""
+
+
+def expand_paths(paths: Iterable[str],
+                 file_list: Optional[str] = None) -> List[str]:
+    """
+    Expand glob patterns (including recursive '**' patterns) in the given
+    paths, and append every path listed in `file_list`. Paths that are not
+    glob patterns are kept as is, even if they do not exist, so that the
+    error is reported when the file is parsed.
+
+    :param paths: paths or glob patterns
+    :param file_list: the path to a file listing one path per line, defaults
+        to None
+    :return: the expanded list of paths
+    """
+    expanded = []
+    for path in paths:
+        if any(char in path for char in GLOB_CHARS):
+            expanded.extend(sorted(glob.glob(path, recursive=True)))
+        else:
+            expanded.append(path)
+
+    if file_list is not None:
+        with open(file_list, "r") as f:
+            expanded.extend(line.strip() for line in f if line.strip())
+
+    return expanded
+
+
+def parse_files(parser: "Parser",
+                paths: Iterable[str],
+                jobs: Optional[int] = None) -> Iterator[FileResult]:
+    """
+    Parse every file with the given parser and yield a (path, data, error)
+    tuple for each file as soon as it is parsed. Errors are isolated per
+    file: if parsing a file raises, its data is None and error holds the
+    message, and the remaining files are still parsed.
+
+    The parser is pickled once up front and files are only parsed by copies
+    of it (one per worker process), so the parser's rules must be picklable.
+    A parser created with `Parser.from_factory` is pickled as just its
+    factory, and every copy builds fresh rules from it.
+    A copy is restored from the pickle after a failed file so partial state
+    can not leak into the next file. With more than one job results are
+    yielded in the order they complete, not the order of `paths`, and only a
+    few files per job are queued at a time. If a worker process dies (e.g.
+    killed for running out of memory) the files queued in the pool are
+    reported as failed, and the remaining files are parsed by a new pool.
+
+    :param parser: the parser to parse every file with
+    :param paths: the paths of the files to parse
+    :param jobs: the number of worker processes, defaults to None which uses
+        one per CPU. With 1 job files are parsed in the current process
+    :return: an iterator of (path, data, error) tuples
+    """
+    if jobs is None or jobs < 1:
+        jobs = os.cpu_count() or 1
+
+    snapshot = pickle.dumps(parser)
+    if jobs == 1:
+        parser = pickle.loads(snapshot)
+        for path in paths:
+            result = parse_file(parser, path)
+            if result[2] is not None:
+                parser = pickle.loads(snapshot)
+            yield result
+        return
+
+    todo = iter(paths)
+    broken = True
+    while broken:
+        with concurrent.futures.ProcessPoolExecutor(
+                jobs, initializer=_init_worker, initargs=(snapshot,)) as pool:
+            broken = yield from _parse_in_pool(pool, todo, jobs * 2)
+
+
+def parse_file(parser: "Parser", path: str) -> FileResult:
+    """
+    Parse a single file with the given parser, in the current process
+
+    :param parser: the parser to parse the file with
+    :param path: the path of the file to parse
+    :return: a (path, data, error) tuple, see `parse_files`
+    """
+    try:
+        return path, parser.feed_file(path), None
+    except Exception as e:
+        return path, None, _error_message(e)
+
+
+def _parse_in_pool(pool: concurrent.futures.ProcessPoolExecutor,
+                   paths: Iterator[str],
+                   max_queued: int) -> Generator[FileResult, None, bool]:
+    # Parse the paths with at most max_queued files queued in the pool,
+    # returning whether the pool broke before every path was parsed. Every
+    # file queued when the pool breaks is reported as failed, so each pool
+    # takes at least one path.
+    futures: Dict[concurrent.futures.Future, str] = {}
+    broken = False
+    while True:
+        room = 0 if broken else max_queued - len(futures)
+        for path in itertools.islice(paths, room):
+            try:
+                futures[pool.submit(_parse_in_worker, path)] = path
+            except BrokenProcessPool as e:
+                broken = True
+                yield path, None, _error_message(e)
+                break
+        if not futures:
+            return broken
+
+        done, _ = concurrent.futures.wait(
+            futures, return_when=concurrent.futures.FIRST_COMPLETED)
+        for future in done:
+            path = futures.pop(future)
+            try:
+                yield future.result()
+            except BrokenProcessPool as e:
+                broken = True
+                yield path, None, _error_message(e)
+
+
+def _init_worker(snapshot: bytes):
+    global _worker_parser, _worker_snapshot
+    _worker_snapshot = snapshot
+    _worker_parser = pickle.loads(snapshot)
+
+
+def _parse_in_worker(path: str) -> FileResult:
+    global _worker_parser
+    assert _worker_parser is not None
+    result = parse_file(_worker_parser, path)
+    if result[2] is not None:
+        _worker_parser = pickle.loads(_worker_snapshot)
+    return result
+
+
+def _error_message(error: Exception) -> str:
+    return f"{type(error).__name__}: {error}"
@@ -0,0 +1,261 @@
+"""
+An on-disk cache of parsed results, so that unchanged files do not have to be
+parsed again by an unchanged rule tree.
+"""
+import functools
+import hashlib
+import inspect
+import os
+import pickle
+import tempfile
+from typing import Any, Iterator, Optional, Tuple, Union
+
+import molextract
+from molextract import debug
+from molextract.rule import Rule
+
+CHUNK_SIZE = 1 << 20
+RESULTS_DIR = "results"
+STAT_DIR = "stat"
+
+# The types of public attributes that describe how a rule is configured, as
+# opposed to the data it has parsed
+_CONFIG_TYPES = (str, int, float, bool, type(None))
+
+
+class ResultCache:
+    """
+    A ResultCache stores the pickled output of parsing a file within a
+    directory. Results are keyed by a hash of the file's content together with
+    a fingerprint of the rule tree (see `rule_fingerprint`), so a result is
+    only reused if neither the file nor any rule changed. The cache is meant
+    to be used through a Parser:
+
+        cache = ResultCache("~/.cache/molextract")
+        parser = Parser(log_rule, cache=cache)
+        data = parser.feed_file("styrene.log")  # parsed and stored
+        data = parser.feed_file("styrene.log")  # loaded from the cache
+
+    To avoid reading a file just to hash it, the content hash of a file is
+    remembered against its path, size, modification time and inode, and only
+    recomputed once any of these change.
+
+    The total size of the directory is kept below `max_bytes` by evicting the
+    least recently used entries. The size is scanned once and then tracked
+    as entries are written, the directory is only scanned again once the
+    tracked size exceeds `max_bytes`. A cached result is equal to the parsed
+    one, with the same types (tuples, int keys, numpy arrays), and results
+    that can not be pickled are not cached. As unpickling can run arbitrary
+    code only use cache directories no one else can write to.
+
+    Several processes may share one cache directory, entries are written
+    atomically.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 1 << 30):
+        """
+        :param directory: the directory to store results in, it is created if
+            it does not exist
+        :param max_bytes: the maximum total size of the cache in bytes,
+            defaults to 1 GiB
+        """
+        self.directory = os.path.abspath(os.path.expanduser(directory))
+        self.max_bytes = max_bytes
+        # The total size of the entries, None until the directory is scanned
+        self._size: Optional[int] = None
+        os.makedirs(os.path.join(self.directory, RESULTS_DIR), exist_ok=True)
+        os.makedirs(os.path.join(self.directory, STAT_DIR), exist_ok=True)
+
+    def key(self, path: str, rule: Rule) -> str:
+        """
+        Compute the key of parsing the file at the given path with a rule
+
+        :param path: the path to the file
+        :param rule: the rule the file is parsed with
+        :return: the key
+        """
+        content_hash = self._content_hash(path)
+        return _sha256(f"{content_hash}\0{rule_fingerprint(rule)}")
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        """
+        Look up a result and mark it as recently used
+
+        :param key: the key of the result
+        :return: a tuple of whether the result was found and the result
+        """
+        path = self._result_path(key)
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return False, None
+
+        _touch(path)
+        return True, value
+
+    def put(self, key: str, value: Any):
+        """
+        Store a result, evicting the least recently used results if the cache
+        grows beyond `max_bytes`
+
+        :param key: the key of the result
+        :param value: the picklable result
+        """
+        try:
+            data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError, TypeError, AttributeError) as e:
+            debug.logger.warning("result can not be cached: %s", e)
+            return
+
+        _write_atomic(self._result_path(key), data)
+        self._grow(len(data))
+
+    def evict(self):
+        """
+        Delete the least recently used entries until the total size of the
+        cache is at most `max_bytes`
+        """
+        entries = []
+        total = 0
+        for entry in self._entries():
+            stat = entry.stat()
+            entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+            total += stat.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            _remove(path)
+            total -= size
+        self._size = total
+
+    def clear(self):
+        """
+        Delete every entry in the cache
+        """
+        for entry in self._entries():
+            _remove(entry.path)
+        self._size = 0
+
+    def _entries(self) -> Iterator[os.DirEntry]:
+        for sub_dir in [RESULTS_DIR, STAT_DIR]:
+            with os.scandir(os.path.join(self.directory, sub_dir)) as it:
+                for entry in it:
+                    # Skip files that are still being written
+                    if entry.is_file() and not entry.name.startswith("."):
+                        yield entry
+
+    def _grow(self, size: int):
+        # Account for a new entry, only scanning the directory once it may
+        # have grown beyond max_bytes. The tracked size can only overestimate
+        # the size of the entries this process wrote (e.g. replaced entries),
+        # and entries of other processes are counted by the next scan.
+        if self._size is None:
+            self.evict()
+        else:
+            self._size += size
+            if self._size > self.max_bytes:
+                self.evict()
+
+    def _result_path(self, key: str) -> str:
+        return os.path.join(self.directory, RESULTS_DIR, f"{key}.pickle")
+
+    def _content_hash(self, path: str) -> str:
+        stat = os.stat(path)
+        stat_key = _sha256(f"{os.path.realpath(path)}\0{stat.st_size}\0"
+                           f"{stat.st_mtime_ns}\0{stat.st_ino}")
+        stat_path = os.path.join(self.directory, STAT_DIR, stat_key)
+        try:
+            with open(stat_path, "r") as f:
+                content_hash = f.read()
+            _touch(stat_path)
+            return content_hash
+        except OSError:
+            pass
+
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                sha.update(chunk)
+
+        content_hash = sha.hexdigest()
+        _write_atomic(stat_path, content_hash)
+        self._grow(len(content_hash))
+        return content_hash
+
+
+def rule_fingerprint(rule: Rule) -> str:
+    """
+    Compute a fingerprint of a rule tree that changes whenever the rules in
+    the tree, their configuration or their source code change. Child rules
+    are found through the `rules` attribute of a rule (see `RuleListRule`).
+
+    :param rule: the root of the rule tree
+    :return: the fingerprint
+    """
+    sha = hashlib.sha256(molextract.__version__.encode())
+    _update_fingerprint(sha, rule)
+    return sha.hexdigest()
+
+
+def _update_fingerprint(sha: Any, rule: Rule):
+    for cls in type(rule).__mro__[:-1]:
+        sha.update(_class_digest(cls))
+
+    for name, value in sorted(vars(rule).items()):
+        if not name.startswith("_") and isinstance(value, _CONFIG_TYPES):
+            sha.update(f"{name}={value!r}".encode())
+    sha.update(rule._start_tag.pattern.encode())
+    sha.update(rule._end_tag.pattern.encode())
+    sha.update(str(rule._check_only_beginning).encode())
+
+    children = getattr(rule, "rules", None)
+    if children is not None:
+        sha.update(f"rules={len(children)}".encode())
+        for child in children:
+            _update_fingerprint(sha, child)
+
+
+@functools.lru_cache(maxsize=None)
+def _class_digest(cls: type) -> bytes:
+    # Finding the source of a class is far slower than parsing a small log,
+    # so it is only done once per class and process
+    sha = hashlib.sha256(f"{cls.__module__}.{cls.__qualname__}".encode())
+    try:
+        sha.update(inspect.getsource(cls).encode())
+    except (OSError, TypeError):
+        # The source is not available, e.g. classes defined interactively
+        pass
+    return sha.digest()
+
+
+def _sha256(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def _touch(path: str):
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        # Already evicted by another process sharing the cache
+        pass
+
+
+def _write_atomic(path: str, data: Union[str, bytes]):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".")
+    try:
+        with os.fdopen(fd, "wb" if isinstance(data, bytes) else "w") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        _remove(tmp_path)
+        raise
@@ -1,9 +1,11 @@
 """
 Utility functions to debug / log what is happening within in a Rule
 """
+import functools
 import os
 import sys
 import logging
+from typing import Tuple
 
 LOG_NAME_TO_LEVEL = {
     'CRITICAL': logging.CRITICAL,
@@ -56,15 +58,37 @@ class Color(metaclass=ColorType):
     pass
 
 
+_EXECUTED = "executed".ljust(VERB_LEFT_JUST)
+_ENDED = "ended".ljust(VERB_LEFT_JUST)
+
+
+def is_enabled() -> bool:
+    """
+    Whether debug messages are emitted. Messages are only formatted when
+    this is True, so tracing costs nothing at higher log levels.
+    """
+    return logger.isEnabledFor(logging.DEBUG)
+
+
+@functools.lru_cache(maxsize=None)
+def _tag_colors() -> Tuple[str, str, str]:
+    # Resolved once, the first time a message is actually emitted
+    return Color.GREEN, Color.RED, Color.RESET
+
+
 def log_start_tag(start_tag: str, rule_id: str):
-    verb = "executed".ljust(VERB_LEFT_JUST)
+    if not is_enabled():
+        return
+
+    green, _, reset = _tag_colors()
     start_tag = start_tag.ljust(TAG_LEFT_JUST)
-    msg = f'{start_tag} {Color.GREEN}{verb}{Color.RESET} {rule_id}'
-    logger.debug(msg)
+    logger.debug(f'{start_tag} {green}{_EXECUTED}{reset} {rule_id}')
 
 
 def log_end_tag(end_tag: str, rule_id: str):
-    verb = "ended".ljust(VERB_LEFT_JUST)
+    if not is_enabled():
+        return
+
+    _, red, reset = _tag_colors()
     end_tag = end_tag.ljust(TAG_LEFT_JUST)
-    msg = f'{end_tag} {Color.RED}{verb}{Color.RESET} {rule_id}'
-    logger.debug(msg)
+    logger.debug(f'{end_tag} {red}{_ENDED}{reset} {rule_id}')
@@ -0,0 +1,158 @@
+"""
+An index of the byte offsets of every module within a Molcas log, so that
+individual modules can be parsed without scanning the whole log.
+"""
+import json
+import mmap
+import os
+import re
+from typing import Dict, List, NamedTuple, Optional
+
+MODULE_MARKER = re.compile(rb"^--- (Start|Stop) Module: (\S+)", re.MULTILINE)
+SIDECAR_SUFFIX = ".mxidx"
+
+
+class ModuleSection(NamedTuple):
+    """
+    The location of a single module within a log file
+    """
+    # The name of the module, e.g. "rasscf"
+    name: str
+    # The byte offset of the "--- Start Module" line
+    start: int
+    # The byte offset just past the "--- Stop Module" line, None if the
+    # module never stopped (e.g. the job is still running or crashed)
+    stop: Optional[int]
+
+
+class ModuleIndex:
+    """
+    A ModuleIndex records where every "--- Start Module: <name>" /
+    "--- Stop Module: <name>" pair of a Molcas log lies. Building an index
+    is a single regex scan over a memory map of the file, which is far faster
+    than running rules over every line, and the index can be stored next to
+    the log as a sidecar file so it is only built once:
+
+        index = ModuleIndex.for_file("styrene.log")
+        index.find("rasscf")  # [ModuleSection("rasscf", 41513, 297318)]
+
+    See `Parser.feed_indexed` to parse only the indexed modules of a log.
+    """
+
+    def __init__(self,
+                 sections: List[ModuleSection],
+                 size: int = 0,
+                 mtime_ns: int = 0):
+        """
+        :param sections: every module section, in the order they appear
+        :param size: the size in bytes of the indexed file
+        :param mtime_ns: the modification time of the indexed file
+        """
+        self.sections = sections
+        self.size = size
+        self.mtime_ns = mtime_ns
+
+    @classmethod
+    def build(cls, path: str) -> 'ModuleIndex':
+        """
+        Scan the file at the given path for module markers
+
+        :param path: the path to the log file
+        :return: the index
+        """
+        stat = os.stat(path)
+        sections: List[ModuleSection] = []
+        if stat.st_size == 0:
+            return cls(sections, stat.st_size, stat.st_mtime_ns)
+
+        open_sections: Dict[str, int] = {}
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(),
+                                              0,
+                                              access=mmap.ACCESS_READ) as mm:
+            for match in MODULE_MARKER.finditer(mm):
+                kind = match.group(1)
+                name = match.group(2).decode()
+                if kind == b"Start":
+                    open_sections[name] = len(sections)
+                    sections.append(ModuleSection(name, match.start(), None))
+                elif name in open_sections:
+                    end = mm.find(b"\n", match.end())
+                    stop = stat.st_size if end == -1 else end + 1
+                    i = open_sections.pop(name)
+                    sections[i] = sections[i]._replace(stop=stop)
+
+        return cls(sections, stat.st_size, stat.st_mtime_ns)
+
+    @classmethod
+    def for_file(cls, path: str, sidecar: bool = True) -> 'ModuleIndex':
+        """
+        Get the index of a file, loading it from the sidecar file next to it
+        if that is up to date, otherwise building it (and saving the
+        sidecar file)
+
+        :param path: the path to the log file
+        :param sidecar: whether to use a sidecar file, defaults to True
+        :return: the index
+        """
+        sidecar_path = path + SIDECAR_SUFFIX
+        if sidecar:
+            try:
+                index = cls.load(sidecar_path)
+            except (OSError, ValueError, KeyError, TypeError):
+                pass
+            else:
+                if index.is_valid_for(path):
+                    return index
+
+        index = cls.build(path)
+        if sidecar:
+            try:
+                index.save(sidecar_path)
+            except OSError:
+                # e.g. a read only archive, the index is still usable
+                pass
+        return index
+
+    def is_valid_for(self, path: str) -> bool:
+        """
+        Whether this index is up to date with the file at the given path
+
+        :param path: the path to the log file
+        """
+        stat = os.stat(path)
+        return (stat.st_size, stat.st_mtime_ns) == (self.size, self.mtime_ns)
+
+    def find(self, name: str) -> List[ModuleSection]:
+        """
+        :param name: the name of the module
+        :return: every section of the given module, in file order
+        """
+        return [section for section in self.sections if section.name == name]
+
+    def save(self, path: str):
+        """
+        Save this index as JSON
+
+        :param path: the path to save the index to
+        """
+        data = {
+            "size": self.size,
+            "mtime_ns": self.mtime_ns,
+            "sections": [list(section) for section in self.sections],
+        }
+        with open(path, 'w') as f:
+            json.dump(data, f)
+
+    @classmethod
+    def load(cls, path: str) -> 'ModuleIndex':
+        """
+        Load an index saved with `save`
+
+        :param path: the path the index was saved to
+        :return: the index
+        """
+        with open(path, 'r') as f:
+            data = json.load(f)
+
+        sections = [ModuleSection(*section) for section in data["sections"]]
+        return cls(sections, data["size"], data["mtime_ns"])
@@ -0,0 +1,161 @@
+"""
+Run several independent Parsers over a single read of the same input
+"""
+import concurrent.futures
+import itertools
+import queue
+import threading
+from typing import Any, Dict, Iterator, List, TextIO
+
+from molextract import source
+from molextract.parser import Parser, _open_lines
+
+
+class MultiParser:
+    """
+    A MultiParser evaluates several Parsers, each with its own top-level rule
+    (e.g. a LogRule of RASSCF energies, another of MC-PDFT energies and
+    another of `MolProps`), over one pass of the input, so N extractions
+    read and split the input into lines once instead of N times
+
+        multi = MultiParser({
+            "rasscf": Parser(log.LogRule([rasscf.RASSCFModule()])),
+            "mcpdft": Parser(log.LogRule([mcpdft.MCPDFTModule()])),
+        })
+        out = multi.feed_file("cas.log")
+        out["rasscf"], out["mcpdft"]
+
+    The lines are read in chunks of `chunk_lines` lines, and every chunk is
+    handed to each parser through a queue of at most `max_chunks` chunks.
+    Each parser runs in a thread of its own, so parsers consume the chunks
+    at their own pace while the memory held is bounded by the slowest one.
+    Once a parser has parsed its first match (as `Parser.feed` does) it
+    takes no more chunks, and once every parser is done no more of the input
+    is read.
+
+    Rules run as they would with the Parser on its own, except that they
+    never see a `source.MmapLines` and so never search it as a whole. The
+    sinks of the parsers (see `Parser`) are called from their threads.
+    """
+
+    def __init__(self,
+                 parsers: Dict[str, Parser],
+                 chunk_lines: int = 4096,
+                 max_chunks: int = 8):
+        """
+        :param parsers: the parsers to run, by name
+        :param chunk_lines: the number of lines handed to the parsers at a
+            time, defaults to 4096
+        :param max_chunks: the number of chunks a parser may lag behind the
+            reading of the input, defaults to 8
+        :raises ValueError: if there are no parsers, a rule is shared by
+            several parsers, or only some of the parsers are in bytes mode
+        """
+        if not parsers:
+            raise ValueError("no parsers to run")
+        rules = {id(parser.rule) for parser in parsers.values()}
+        if len(rules) != len(parsers):
+            raise ValueError("every parser must have a rule of its own, see "
+                             "Parser.clone")
+        if len({parser.binary for parser in parsers.values()}) != 1:
+            raise ValueError("either all or none of the parsers must be in "
+                             "bytes mode")
+
+        self.parsers = parsers
+        self.binary = next(iter(parsers.values())).binary
+        self.chunk_lines = chunk_lines
+        self.max_chunks = max_chunks
+
+    def feed(self, data: str, delim: str = '\n') -> Dict[str, Any]:
+        """
+        Execute every parser with the given data
+
+        :param data: the raw data to parse
+        :param delim: how the raw data should be delimited, defaults to '\n'
+        :return: the parsed data of each parser, by name
+        """
+        return self._feed_lines(iter(data.split(delim)))
+
+    def feed_stream(self, stream: TextIO) -> Dict[str, Any]:
+        """
+        Execute every parser with lines lazily read from the given text
+        stream
+
+        :param stream: the open text stream to parse
+        :return: the parsed data of each parser, by name
+        """
+        return self._feed_lines(source.iter_stream_lines(stream))
+
+    def feed_file(self, path: str, use_mmap: bool = False) -> Dict[str, Any]:
+        """
+        Execute every parser with lines lazily read from the file at the
+        given path. The caches of the parsers are not used.
+
+        :param path: the path to the file to parse, which may be compressed
+            (see `source.open_text`), or '-' to read from stdin
+        :param use_mmap: whether the file should be read through a memory map
+            (see `source.MmapLines`) instead of buffered reads, defaults to
+            False
+        :return: the parsed data of each parser, by name
+        """
+        with _open_lines(path, use_mmap, self.binary) as lines:
+            return self._feed_lines(lines)
+
+    def _feed_lines(self, lines: Iterator[Any]) -> Dict[str, Any]:
+        names = list(self.parsers)
+        queues: List[queue.Queue] = [
+            queue.Queue(self.max_chunks) for _ in names
+        ]
+        done = [threading.Event() for _ in names]
+
+        def run(i: int, parser: Parser) -> Any:
+            try:
+                return parser._feed_lines(_iter_chunks(queues[i]), self.binary)
+            finally:
+                # Free any chunk the reader may be waiting to put, it will
+                # not put any more once it sees this parser is done
+                done[i].set()
+                _drain(queues[i])
+
+        with concurrent.futures.ThreadPoolExecutor(len(names)) as executor:
+            futures = [
+                executor.submit(run, i, self.parsers[name])
+                for i, name in enumerate(names)
+            ]
+            try:
+                while True:
+                    pending = [
+                        q for q, event in zip(queues, done)
+                        if not event.is_set()
+                    ]
+                    if not pending:
+                        break
+                    chunk = list(itertools.islice(lines, self.chunk_lines))
+                    if not chunk:
+                        break
+                    for q in pending:
+                        q.put(chunk)
+            finally:
+                for q, event in zip(queues, done):
+                    if not event.is_set():
+                        q.put(None)
+
+        return {name: future.result() for name, future in zip(names, futures)}
+
+
+def _iter_chunks(chunks: queue.Queue) -> Iterator[Any]:
+    # The lines of every chunk in the queue, up to the None marking the end
+    # of the input
+    while True:
+        chunk = chunks.get()
+        if chunk is None:
+            return
+        yield from chunk
+
+
+def _drain(chunks: queue.Queue):
+    while True:
+        try:
+            chunks.get_nowait()
+        except queue.Empty:
+            return
@@ -0,0 +1,65 @@
+"""
+Write parsed output as JSON, either indented, compact or as newline delimited
+JSON (NDJSON) records.
+"""
+import json
+from typing import Any, TextIO
+
+try:
+    import orjson  # type: ignore
+except ImportError:
+    orjson = None  # type: ignore
+
+FORMATS = ("json", "compact", "ndjson")
+
+
+def to_json(obj: Any) -> Any:
+    """
+    Convert objects the JSON encoders do not know to JSON types, i.e. NumPy
+    arrays and scalars (see the `as_array` rules) to lists and numbers
+
+    :param obj: the object to convert
+    :return: the converted object
+    :raises TypeError: if the object can not be converted
+    """
+    if hasattr(obj, "tolist"):
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON "
+                    "serializable")
+
+
+def dumps(obj: Any) -> str:
+    """
+    Serialize the given object to compact JSON on a single line. If `orjson`
+    is installed it is used to encode the object, which is much faster for
+    float heavy output.
+
+    :param obj: the object to serialize
+    :return: the JSON string
+    """
+    if orjson is not None:
+        options = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        return orjson.dumps(obj, default=to_json, option=options).decode()
+    return json.dumps(obj, separators=(",", ":"), default=to_json)
+
+
+def dump(obj: Any, stream: TextIO, fmt: str = "json"):
+    """
+    Write the given object to a stream as JSON followed by a newline. The
+    "json" format is indented and written a piece at a time as it is encoded,
+    so the whole document is never held in memory as a string. The "compact"
+    and "ndjson" formats are written on a single line (see `dumps`).
+
+    :param obj: the object to write
+    :param stream: the text stream to write to
+    :param fmt: one of `FORMATS`, defaults to "json"
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"unknown format '{fmt}'")
+
+    if fmt == "json":
+        json.dump(obj, stream, indent=4, default=to_json)
+        stream.write("\n")
+    else:
+        stream.write(dumps(obj) + "\n")
+    stream.flush()
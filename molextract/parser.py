@@ -1,31 +1,182 @@
 import argparse
+import atexit
 from argparse import RawTextHelpFormatter
+import contextlib
+import copy
+import functools
 import json
+import sys
 
-from typing import Any, Optional, List
+from typing import (Any, Callable, Generator, Iterator, Optional, List, TextIO,
+                    Tuple)
 from molextract import Rule
+from molextract import batch
+from molextract import debug
+from molextract import output
+from molextract import profiling
+from molextract import source
+from molextract.cache import ResultCache
+from molextract.index import ModuleIndex
+from molextract.rules.abstract import RuleListRule
+from molextract.rules.molcas.log import ModuleRule
 
 DESCRIPTION_TMPL = """\
 Parse files using the %s rule. The output of the rule is dumped as JSON.
+
+When more than one file is given (or --file-list is used) each file is output
+as soon as it is parsed as one JSON object per line, either
+{"file": <path>, "data": <output>} or {"file": <path>, "error": <message>}
+if the file could not be parsed.
 """
 
+# The profilers of the Parsers profiled through MOLEXTRACT_PROFILE, reported
+# by a single exit handler
+_exit_profilers: List[profiling.Profiler] = []
+
 
 class Parser:
     """
     A basic Parser to easily interface with any Rule. A Parser is defined by a
     single Rule (to have complex behavior you must nest Rules). This class
-    provides a method to parse incoming string data via the `feed` method, and
-    also a command line interface method `cli` to parse data from a file.
+    provides a method to parse incoming string data via the `feed` method,
+    methods to lazily parse streams / files via `feed_stream` and `feed_file`,
+    and also a command line interface method `cli` to parse data from a file.
+
+    The `feed` methods return the output of the first match of the rule. Data
+    that holds several matches (e.g. multiple concatenated Molcas runs) can be
+    parsed in a single pass with the `iter_feed` methods, which yield the
+    output of every match as soon as it is parsed.
+
+    A Parser (through its rule) holds parsing state, so one Parser should not
+    be used from several threads at once. Create the Parser with
+    `from_factory` and use `clone` to get an independent Parser per thread. A
+    Parser created from a factory is also pickled as just its factory, so it
+    is cheap to send to worker processes, each of which builds fresh rules.
+
+    Given a `cache.ResultCache`, `feed_file` returns the stored output for
+    files that were already parsed by the same rule tree.
+
+    With `binary` set, files are parsed in bytes mode (see
+    `Rule.set_raw_iter`), where lines are only decoded when a rule reads them.
+
+    Given `fields`, only the rules producing those fields of the output are
+    run, and the sections of all other rules are skipped (see `select`).
+
+    Given a `sink`, rules that parse many records per section stream them to
+    the sink as they are parsed instead of keeping them for the output (see
+    `Rule.set_sink`), so memory use stays bounded however large a section is
+
+        def write_row(rule_id, record):
+            writer.writerow(record)
+
+        Parser(log_rule, sink=write_row).feed_file("big_cas.log")
+
+    With `profile` set, the work done by every rule is recorded by a
+    `profiling.Profiler`, available as `profiler`.
     """
 
-    def __init__(self, rule: Rule):
+    def __init__(self,
+                 rule: Rule,
+                 cache: Optional[ResultCache] = None,
+                 binary: bool = False,
+                 fields: Optional[List[str]] = None,
+                 sink: Optional[Callable[[str, Any], None]] = None,
+                 profile: Optional[bool] = None):
         """
         Initialize the parser with the single rule that defines how parsing
         should be done
 
         :param rule: the rule
+        :param cache: the cache used to store the output of `feed_file`,
+            defaults to None which disables caching
+        :param binary: whether files read by `feed_file` and `iter_feed_file`
+            are parsed in bytes mode, defaults to False
+        :param fields: the fields of the output to parse, defaults to None
+            which parses all of them
+        :param sink: the callback records are streamed to, called with the
+            rule_id of the rule that parsed each record and the record,
+            defaults to None which keeps records in the output
+        :param profile: whether to profile the rules, defaults to None which
+            profiles if the MOLEXTRACT_PROFILE environment variable is set, in
+            which case a report is written to stderr when the program exits
         """
         self.rule = rule
+        self.cache = cache
+        self.binary = binary
+        self.fields: Optional[List[str]] = None
+        self.sink = sink
+        self.profiler: Optional[profiling.Profiler] = None
+        if profile or (profile is None and profiling.MOLEXTRACT_PROFILE):
+            self.profiler = profiling.Profiler()
+        if profile is None and self.profiler is not None:
+            _report_at_exit_once(self.profiler)
+        self.factory: Optional[Callable[[], Rule]] = None
+        if fields is not None:
+            self.select(fields)
+        if sink is not None:
+            rule.set_sink(sink)
+
+    @classmethod
+    def from_factory(cls, factory: Callable[[], Rule], **kwargs) -> 'Parser':
+        """
+        Initialize a parser with a rule built by the given factory, such as a
+        Rule class or a `spec.RuleSpec`. The factory is kept so that fresh
+        rules can be built for copies of this parser, so it should be
+        picklable if the parser is to be sent to other processes.
+
+        :param factory: a callable that takes no arguments and returns a new
+            rule each time it is called
+        :param kwargs: any other arguments to initialize the parser with
+        :return: the parser
+        """
+        parser = cls(factory(), **kwargs)
+        parser.factory = factory
+        return parser
+
+    def clone(self) -> 'Parser':
+        """
+        Create an independent copy of this parser that does not share any
+        parsing state with this one. Parsers created with `from_factory` build
+        a fresh rule from the factory, others are deep copied.
+
+        :return: the copy
+        """
+        if self.factory is not None:
+            return type(self).from_factory(self.factory, **self._options())
+        return copy.deepcopy(self)
+
+    def _options(self):
+        return {
+            "cache": self.cache,
+            "binary": self.binary,
+            "fields": self.fields,
+            "sink": self.sink,
+            "profile": self.profiler is not None
+        }
+
+    def select(self, fields: Optional[List[str]]):
+        """
+        Only parse the given fields of the output, e.g.
+        "rasscf.data.total_energy" for a `LogRule`. Rules whose output is not
+        needed are disabled, and their sections are skipped without being
+        parsed (see `RuleListRule.select`).
+
+        :param fields: the fields to parse, None parses all of them
+        :raises TypeError: if the rule is not a RuleListRule
+        :raises ValueError: if a field is unknown
+        """
+        if not isinstance(self.rule, RuleListRule):
+            raise TypeError("only the output of a RuleListRule can be "
+                            "selected")
+        self.rule.select(fields)
+        self.fields = fields
+
+    def __reduce_ex__(self, protocol):
+        if self.factory is not None:
+            from_factory = functools.partial(
+                type(self).from_factory, **self._options())
+            return from_factory, (self.factory,)
+        return super().__reduce_ex__(protocol)
 
     def feed(self, data: str, delim: str = '\n') -> Any:
         """
@@ -35,21 +186,229 @@ class Parser:
         :param delim: how the raw data should be delimited, defaults to '\n'
         :return: the parsed data
         """
-        split = data.split(delim)
-        split_iter = iter(split)
-        self.rule.set_iter(split_iter)
+        return self._feed_lines(iter(data.split(delim)))
+
+    def feed_stream(self, stream: TextIO) -> Any:
+        """
+        Execute the rule with lines lazily read from the given text stream, and
+        return the parsed output. Lines are read one at a time, so the stream
+        is never read into memory as a whole.
+
+        :param stream: the open text stream to parse
+        :return: the parsed data
+        """
+        return self._feed_lines(source.iter_stream_lines(stream))
+
+    def feed_file(self, path: str, use_mmap: bool = False) -> Any:
+        """
+        Execute the rule with lines lazily read from the file at the given
+        path, and return the parsed output.
+
+        :param path: the path to the file to parse, which may be compressed
+            (see `source.open_text`), or '-' to read from stdin
+        :param use_mmap: whether the file should be read through a memory map
+            (see `source.MmapLines`) instead of buffered reads, defaults to
+            False. Compressed files and stdin are always streamed.
+        :return: the parsed data
+        """
+        # Streamed records are not part of the output, so can not be cached
+        cache = self.cache if self.sink is None else None
+        if cache is None or path == source.STDIN_PATH:
+            with _open_lines(path, use_mmap, self.binary) as lines:
+                return self._feed_lines(lines, self.binary)
+
+        key = cache.key(path, self.rule)
+        found, parsed = cache.get(key)
+        if not found:
+            with _open_lines(path, use_mmap, self.binary) as lines:
+                parsed = self._feed_lines(lines, self.binary)
+            cache.put(key, parsed)
+
+        return parsed
+
+    def feed_indexed(self,
+                     path: str,
+                     index: Optional[ModuleIndex] = None,
+                     occurrence: Optional[int] = None) -> Any:
+        """
+        Execute the rule over only the modules it parses, seeking straight to
+        each module with a `index.ModuleIndex` instead of scanning the whole
+        file, and return the parsed output.
+
+        The rule must be either a `ModuleRule`, or a RuleListRule (e.g. a
+        `LogRule`) whose rules are all ModuleRules. A ModuleRule is executed
+        on a single section of its module, the first one by default (as with
+        `feed_file`). For a RuleListRule each of its rules is executed on
+        every section of its module (or only the chosen occurrence) in file
+        order, then the RuleListRule is reset as usual. Note this covers
+        every run of Molcas in the file, not only the first.
+
+        The rules run as with `feed_file`: in bytes mode if `binary` is set,
+        under the profiler if any, and through the RuleListRule (see
+        `RuleListRule.process_section`), so its `section_sink` and adaptive
+        counting apply.
+
+        :param path: the path to the Molcas log to parse
+        :param index: the index of the file, defaults to None which loads /
+            builds it via `ModuleIndex.for_file`
+        :param occurrence: which section of each module to parse, negative
+            values count from the last section, defaults to None
+        :return: the parsed data, or None if there is no matching module
+        """
+        if index is None:
+            index = ModuleIndex.for_file(path)
 
-        for line in split_iter:
+        encoding = None if self.binary else 'utf-8'
+        if isinstance(self.rule, ModuleRule):
+            sections = index.find(self.rule.name)
+            try:
+                section = sections[occurrence or 0]
+            except IndexError:
+                return None
+            with source.MmapLines(path, encoding) as lines:
+                lines.seek(section.start)
+                return self._feed_lines(lines, self.binary)
+
+        if not isinstance(self.rule, RuleListRule) or not all(
+                isinstance(rule, ModuleRule) for rule in self.rule.rules):
+            raise ValueError("feed_indexed requires a ModuleRule or a "
+                             "RuleListRule of ModuleRules")
+
+        # The start of every section to parse and its rule, in file order
+        starts: List[Tuple[int, Rule]] = []
+        for rule in self.rule.rules:
+            sections = index.find(rule.name)
+            if occurrence is not None:
+                sections = sections[occurrence:][:1]
+            starts.extend((section.start, rule) for section in sections)
+        starts.sort(key=lambda start: start[0])
+
+        run = functools.partial(self._iter_sections, starts)
+        with source.MmapLines(path, encoding) as lines:
+            return self._feed_lines(lines, self.binary, run)
+
+    def iter_feed(self, data: str, delim: str = '\n') -> Iterator[Any]:
+        """
+        Execute the rule every time its start_tag matches in the given data,
+        yielding the parsed output of each match in order.
+
+        :param data: the raw data to parse
+        :param delim: how the raw data should be delimited, defaults to '\n'
+        :return: an iterator over the parsed output of every match
+        """
+        return self._iter_lines(iter(data.split(delim)))
+
+    def iter_feed_stream(self, stream: TextIO) -> Iterator[Any]:
+        """
+        Execute the rule every time its start_tag matches in lines lazily read
+        from the given text stream, yielding the parsed output of each match
+        as soon as it is parsed.
+
+        :param stream: the open text stream to parse
+        :return: an iterator over the parsed output of every match
+        """
+        return self._iter_lines(source.iter_stream_lines(stream))
+
+    def iter_feed_file(self,
+                       path: str,
+                       use_mmap: bool = False) -> Iterator[Any]:
+        """
+        Execute the rule every time its start_tag matches in lines lazily read
+        from the file at the given path, yielding the parsed output of each
+        match as soon as it is parsed. The file is closed once the iterator is
+        exhausted or closed.
+
+        :param path: the path to the file to parse
+        :param use_mmap: whether the file should be read through a memory map
+            (see `source.MmapLines`) instead of buffered reads, defaults to
+            False
+        :return: an iterator over the parsed output of every match
+        """
+        with _open_lines(path, use_mmap, self.binary) as lines:
+            yield from self._iter_lines(lines, self.binary)
+
+    def _feed_lines(self,
+                    lines: Iterator[Any],
+                    binary: bool = False,
+                    run: Optional[Callable] = None) -> Any:
+        outputs = self._iter_lines(lines, binary, run)
+        try:
+            return next(outputs, None)
+        finally:
+            # Detach the profiler (if any) from the rules right away
+            outputs.close()
+
+    def _iter_lines(
+            self,
+            lines: Iterator[Any],
+            binary: bool = False,
+            run: Optional[Callable] = None) -> Generator[Any, None, None]:
+        # Run the rule over the lines, by default each time its start_tag
+        # matches (see `_iter_rule`)
+        if run is None:
+            run = self._iter_rule
+        if self.profiler is None:
+            yield from run(lines, binary)
+            return
+
+        with self.profiler.attach(self.rule):
+            lines = self.profiler.count_lines(lines)
+            yield from run(lines, binary)
+
+    def _iter_sections(self, starts: List[Tuple[int, Rule]], lines: Any,
+                       binary: bool) -> Iterator[Any]:
+        # Run the rules of the top-level RuleListRule over the sections
+        # starting at the given offsets of a `source.MmapLines`
+        rule = self.rule
+        assert isinstance(rule, RuleListRule)
+        if binary:
+            rule.set_raw_iter(lines)
+        else:
+            rule.set_iter(lines)
+        for start, section_rule in starts:
+            lines.seek(start)
+            start_line = next(lines)
+            if binary:
+                start_line = start_line.decode()
+            if section_rule.start_tag_matches(start_line):
+                rule.process_section(section_rule, start_line)
+        yield rule.reset()
+
+    def _iter_rule(self,
+                   lines: Iterator[Any],
+                   binary: bool = False) -> Iterator[Any]:
+        if binary:
+            yield from self._iter_raw_lines(lines)
+            return
+
+        self.rule.set_iter(lines)
+
+        for line in lines:
             if self.rule.start_tag_matches(line):
                 self.rule.process_lines(line)
-                return self.rule.reset()
+                yield self.rule.reset()
+
+    def _iter_raw_lines(self, lines: Iterator[bytes]) -> Iterator[Any]:
+        self.rule.set_raw_iter(lines)
+        start_filter = self.rule.raw_tag_filters()[0]
+
+        for raw_line in lines:
+            if start_filter(raw_line):
+                line = raw_line.decode()
+                if self.rule.start_tag_matches(line):
+                    self.rule.process_lines(line)
+                    yield self.rule.reset()
 
     def cli(self, args: Optional[List[str]] = None):
         """
         A convenience method to run a command line interface version fo this
-        parser. This will read in a file as a string and pass it into the
-        `feed` method and finally print a JSON dumped version of the output
-        of `feed`.
+        parser. This will lazily read in a file via the `feed_file` method and
+        finally print a JSON dumped version of the output of `feed_file`.
+
+        Many files (or glob patterns) may be given at once, in which case they
+        are parsed by a pool of `--jobs` worker processes (see
+        `batch.parse_files`) and the output of each file is printed as soon as
+        it is parsed. A file that fails to parse does not stop the others.
 
         :param args: the command line arguments, defaults to None. If None
             arguments will be pulled from the command line
@@ -57,12 +416,161 @@ class Parser:
         description = DESCRIPTION_TMPL % type(self.rule).__name__
         parser = argparse.ArgumentParser(description=description,
                                          formatter_class=RawTextHelpFormatter)
-        parser.add_argument("file",
-                            help="the path to the file containing the data")
+        parser.add_argument("files",
+                            nargs="*",
+                            metavar="file",
+                            help="the path to the file containing the data, "
+                            "or a glob pattern of such paths")
+        parser.add_argument("--file-list",
+                            help="the path to a file listing the paths of "
+                            "files to parse, one per line")
+        parser.add_argument("-j",
+                            "--jobs",
+                            type=int,
+                            default=1,
+                            help="the number of worker processes used to "
+                            "parse files, 0 uses one per CPU, defaults to 1")
+        parser.add_argument("--cache-dir",
+                            help="a directory to cache parsed output in, "
+                            "files that have not changed since they were "
+                            "cached are not parsed again")
+        parser.add_argument("--bytes",
+                            action="store_true",
+                            help="parse files in bytes mode, only decoding "
+                            "the lines rules read (the files must be ASCII "
+                            "compatible)")
+        parser.add_argument("--select",
+                            action="append",
+                            metavar="FIELDS",
+                            help="only parse the given comma separated fields "
+                            "of the output, e.g. rasscf.data.total_energy, "
+                            "may be given more than once")
+        parser.add_argument("--format",
+                            choices=output.FORMATS,
+                            default="json",
+                            help="the output format: indented JSON, compact "
+                            "JSON, or NDJSON which writes the output of each "
+                            "section (e.g. each module) as its own line as "
+                            "soon as it is parsed, defaults to json")
+        parser.add_argument("--profile",
+                            nargs="?",
+                            const="text",
+                            choices=profiling.REPORT_FORMATS,
+                            help="write a report of the work done by every "
+                            "rule to stderr once parsing is done, as a table "
+                            "(the default) or as JSON. Files are then parsed "
+                            "in this process.")
         parsed_args = parser.parse_args(args)
 
-        with open(parsed_args.file, "r") as f:
-            data = f.read()
+        if parsed_args.cache_dir is not None:
+            self.cache = ResultCache(parsed_args.cache_dir)
+        if parsed_args.bytes:
+            self.binary = True
+        if parsed_args.select is not None:
+            fields = ",".join(parsed_args.select).split(",")
+            try:
+                self.select([field for field in fields if field])
+            except (TypeError, ValueError) as e:
+                parser.error(str(e))
+
+        if parsed_args.profile is not None and self.profiler is None:
+            self.profiler = profiling.Profiler()
+
+        paths = batch.expand_paths(parsed_args.files, parsed_args.file_list)
+        if not paths:
+            parser.error("no files to parse")
+
+        try:
+            self._run_cli(parsed_args, paths)
+        finally:
+            if parsed_args.profile is not None:
+                assert self.profiler is not None
+                self.profiler.dump(sys.stderr, parsed_args.profile)
+
+    def _run_cli(self, parsed_args: argparse.Namespace, paths: List[str]):
+
+        fmt = parsed_args.format
+        single_file = len(paths) == 1 and paths == parsed_args.files
+        if single_file and parsed_args.file_list is None:
+            rule = self.rule
+            if (fmt == "ndjson" and isinstance(rule, RuleListRule) and
+                    _has_section_records(rule)):
+                self._stream_sections(rule, paths[0])
+            else:
+                output.dump(self.feed_file(paths[0]), sys.stdout, fmt)
+            return
+
+        # With many files each file is already a single line
+        fmt = "json" if fmt == "json" else "ndjson"
+        if self.profiler is not None:
+            # Parse in this process, so the profile covers every file
+            results: Iterator[batch.FileResult] = (
+                batch.parse_file(self, path) for path in paths)
+        else:
+            results = batch.parse_files(self, paths, parsed_args.jobs)
+        for path, data, error in results:
+            if error is None:
+                record = {"file": path, "data": data}
+            else:
+                debug.logger.error(f"{path}: {error}")
+                record = {"file": path, "error": error}
+            if fmt == "json":
+                print(json.dumps(record, default=output.to_json), flush=True)
+            else:
+                output.dump(record, sys.stdout, fmt)
+
+    def _stream_sections(self, rule: RuleListRule, path: str):
+        # Write the output of every section of the top-level rule as an
+        # NDJSON record as soon as it is parsed, the output of the sections
+        # is not kept so neither returned nor cached
+        def write(rule_id, data):
+            output.dump({"rule": rule_id, "data": data}, sys.stdout, "ndjson")
+
+        rule.section_sink = write
+        try:
+            with _open_lines(path, False, self.binary) as lines:
+                self._feed_lines(lines, self.binary)
+        finally:
+            rule.section_sink = None
+
+
+def _has_section_records(rule: RuleListRule) -> bool:
+    # Whether the output of the rule is nothing but the output of each of
+    # its rules (e.g. the modules of a LogRule), each a complete record. A
+    # rule that combines the output of its rules (e.g. RASSCFModule) is
+    # output as a whole.
+    return ("reset" not in vars(rule) and
+            type(rule).reset is RuleListRule.reset)
+
+
+def _report_at_exit_once(profiler: profiling.Profiler):
+    # Only register the exit handler once per process, however many Parsers
+    # (clones, copies unpickled by workers, ...) are created
+    if not _exit_profilers:
+        atexit.register(_report_profilers)
+    _exit_profilers.append(profiler)
+
+
+def _report_profilers():
+    fmt = "json" if profiling.MOLEXTRACT_PROFILE == "json" else "text"
+    for profiler in _exit_profilers:
+        # Skip the profilers of Parsers that never parsed anything
+        if profiler.stats and not profiler.reported:
+            profiler.dump(sys.stderr, fmt)
+
 
-        parsed = self.feed(data)
-        print(json.dumps(parsed, indent=4))
+@contextlib.contextmanager
+def _open_lines(path: str,
+                use_mmap: bool,
+                binary: bool = False) -> Iterator[Iterator[Any]]:
+    # Compressed files and stdin can not be memory mapped, stream them instead
+    if use_mmap and path != source.STDIN_PATH and not source.is_compressed(
+            path):
+        with source.MmapLines(path, None if binary else 'utf-8') as lines:
+            yield lines
+    elif binary:
+        with source.open_binary(path) as f:
+            yield source.iter_binary_lines(f)
+    else:
+        with source.open_text(path) as f:
+            yield source.iter_stream_lines(f)
@@ -0,0 +1,227 @@
+"""
+Per rule instrumentation of where parsing time goes, enabled with
+`Parser(profile=True)`, the `--profile` command line option or the
+MOLEXTRACT_PROFILE environment variable.
+"""
+import contextlib
+import json
+import os
+import time
+from typing import Any, Callable, Dict, Iterator, List, TextIO, Tuple
+
+from molextract.rule import Rule, patch_methods
+
+# Set to "json" for a JSON report, or any other non-empty value for a table
+MOLEXTRACT_PROFILE = os.getenv('MOLEXTRACT_PROFILE', '')
+
+COUNTERS = ("calls", "lines", "start_tests", "start_matches", "end_tests",
+            "end_matches", "resets")
+TIMERS = ("process_time", "self_time", "reset_time")
+REPORT_FORMATS = ("text", "json")
+
+
+class Profiler:
+    """
+    A Profiler records, per `rule_id`, how much work every rule of a tree
+    does:
+
+        calls           the number of times `process_lines` was called
+        lines           the lines read from the source during those calls,
+                        including the lines read by nested rules
+        start_tests     the lines tested against the start_tag, and the
+        start_matches   number of them that matched
+        end_tests       the lines tested against the end_tag, and the number
+        end_matches     of them that matched
+        resets          the number of times `reset` was called
+        process_time    the wall time spent in `process_lines`, in seconds
+        self_time       process_time less the time spent in nested rules,
+                        e.g. the time a LogRule spends dispatching lines
+        reset_time      the wall time spent in `reset`
+
+    Lines a RuleListRule routes to its rules with its combined start_tag
+    regex count as a start test of each of those rules, and as a start match
+    of the rule they are routed to.
+
+    Rules are only instrumented while `attach` is active, by wrapping the
+    methods of each rule instance, so a rule tree that is not being profiled
+    runs exactly the same code as if this class did not exist.
+    """
+
+    def __init__(self):
+        self.stats: Dict[str, Dict[str, Any]] = {}
+        self.reported = False
+        self._lines = 0
+        # The time spent in nested rules by every process_lines call that is
+        # still running, innermost last
+        self._nested: List[float] = []
+
+    @contextlib.contextmanager
+    def attach(self, rule: Rule) -> Iterator[None]:
+        """
+        Instrument the given rule and every rule nested within it while the
+        context is active
+
+        :param rule: the top-level rule
+        """
+        with patch_methods(rule, self._instrument):
+            yield
+
+    def count_lines(self, lines: Iterator[Any]) -> Iterator[Any]:
+        """
+        Wrap an iterator of lines so the lines read from it are counted
+
+        :param lines: the lines, which may be any source of lines (e.g.
+            `source.MmapLines`)
+        :return: the wrapped iterator
+        """
+        return _CountingLines(self, lines)
+
+    def report(self, sort: str = "process_time") -> str:
+        """
+        :param sort: the statistic to sort rules by, highest first, defaults
+            to "process_time"
+        :return: a table of the statistics of every rule
+        """
+        rows: List[Tuple[str, ...]] = [("rule_id",) + COUNTERS + TIMERS]
+        for rule_id, stats in sorted(self.stats.items(),
+                                     key=lambda item: -item[1][sort]):
+            counts = tuple(str(stats[name]) for name in COUNTERS)
+            times = tuple(f"{stats[name]:.6f}" for name in TIMERS)
+            rows.append((rule_id,) + counts + times)
+
+        widths = [max(map(len, column)) for column in zip(*rows)]
+        lines = []
+        for row in rows:
+            cells = [cell.rjust(width) for cell, width in zip(row, widths)]
+            cells[0] = row[0].ljust(widths[0])
+            lines.append("  ".join(cells))
+        return "\n".join(lines)
+
+    def dump(self, stream: TextIO, fmt: str = "text"):
+        """
+        Write a report of the statistics to the given stream, either as the
+        table of `report` or as JSON mapping each rule_id to its statistics
+
+        :param stream: the text stream to write to
+        :param fmt: one of `REPORT_FORMATS`, defaults to "text"
+        """
+        if fmt == "json":
+            stream.write(json.dumps(self.stats, indent=4) + "\n")
+        else:
+            stream.write(self.report() + "\n")
+        self.reported = True
+
+    def _instrument(self, rule: Rule) -> Dict[str, Callable]:
+        # Wrap the methods of the rule that are profiled
+        stats = self._rule_stats(rule)
+        process_lines = rule.process_lines
+        reset = rule.reset
+        start_matches = rule._start_matches
+        end_matches = rule._end_matches
+
+        def timed_process_lines(start_line):
+            stats["calls"] += 1
+            lines = self._lines
+            self._nested.append(0.0)
+            start = time.perf_counter()
+            try:
+                process_lines(start_line)
+            finally:
+                elapsed = time.perf_counter() - start
+                stats["process_time"] += elapsed
+                stats["self_time"] += elapsed - self._nested.pop()
+                stats["lines"] += self._lines - lines
+                if self._nested:
+                    self._nested[-1] += elapsed
+
+        def timed_reset():
+            stats["resets"] += 1
+            start = time.perf_counter()
+            try:
+                return reset()
+            finally:
+                elapsed = time.perf_counter() - start
+                stats["reset_time"] += elapsed
+                if self._nested:
+                    self._nested[-1] += elapsed
+
+        def counted_start_matches(line):
+            stats["start_tests"] += 1
+            matches = start_matches(line)
+            if matches:
+                stats["start_matches"] += 1
+            return matches
+
+        def counted_end_matches(line):
+            stats["end_tests"] += 1
+            matches = end_matches(line)
+            if matches:
+                stats["end_matches"] += 1
+            return matches
+
+        wrappers: Dict[str, Callable] = {
+            "process_lines": timed_process_lines,
+            "reset": timed_reset,
+            "_start_matches": counted_start_matches,
+            "_end_matches": counted_end_matches,
+        }
+        if hasattr(rule, "_get_dispatch"):
+            wrappers["_get_dispatch"] = self._count_dispatch(rule)
+        return wrappers
+
+    def _count_dispatch(self, rule: Rule) -> Callable:
+        # Wrap the combined start_tag regex of a RuleListRule (see
+        # `RuleListRule._get_dispatch`) to count the lines it tests and
+        # routes for each rule
+        get_dispatch = getattr(rule, "_get_dispatch")
+
+        def counted_get_dispatch(binary=False):
+            dispatch = get_dispatch(binary)
+            if dispatch is None:
+                return None
+
+            match, group_to_rule = dispatch
+            group_stats = {
+                group: self._rule_stats(child)
+                for group, child in group_to_rule.items()
+            }
+            tested = list(group_stats.values())
+
+            def counted_match(line):
+                matched = match(line)
+                for stats in tested:
+                    stats["start_tests"] += 1
+                if matched is not None:
+                    group_stats[matched.lastgroup]["start_matches"] += 1
+                return matched
+
+            return counted_match, group_to_rule
+
+        return counted_get_dispatch
+
+    def _rule_stats(self, rule: Rule) -> Dict[str, Any]:
+        return self.stats.setdefault(rule.rule_id(),
+                                     {name: 0 for name in COUNTERS + TIMERS})
+
+
+class _CountingLines:
+    """
+    An iterator that counts the lines read from the wrapped iterator, any
+    other attribute (e.g. `MmapLines.skip_to`) is taken from the wrapped
+    iterator
+    """
+
+    def __init__(self, profiler: Profiler, lines: Iterator[Any]):
+        self._profiler = profiler
+        self._lines = lines
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> Any:
+        line = next(self._lines)
+        self._profiler._lines += 1
+        return line
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._lines, name)
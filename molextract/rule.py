@@ -1,6 +1,12 @@
+import contextlib
 import re
 from molextract import debug
-from typing import Iterator, Pattern, Any
+from molextract import source
+from typing import Any, Callable, Dict, Iterator, Optional, Pattern, Tuple
+
+_META_CHARS = frozenset(".^$*+?{}[]()|")
+_OPTIONAL_QUANTIFIERS = frozenset("*?{")
+_MISSING = object()
 
 
 class Rule:
@@ -52,8 +58,24 @@ class Rule:
             tmp = self.data.copy()
             self.data.clear()
             return tmp
+
+    A rule that only needs its first match (e.g. a header printed once) can
+    set `single_shot`, which lets a RuleListRule containing it stop reading
+    lines early, see `is_complete`.
+
+    A rule whose output is not needed can be disabled by setting `enabled` to
+    False, in which case a RuleListRule skips over its sections with
+    `skip_section` instead of calling `process_lines`.
+
+    Rules that parse many records per section (e.g. each row of
+    `RASSCFCiCoeff`) can stream them to a callback as they are parsed instead
+    of keeping them until `reset`, see `set_sink`.
     """
 
+    # Whether only the first match of this rule within a section of its
+    # parent RuleListRule is needed
+    single_shot = False
+
     def __init__(self,
                  start_tag: str = r".*",
                  end_tag: str = r".*",
@@ -72,7 +94,16 @@ class Rule:
         self._start_tag = re.compile(start_tag)
         self._end_tag = re.compile(end_tag)
         self._check_only_beginning = check_only_beginning
+        self._start_matches = _compile_matcher(self._start_tag,
+                                               check_only_beginning)
+        self._end_matches = _compile_matcher(self._end_tag,
+                                             check_only_beginning)
+        self.enabled = True
+        self.sink: Optional[Callable[[str, Any], None]] = None
         self._iterator: Iterator[str] = iter([])
+        self._raw_iterator: Optional[Iterator[bytes]] = None
+        self._encoding = 'utf-8'
+        self._raw_matchers: Optional[Tuple[Any, Any, Any]] = None
 
     def rule_id(self) -> str:
         """
@@ -88,6 +119,55 @@ class Rule:
         :param iterator: the iterator
         """
         self._iterator = iterator
+        self._raw_iterator = None
+
+    def set_raw_iter(self, iterator: Iterator[bytes], encoding: str = 'utf-8'):
+        """
+        Set the internal iterator to an iterator over undecoded lines (bytes
+        mode). Lines read from this rule are still decoded strings, but
+        rules that only scan lines for tags, such as a RuleListRule, match
+        their tags against the undecoded lines and only decode the lines a
+        rule actually reads. Tags are matched as ASCII, so the data must be
+        ASCII compatible (which Molcas and Gaussian logs are).
+
+        :param iterator: the iterator over lines of bytes
+        :param encoding: the encoding used to decode lines, defaults to
+            'utf-8'
+        """
+        self.set_iter(source.decode_lines(iterator, encoding))
+        self._raw_iterator = iterator
+        self._encoding = encoding
+
+    def set_sink(self, sink: Optional[Callable[[str, Any], None]]):
+        """
+        Hand the records this rule parses to the given callback as soon as
+        each one is parsed, instead of keeping them until `reset`, so memory
+        use does not grow with the size of a section. Rules that support this
+        call `sink(rule_id, record)` for every record, and leave streamed
+        records out of the output of `reset`. Other rules ignore the sink.
+
+        :param sink: the callback, or None to keep records until `reset`
+        """
+        self.sink = sink
+
+    def raw_tag_filters(
+            self) -> Tuple[Callable[[bytes], bool], Callable[[bytes], bool]]:
+        """
+        Get functions that test undecoded lines against this rule's start_tag
+        and end_tag. A filter never rejects a line the tag would match, but
+        may accept lines the tag does not match (e.g. when the tag can not be
+        matched against bytes, or `start_tag_matches` is overridden). Lines a
+        filter accepts must therefore still be decoded and checked with
+        `start_tag_matches` / `end_tag_matches`.
+
+        :return: a tuple of the start_tag and end_tag filters
+        """
+        start_filter, end_filter, _ = self._raw_finders()
+        if start_filter is None or _overrides(self, "start_tag_matches"):
+            start_filter = _accept_all
+        if end_filter is None or _overrides(self, "end_tag_matches"):
+            end_filter = _accept_all
+        return start_filter, end_filter
 
     def start_tag_matches(self, line: str) -> bool:
         """
@@ -96,8 +176,8 @@ class Rule:
         :param line: the string to match against
         :return: whether the match was successful
         """
-        matches = self._match(self._start_tag, line)
-        if matches:
+        matches = self._start_matches(line)
+        if matches and debug.is_enabled():
             debug.log_start_tag(line, self.rule_id())
 
         return matches
@@ -109,20 +189,12 @@ class Rule:
         :param line: the string to match against
         :return: whether the match was successful
         """
-        matches = self._match(self._end_tag, line)
-        if matches:
+        matches = self._end_matches(line)
+        if matches and debug.is_enabled():
             debug.log_end_tag(line, self.rule_id())
 
         return matches
 
-    def _match(self, compiled_re: Pattern, line: str) -> bool:
-        if self._check_only_beginning:
-            match = compiled_re.match(line)
-        else:
-            match = compiled_re.search(line)
-
-        return match is not None
-
     def process_lines(self, start_line: str):
         """
         Do the main parsing this rule is responsible for. Within this
@@ -163,6 +235,67 @@ class Rule:
         """
         raise NotImplementedError
 
+    def skip_section(self):
+        """
+        Skip the rest of this rule's section without processing it, used in
+        place of `process_lines` when this rule is disabled. Note
+        `on_end_tag_matched` is not called.
+        """
+        self.skip_to_end()
+
+    def skip_to_end(self) -> str:
+        """
+        Read lines up to and including the next line that matches this
+        rule's end_tag without returning them, which is much cheaper than
+        iterating through the lines.
+
+        If the lines come from a source that supports searching its buffer
+        (e.g. `source.MmapLines`), the end_tag is found by a single search of
+        the buffer for text the end_tag requires, and the lines in between
+        are never read. Otherwise lines are only tested against the end_tag,
+        and in bytes mode only lines that may match are decoded.
+
+        :return: the line that matched the end_tag
+        """
+        find = self._raw_finders()[2]
+        raw_lines = self._raw_iterator
+        if raw_lines is None:
+            skip_to = getattr(self._iterator, "skip_to", None)
+            if skip_to is not None and find is not None:
+                line = skip_to(find, self.end_tag_matches)
+            else:
+                line = next(filter(self.end_tag_matches, self._iterator), None)
+        else:
+            encoding = self._encoding
+
+            def matches(raw_line):
+                return self.end_tag_matches(raw_line.decode(encoding))
+
+            skip_to = getattr(raw_lines, "skip_to", None)
+            if skip_to is not None and find is not None:
+                raw_line = skip_to(find, matches)
+            else:
+                end_filter = self.raw_tag_filters()[1]
+                candidates = filter(end_filter, raw_lines)
+                raw_line = next(filter(matches, candidates), None)
+            line = None if raw_line is None else raw_line.decode(encoding)
+
+        if line is None:
+            raise ValueError("Unexpected end of iterator")
+        return line
+
+    def is_complete(self) -> bool:
+        """
+        Whether this rule has parsed everything it needs from the latest
+        section of its parent, so no more lines need to be read for it. A
+        RuleListRule stops reading lines (before its end_tag) as soon as each
+        of its rules is complete, that is it has either matched once and is
+        `single_shot`, or this method returns True after a match.
+
+        :return: whether the rule is complete, defaults to False
+        """
+        return False
+
     def skip(self, n: int):
         """
         Skip the following n lines by incrementing the iterator
@@ -172,6 +305,39 @@ class Rule:
         for _ in range(n):
             next(self._iterator)
 
+    def _raw_finders(self):
+        # The bytes matchers of both tags and the function used to search a
+        # buffer for the end_tag, built once they are first needed
+        if self._raw_matchers is None:
+            only_beginning = self._check_only_beginning
+            find = None
+            if not _overrides(self, "end_tag_matches"):
+                find = _compile_finder(self._end_tag, only_beginning)
+            self._raw_matchers = (_compile_raw_matcher(self._start_tag,
+                                                       only_beginning),
+                                  _compile_raw_matcher(self._end_tag,
+                                                       only_beginning), find)
+
+        return self._raw_matchers
+
+    def __getstate__(self):
+        # The tag matchers are closures and the iterator may wrap an open
+        # file, neither can be pickled so they are rebuilt when unpickled
+        state = self.__dict__.copy()
+        del state["_start_matches"]
+        del state["_end_matches"]
+        state["_iterator"] = iter([])
+        state["_raw_iterator"] = None
+        state["_raw_matchers"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._start_matches = _compile_matcher(self._start_tag,
+                                               self._check_only_beginning)
+        self._end_matches = _compile_matcher(self._end_tag,
+                                             self._check_only_beginning)
+
     def __iter__(self) -> Iterator[str]:
         return self
 
@@ -185,3 +351,243 @@ class Rule:
             raise StopIteration
 
         return line
+
+
+# Returns the methods to replace on a rule by name, see `patch_methods`
+_Wrap = Callable[[Rule], Dict[str, Callable]]
+
+
+def walk(rule: Rule) -> Iterator[Rule]:
+    """
+    Iterate over the given rule and every rule nested within it (the `rules`
+    of a RuleListRule), depth first
+
+    :param rule: the top-level rule
+    """
+    yield rule
+    for child in getattr(rule, "rules", []):
+        yield from walk(child)
+
+
+@contextlib.contextmanager
+def patch_methods(rule: Rule, wrap: _Wrap) -> Iterator[None]:
+    """
+    Replace methods of the given rule and every rule nested within it while
+    the context is active. The methods are set on each rule instance, and
+    the instance attributes they replaced (if any) are restored on exit, so
+    the rules are left exactly as they were.
+
+    :param rule: the top-level rule
+    :param wrap: called with each rule, returning its replacement methods
+        by name. Methods looked up on the rule by `wrap` are the original
+        ones.
+    """
+    patches = [(nested, wrap(nested)) for nested in walk(rule)]
+    saved = []
+    try:
+        for nested, methods in patches:
+            saved.append((nested, {
+                name: vars(nested).get(name, _MISSING) for name in methods
+            }))
+            for name, method in methods.items():
+                setattr(nested, name, method)
+        yield
+    finally:
+        for nested, attrs in saved:
+            for name, value in attrs.items():
+                if value is _MISSING:
+                    vars(nested).pop(name, None)
+                else:
+                    setattr(nested, name, value)
+
+
+def _literal_parts(pattern: str) -> Tuple[str, bool, str]:
+    """
+    Find the literal text a regex is built from, so that cheap string
+    operations can be used instead of (or before) running the regex. Only
+    simple sequences of literal characters, escapes and quantifiers are
+    understood, anything else ends the scan.
+
+    :param pattern: the regex
+    :return: a tuple of (prefix, exact, required) where prefix is the literal
+        text every match begins with, exact is whether the regex is nothing
+        but that prefix, and required is the longest literal text found that
+        every match must contain
+    """
+    if "|" in pattern:
+        # Alternations make any literal found optional
+        return "", False, ""
+
+    runs = []
+    run = ""
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        literal = True
+        if char == "\\":
+            escaped = pattern[i + 1:i + 2]
+            if not escaped or escaped.isalnum():
+                # A character class such as \s or \d, or an anchor like \b
+                literal = False
+            char = escaped
+            i += 2
+        elif char in ".^":
+            literal = False
+            i += 1
+        elif char in _META_CHARS:
+            break
+        else:
+            i += 1
+
+        quantifier = pattern[i:i + 1]
+        if quantifier in _OPTIONAL_QUANTIFIERS:
+            # The character may be absent, so the run of literals ends here.
+            # Skip only simple quantifiers, give up on anything else
+            if quantifier == "{":
+                break
+            i += 2 if pattern[i + 1:i + 2] == "?" else 1
+            runs.append(run)
+            run = ""
+            continue
+
+        if literal:
+            run += char
+        else:
+            runs.append(run)
+            run = ""
+
+        if quantifier == "+":
+            # At least one occurrence, but what follows may not be adjacent
+            runs.append(run)
+            run = ""
+            i += 2 if pattern[i + 1:i + 2] == "?" else 1
+
+    runs.append(run)
+    exact = i >= len(pattern) and len(runs) == 1
+    return runs[0], exact, max(runs, key=len)
+
+
+def _compile_matcher(compiled_re: Pattern,
+                     check_only_beginning: bool) -> Callable[[Any], bool]:
+    """
+    Create a function that tests whether a line matches the given regex. Tags
+    that are plain literals are tested with `str.startswith` / `in`, and tags
+    containing literal text only run the regex when that text is present.
+
+    :param compiled_re: the regex to match with, either a str or (ASCII)
+        bytes regex
+    :param check_only_beginning: whether to only match at the start of a line
+    :return: the matching function
+    """
+    pattern = compiled_re.pattern
+    binary = isinstance(pattern, bytes)
+    parts: Tuple[Any, bool, Any] = _literal_parts(
+        pattern.decode('ascii') if binary else pattern)
+    prefix, exact, required = parts
+    if binary:
+        prefix, required = prefix.encode('ascii'), required.encode('ascii')
+    if compiled_re.flags != re.compile(pattern[:0]).flags:
+        # Inline flags (e.g. case insensitivity) change what literals match
+        prefix, exact, required = pattern[:0], False, pattern[:0]
+
+    if check_only_beginning:
+        match = compiled_re.match
+        if exact:
+            return lambda line: line.startswith(prefix)
+        if prefix:
+
+            def matches(line):
+                return line.startswith(prefix) and match(line) is not None
+
+            return matches
+    else:
+        match = compiled_re.search
+        if exact:
+            return lambda line: prefix in line
+
+    if required:
+        return lambda line: required in line and match(line) is not None
+
+    return lambda line: match(line) is not None
+
+
+def _compile_raw_matcher(
+        compiled_re: Pattern,
+        check_only_beginning: bool) -> Optional[Callable[[bytes], bool]]:
+    """
+    Create a function that tests whether an undecoded line matches the given
+    str regex, see `_compile_matcher`
+
+    :param compiled_re: the str regex to match with
+    :param check_only_beginning: whether to only match at the start of a line
+    :return: the matching function, or None if the regex can not be matched
+        against bytes (it contains non ASCII text or str only syntax)
+    """
+    try:
+        raw_re = re.compile(compiled_re.pattern.encode('ascii'),
+                            compiled_re.flags & ~re.UNICODE)
+    except (UnicodeEncodeError, re.error):
+        return None
+
+    return _compile_matcher(raw_re, check_only_beginning)
+
+
+def _compile_finder(
+        compiled_re: Pattern,
+        check_only_beginning: bool) -> Optional[Callable[[Any, int], int]]:
+    """
+    Create a function that searches a buffer of bytes (e.g. a memory map)
+    for lines that may match the given str regex, see `MmapLines.skip_to`.
+    Regexes holding literal text are searched for that text with `find`,
+    others are searched for with a multiline version of the regex.
+
+    :param compiled_re: the str regex lines are matched with
+    :param check_only_beginning: whether lines are only matched at their
+        start
+    :return: a function taking a buffer and an offset and returning the
+        offset of the next candidate match (or -1), or None if the regex can
+        not be searched for in a buffer
+    """
+    pattern = compiled_re.pattern
+    if compiled_re.flags != re.compile("").flags:
+        return None
+
+    required = _literal_parts(pattern)[2]
+    if required:
+        try:
+            needle = required.encode('ascii')
+        except UnicodeEncodeError:
+            return None
+        return lambda buffer, pos: buffer.find(needle, pos)
+
+    # Anchors to the start / end of the string or a line (which may end in
+    # '\r\n' in the buffer) and lookarounds (which could look past the end of
+    # a line) would match differently in a buffer
+    if "$" in pattern or re.search(r"\\[AZ]|\(\?<?[=!]", pattern):
+        return None
+    if check_only_beginning:
+        pattern = f"^(?:{pattern})"
+    try:
+        search = re.compile(pattern.encode('ascii'), re.MULTILINE).search
+    except (UnicodeEncodeError, re.error):
+        return None
+
+    def find(buffer, pos):
+        matched = search(buffer, pos)
+        return -1 if matched is None else matched.start()
+
+    return find
+
+
+def _overrides(rule: Rule, method: str) -> bool:
+    """
+    Whether the given rule overrides the given method of Rule, either in its
+    class or on the instance itself
+    """
+    if method in vars(rule):
+        return True
+    return getattr(type(rule), method) is not getattr(Rule, method)
+
+
+def _accept_all(line: bytes) -> bool:
+    return True
@@ -1,4 +1,9 @@
-from molextract.rule import Rule
+import math
+import re
+from typing import Dict, Optional, Pattern
+
+from molextract import debug
+from molextract.rule import Rule, _compile_finder, _literal_parts, _overrides
 
 
 class RuleListRule(Rule):
@@ -29,28 +34,534 @@ class RuleListRule(Rule):
     method to return what form of data you would like.
 
     A RuleListRule is a Rule itself and may be further nested in other rules.
+
+    Each line is handed to the first rule (in list order) whose start_tag
+    matches. To avoid testing every rule against every line, the start_tags
+    of all rules are combined into a single alternation so each line is
+    matched once and routed straight to the matching rule. Rules whose
+    start_tag can not be safely combined (their regex has groups or inline
+    flags, or they override `start_tag_matches`) disable this and fall back
+    to testing each rule in turn.
+
+    In bytes mode (see `Rule.set_raw_iter`) the combined regex is matched
+    against undecoded lines, so only the lines handed to a rule are decoded.
+
+    Once every rule is complete (see `Rule.is_complete`), e.g. each rule is
+    `single_shot` and has matched, no more lines are read and
+    `process_lines` returns without waiting for the end_tag. The
+    RuleListRule is then complete itself, so a parent RuleListRule (and in
+    turn the Parser) can stop reading too. A parent that still has rules
+    that are not complete skips the rest of the section instead.
+
+    If every rule is a SingleLineRule and the lines come from a source that
+    can be searched as a whole (e.g. `source.MmapLines`), the buffer is
+    searched for the start_tags instead, and only the lines that may match
+    are read (see `SingleLineRule`).
+
+    Rules whose output is not needed can be disabled with `select`, their
+    sections are then skipped without being parsed and `reset` gives None
+    in place of their output.
+
+    Given a `section_sink`, the output of every section of a rule (e.g. each
+    module of a LogRule) is handed to `section_sink(rule_id, output)` as soon
+    as the section is parsed, instead of being kept until `reset`.
+
+    With `adaptive` set, the number of sections of each rule is counted and
+    on every `reset` the start_tags are reordered to be tested in order of
+    how often they matched, most first, so rules that rarely match are not
+    tested first against every line. `set_order` orders them by counts known
+    in advance instead. Only rules whose start_tags can never match the
+    same line are moved past each other (see `tag_overlaps`), so every line
+    is still handed to the first rule in list order that matches it, and the
+    output is the same as without reordering.
     """
 
-    def __init__(self, *args, rules=None, **kwargs):
+    # Maps the fields of the output of `reset` (joined by dots for nested
+    # fields) to the index of the rule producing them, see `select`
+    FIELDS: Dict[str, int] = {}
+
+    def __init__(self, *args, rules=None, adaptive=False, **kwargs):
         super().__init__(*args, **kwargs)
         if rules is None:
             rules = []
         self.rules = rules
+        self.section_sink = None
+        self.adaptive = adaptive
+        # The number of sections of each rule, by index, and the rules in the
+        # order their start_tags are tested
+        self._hits = []
+        self._order_key = None
+        self._order = rules
+        self._overlaps_key = None
+        self._overlaps = []
+        self._dispatch_key = None
+        self._dispatch = None
+        self._region_key = None
+        self._region_finders = None
+        self._complete = False
 
     def set_iter(self, iterator):
         super().set_iter(iterator)
         for rule in self.rules:
             rule.set_iter(iterator)
 
+    def set_raw_iter(self, iterator, encoding='utf-8'):
+        super().set_raw_iter(iterator, encoding)
+        for rule in self.rules:
+            rule.set_raw_iter(iterator, encoding)
+
+    def set_sink(self, sink):
+        super().set_sink(sink)
+        for rule in self.rules:
+            rule.set_sink(sink)
+
+    def set_adaptive(self, adaptive=True):
+        """
+        Set `adaptive` on this rule and every RuleListRule nested within it
+
+        :param adaptive: whether to reorder the start_tags by how often they
+            match, defaults to True
+        """
+        self.adaptive = adaptive
+        for rule in self.rules:
+            if isinstance(rule, RuleListRule):
+                rule.set_adaptive(adaptive)
+
+    def set_order(self, hits):
+        """
+        Test the start_tags of the rules of this rule and every RuleListRule
+        nested within it in order of how often each rule matched, most first,
+        e.g. as counted by a `profiling.Profiler` on an earlier run
+
+            rule.set_order({
+                rule_id: stats["calls"]
+                for rule_id, stats in profiler.stats.items()
+            })
+
+        Rules whose start_tags may match the same line keep their order, see
+        `tag_overlaps`.
+
+        :param hits: the number of matches of the rules, by rule_id, rules
+            that are missing are counted as never matching
+        """
+        self._hits = [hits.get(rule.rule_id(), 0) for rule in self.rules]
+        self._order_key = None
+        for rule in self.rules:
+            if isinstance(rule, RuleListRule):
+                rule.set_order(hits)
+
+    def tag_overlaps(self):
+        """
+        Find the rules whose start_tags may match the same line, whose order
+        decides which of them a line is handed to. Tags are compared by the
+        whitespace and literal text they begin with, tags that can not be
+        compared this way (e.g. they are not matched at the start of lines,
+        or `start_tag_matches` is overridden) are taken to overlap with every
+        other tag.
+
+        :return: the pairs of indices (i, j) of such rules, with i < j
+        """
+        key = tuple(id(rule) for rule in self.rules)
+        if key != self._overlaps_key:
+            prefixes = [_tag_prefix(rule) for rule in self.rules]
+            self._overlaps = [(i, j)
+                              for j in range(len(prefixes))
+                              for i in range(j)
+                              if _prefixes_overlap(prefixes[i], prefixes[j])]
+            self._overlaps_key = key
+        return self._overlaps
+
     def process_lines(self, start_line):
+        self._complete = False
+        # The ids of the rules that are not complete yet
+        pending = {id(rule) for rule in self.rules if rule.enabled}
+        binary = self._raw_iterator is not None
+        lines = self._raw_iterator if binary else self._iterator
+        if hasattr(lines, "region_to"):
+            finders = self._get_region_finders()
+            if finders is not None:
+                self._process_region(lines, finders, pending)
+                return
+
+        dispatch = self._get_dispatch(binary)
+        if binary and dispatch is not None:
+            self._process_raw_lines(dispatch, pending)
+            return
+
+        if dispatch is None:
+            rules = self._ordered_rules()
+            for line in self:
+                for rule in rules:
+                    if rule.start_tag_matches(line):
+                        if self._run(rule, line, pending):
+                            return
+                        break
+            return
+
+        match, group_to_rule = dispatch
         for line in self:
-            for rule in self.rules:
+            matched = match(line)
+            if matched is not None:
+                rule = group_to_rule[matched.lastgroup]
+                if debug.is_enabled():
+                    debug.log_start_tag(line, rule.rule_id())
+                if self._run(rule, line, pending):
+                    return
+
+    def process_section(self, rule, start_line):
+        """
+        Process a single section of one of the rules, whose start_tag matches
+        the given line, as `process_lines` does for each section it finds.
+        Used to parse sections found by other means, e.g. a
+        `index.ModuleIndex`.
+
+        :param rule: the rule, one of `rules`
+        :param start_line: the line that matched the start_tag of the rule
+        """
+        self._complete = False
+        pending = {id(rule) for rule in self.rules if rule.enabled}
+        self._run(rule, start_line, pending)
+
+    def is_complete(self):
+        return self._complete
+
+    def __getstate__(self):
+        # The dispatch regex and region finders hold closures, they are
+        # rebuilt from the rules when next needed
+        state = super().__getstate__()
+        state["_dispatch_key"] = None
+        state["_dispatch"] = None
+        state["_region_key"] = None
+        state["_region_finders"] = None
+        return state
+
+    def _run(self, rule, start_line, pending):
+        # Process (or skip, if disabled) the section of the given rule and
+        # return whether it was the last rule left to complete
+        if not rule.enabled:
+            rule.skip_section()
+            return False
+
+        if self.adaptive:
+            self._count_hit(rule)
+        rule.process_lines(start_line)
+        if rule.single_shot or rule.is_complete():
+            pending.discard(id(rule))
+            if not pending:
+                self._complete = True
+                if debug.is_enabled():
+                    debug.logger.debug("%s complete", self.rule_id())
+        if not self._complete and isinstance(rule, RuleListRule) and \
+                rule._complete:
+            # The rule stopped reading before its end_tag, but lines are
+            # still needed for other rules, which must not be handed the
+            # rest of its section
+            rule.on_end_tag_matched(rule.skip_to_end())
+        if self.section_sink is not None:
+            self.section_sink(rule.rule_id(), rule.reset())
+        return self._complete
+
+    def _process_raw_lines(self, dispatch, pending):
+        # The same loop as above, over undecoded lines
+        match, group_to_rule = dispatch
+        end_filter = self.raw_tag_filters()[1]
+        encoding = self._encoding
+        for raw_line in self._raw_iterator:
+            if end_filter(raw_line):
+                line = raw_line.decode(encoding)
+                if self.end_tag_matches(line):
+                    self.on_end_tag_matched(line)
+                    return
+
+            matched = match(raw_line)
+            if matched is not None:
+                line = raw_line.decode(encoding)
+                rule = group_to_rule[matched.lastgroup]
+                if debug.is_enabled():
+                    debug.log_start_tag(line, rule.rule_id())
+                if self._run(rule, line, pending):
+                    return
+
+        raise ValueError("Unexpected end of iterator")
+
+    def _process_region(self, lines, finders, pending):
+        # Search the buffer up to the end_tag for the lines that may start a
+        # rule (which are all SingleLineRules), instead of reading every line
+        encoding = lines.encoding or self._encoding
+        if lines.encoding is None:
+
+            def matches(raw_line):
+                return self.end_tag_matches(raw_line.decode(encoding))
+        else:
+            matches = self.end_tag_matches
+
+        rules = self._ordered_rules()
+        find_end = self._raw_finders()[2]
+        buffer, pos, end, end_line = lines.region_to(find_end, matches)
+        # The offset of the next candidate line of each rule
+        found = [_find_before(find, buffer, pos, end) for find in finders]
+        while min(found) < end:
+            candidate = min(found)
+            newline = buffer.rfind(b'\n', pos, candidate)
+            start = pos if newline == -1 else newline + 1
+            line_end = buffer.find(b'\n', candidate, end)
+            if line_end == -1:
+                line_end = end
+            raw_line = buffer[start:line_end]
+            if raw_line.endswith(b'\r'):
+                raw_line = raw_line[:-1]
+            line = raw_line.decode(encoding)
+            pos = line_end + 1
+            for rule in rules:
                 if rule.start_tag_matches(line):
-                    rule.process_lines(line)
+                    self._run(rule, line, pending)
                     break
 
+            found = [
+                offset if offset >= pos else _find_before(
+                    find, buffer, pos, end)
+                for offset, find in zip(found, finders)
+            ]
+
+        if end_line is None:
+            raise ValueError("Unexpected end of iterator")
+        if lines.encoding is None:
+            end_line = end_line.decode(encoding)
+        self.on_end_tag_matched(end_line)
+
+    def _get_region_finders(self):
+        # The functions used by `_process_region` to search a buffer for the
+        # start_tag of each rule, or None if the buffer can not be searched
+        # as no rule may read lines of its own and the tags must be
+        # searchable. Early termination needs lines to be read in order, so
+        # rules that may complete early rule this out too.
+        key = tuple(id(rule) for rule in self.rules)
+        if key == self._region_key:
+            return self._region_finders
+
+        finders = []
+        for rule in self.rules:
+            if (not isinstance(rule, SingleLineRule) or rule.single_shot or
+                    _overrides(rule, "is_complete") or
+                    _overrides(rule, "start_tag_matches")):
+                finders = None
+                break
+            finders.append(
+                _compile_finder(rule._start_tag, rule._check_only_beginning))
+
+        if (not finders or None in finders or self._raw_finders()[2] is None):
+            finders = None
+        self._region_key = key
+        self._region_finders = finders
+        return finders
+
+    def _get_dispatch(self, binary=False):
+        # The list of rules is public and may be changed after init, so the
+        # combined regex is rebuilt whenever the rules themselves change
+        rules = self._ordered_rules()
+        key = (binary,) + tuple(id(rule) for rule in rules)
+        if key != self._dispatch_key:
+            self._dispatch_key = key
+            self._dispatch = _compile_dispatch(rules, binary)
+
+        return self._dispatch
+
+    def _ordered_rules(self):
+        # The rules in the order their start_tags are tested
+        key = tuple(id(rule) for rule in self.rules)
+        if key == self._order_key:
+            return self._order
+
+        if len(self._hits) != len(self.rules):
+            self._hits = [0] * len(self.rules)
+        order = _order_by_hits(self._hits, self.tag_overlaps())
+        self._order = [self.rules[i] for i in order]
+        self._order_key = key
+        if self._order != self.rules and debug.is_enabled():
+            rule_ids = [rule.rule_id() for rule in self._order]
+            debug.logger.debug("%s testing rules in order %s", self.rule_id(),
+                               rule_ids)
+        return self._order
+
+    def _count_hit(self, rule):
+        if len(self._hits) != len(self.rules):
+            self._hits = [0] * len(self.rules)
+        self._hits[self.rules.index(rule)] += 1
+
+    def select(self, fields=None):
+        """
+        Enable only the rules needed to produce the given fields of the
+        output, and disable all others. A field is either a key of `FIELDS`
+        (or a prefix of keys, e.g. "data" for every "data.<field>"), or the
+        name of a rule (the `name` of a ModuleRule, otherwise its `rule_id`)
+        optionally followed by a dot and a field of that rule, e.g.
+        "rasscf.data.total_energy" for a LogRule. As fields are selected by
+        enabling rules, the output may hold more fields than requested.
+
+        :param fields: the fields to select, defaults to None which enables
+            every rule
+        :raises ValueError: if a field is unknown
+        """
+        # Maps the index of every needed rule to the fields needed from it,
+        # None meaning all of them
+        needed = {}
+        if fields is None:
+            needed = dict.fromkeys(range(len(self.rules)))
+
+        for field in fields or []:
+            indices = [
+                i for key, i in self.FIELDS.items()
+                if key == field or key.startswith(field + ".")
+            ]
+            if indices:
+                needed.update(dict.fromkeys(indices))
+                continue
+
+            name, _, subfield = field.partition(".")
+            indices = [
+                i for i, rule in enumerate(self.rules)
+                if getattr(rule, "name", rule.rule_id()) == name
+            ]
+            if not indices:
+                raise ValueError(
+                    f"unknown field '{field}' for {self.rule_id()}")
+            for i in indices:
+                if not subfield:
+                    needed[i] = None
+                elif needed.setdefault(i, []) is not None:
+                    needed[i].append(subfield)
+
+        for i, rule in enumerate(self.rules):
+            rule.enabled = i in needed
+            if isinstance(rule, RuleListRule):
+                if rule.enabled:
+                    rule.select(needed[i])
+            elif needed.get(i):
+                raise ValueError(f"unknown field '{needed[i][0]}' for "
+                                 f"{rule.rule_id()}")
+
     def reset(self):
-        return [rule.reset() for rule in self.rules]
+        if self.adaptive:
+            # Reorder with the counts so far once the next section starts
+            self._order_key = None
+        return [rule.reset() if rule.enabled else None for rule in self.rules]
+
+
+def _compile_dispatch(rules, binary=False):
+    """
+    Combine the start_tags of the given rules into a single regex of named
+    alternatives, one per rule in order. As alternatives are tried left to
+    right the first rule to match wins, just as when testing rules in turn.
+
+    :param binary: whether the regex should match lines of bytes
+    :return: a tuple of the bound `match` method of the combined regex and a
+        dict mapping group names to rules, or None if the rules can not be
+        combined
+    """
+    if not rules:
+        return None
+
+    no_flags = re.compile("").flags
+    alternatives = []
+    group_to_rule = {}
+    for i, rule in enumerate(rules):
+        start_tag = rule._start_tag
+        if _overrides(rule, "start_tag_matches"):
+            return None
+        if start_tag.groups or start_tag.flags != no_flags:
+            return None
+
+        name = f"r{i}"
+        pattern = start_tag.pattern
+        if not rule._check_only_beginning:
+            pattern = f"(?s:.*?)(?:{pattern})"
+        alternatives.append(f"(?P<{name}>{pattern})")
+        group_to_rule[name] = rule
+
+    pattern = "|".join(alternatives)
+    try:
+        combined = re.compile(pattern.encode('ascii') if binary else pattern)
+    except (UnicodeEncodeError, re.error):
+        return None
+
+    return combined.match, group_to_rule
+
+
+def _tag_prefix(rule):
+    """
+    Describe how every line the start_tag of the given rule matches begins:
+    with a number of whitespace characters between low and high, followed by
+    the given literal text (which begins with a non whitespace character)
+
+    :return: a tuple of (low, high, literal), or None if this is not known
+    """
+    pattern = rule._start_tag.pattern
+    if (_overrides(rule, "start_tag_matches") or
+            not rule._check_only_beginning or "|" in pattern or
+            rule._start_tag.flags != re.compile("").flags):
+        return None
+
+    low, high = 0, 0
+    i = 1 if pattern.startswith("^") else 0
+    while pattern.startswith(" ", i) or pattern.startswith(r"\s", i):
+        i += 1 if pattern[i] == " " else 2
+        quantifier = pattern[i:i + 1]
+        if quantifier == "{":
+            return None
+        if quantifier in ("+", "*", "?"):
+            i += 2 if pattern[i + 1:i + 2] == "?" else 1
+        low += quantifier not in ("*", "?")
+        high = math.inf if quantifier in ("+", "*") else high + 1
+
+    literal = _literal_parts(pattern[i:])[0]
+    if literal[:1].isspace():
+        return None
+    if not literal:
+        # Any number of whitespace characters may follow
+        high = math.inf
+    return low, high, literal
+
+
+def _prefixes_overlap(a, b):
+    # Whether lines may begin as described by both of the given prefixes
+    if a is None or b is None:
+        return True
+    (low_a, high_a, literal_a), (low_b, high_b, literal_b) = a, b
+    if max(low_a, low_b) > min(high_a, high_b):
+        return False
+    return literal_a.startswith(literal_b) or literal_b.startswith(literal_a)
+
+
+def _order_by_hits(hits, overlaps):
+    """
+    Order the indices of rules by their hits, most first (ties in list
+    order), keeping every pair of overlapping rules in list order
+
+    :param hits: the hits of each rule
+    :param overlaps: the pairs of indices (i, j) of overlapping rules
+    :return: the ordered indices
+    """
+    after = {j: set() for j in range(len(hits))}
+    for i, j in overlaps:
+        after[j].add(i)
+
+    order = []
+    left = list(range(len(hits)))
+    while left:
+        # The first rule left is always ready, as every rule it must follow
+        # comes before it in list order
+        ready = [j for j in left if after[j].issubset(order)]
+        best = max(ready, key=lambda j: hits[j])
+        order.append(best)
+        left.remove(best)
+    return order
+
+
+def _find_before(find, buffer, pos, end):
+    # The offset of the next candidate found from pos, or end if there is
+    # none before end
+    found = find(buffer, pos)
+    return end if found == -1 or found > end else found
 
 
 class SingleLineRule(Rule):
@@ -79,8 +590,32 @@ class SingleLineRule(Rule):
 
     Because these rules are meant to only execute on one line, any use of the
     iterator will result in an error.
+
+    Instead of splitting the line in `process`, a rule may declare a `PATTERN`
+    whose groups capture the values of the line, which are then handed to
+    `process_groups`. `process` is still used for lines the PATTERN does not
+    match.
+
+        class TestRule(SingleLineRule):
+            PATTERN = r"This data is only on a single line: ([0-9]+)"
+
+            def __init__(self):
+                super().__init__("This data is only")
+
+            def process_groups(self, groups):
+                return int(groups[0])
+
+    When a RuleListRule made up only of SingleLineRules reads from a source
+    that can be searched as a whole (e.g. `source.MmapLines`), the buffer is
+    searched for the lines of these rules just as `Rule.skip_to_end` searches
+    for an end_tag, and only the lines found are read.
     """
 
+    # A regex matched against the start of the single line, whose groups
+    # capture the values passed to `process_groups`
+    PATTERN: Optional[str] = None
+    _pattern: Optional[Pattern] = None
+
     def __init__(self, regex):
         """
         :param regex: the regex that defines the single line
@@ -88,9 +623,36 @@ class SingleLineRule(Rule):
         """
         super().__init__(start_tag=regex)
         self._data = []
+        if self.PATTERN is not None:
+            self._pattern = re.compile(self.PATTERN)
 
     def process_lines(self, start_line):
-        self._data.append(self.process(start_line))
+        matched = None
+        if self._pattern is not None:
+            matched = self._pattern.match(start_line)
+        if matched is not None:
+            value = self.process_groups(matched.groups())
+        else:
+            value = self.process(start_line)
+
+        if self.sink is not None:
+            self.sink(self.rule_id(), value)
+        else:
+            self._data.append(value)
+
+    def process_groups(self, groups):
+        """
+        Process the values captured by `PATTERN` in the single line that
+        defines this rule. Defaults to converting every group to a float,
+        giving a single float if there is only one group.
+
+        :param groups: the groups captured by `PATTERN`
+        :type groups: tuple
+        :return: whatever output the line should have
+        :rtype: any
+        """
+        values = [float(group) for group in groups]
+        return values[0] if len(values) == 1 else values
 
     def process(self, line):
         """
@@ -106,6 +668,10 @@ class SingleLineRule(Rule):
     def end_tag_matches(self, line):
         raise ValueError("SingleLineRules do not support matching end_tags")
 
+    def skip_section(self):
+        # The section is only the start line, which has already been read
+        pass
+
     def reset(self):
         tmp = self._data.copy()
         self._data.clear()
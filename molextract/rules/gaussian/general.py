@@ -23,9 +23,8 @@ class DipoleMoment(Rule):
         }  # yapf: disable
 
     def process_lines(self, start_line):
-        for _ in self:
-            # iterate until we get to the END_TAG
-            pass
+        # Only the line matching the END_TAG is needed
+        self.on_end_tag_matched(self.skip_to_end())
 
     def on_end_tag_matched(self, end_line):
         split = end_line.split()
@@ -3,6 +3,7 @@ from molextract.rules.abstract import SingleLineRule
 
 class TDDFTExcitedState(SingleLineRule):
     START_TAG = " Excited State"
+    PATTERN = r" Excited State\s+\d+:\s+\S+\s+(\S+) eV\s+(\S+) nm\s+f=(\S+)"
 
     def __init__(self):
         super().__init__(self.START_TAG)
@@ -14,3 +15,7 @@ class TDDFTExcitedState(SingleLineRule):
             "nm": float(split[6]),
             "f": float(split[8][2:]),
         }
+
+    def process_groups(self, groups):
+        ev, nm, f = map(float, groups)
+        return {"eV": ev, "nm": nm, "f": f}
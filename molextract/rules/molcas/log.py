@@ -1,13 +1,31 @@
+from typing import Optional, Tuple
+
 from molextract.rules.abstract import RuleListRule
 
 
 class ModuleRule(RuleListRule):
 
+    # The indices of the rules that stream their records to a sink (see
+    # `Rule.set_sink`), None for every rule. Rules whose output is combined
+    # per root (see `zip_roots`) must keep their output, or the roots would
+    # be missing their values.
+    STREAMED: Optional[Tuple[int, ...]] = None
+
     def __init__(self, name, rules=None, **kwargs):
+        self.name = name
         start_tag = f"--- Start Module: {name}"
         end_tag = f"--- Stop Module: {name}"
         super().__init__(start_tag, end_tag, rules=rules, **kwargs)
 
+    def set_sink(self, sink):
+        if self.STREAMED is None:
+            super().set_sink(sink)
+            return
+
+        self.sink = sink
+        for i, rule in enumerate(self.rules):
+            rule.set_sink(sink if i in self.STREAMED else None)
+
 
 class LogRule(RuleListRule):
     START_TAG = r"\s+This run of MOLCAS"
@@ -18,3 +36,27 @@ class LogRule(RuleListRule):
                          LogRule.END_TAG,
                          rules=rules,
                          **kwargs)
+
+
+def zip_roots(columns):
+    """
+    Combine the output of rules that parse one value per root into one dict
+    per root, leaving out the rules that are disabled (whose output is None)
+
+    :param columns: a dict mapping each field to the output of the rule
+        producing it
+    :type columns: dict
+    :return: one dict per root, as many as there are values in the first
+        column
+    :rtype: list
+    """
+    enabled = [(field, values)
+               for field, values in columns.items()
+               if values is not None]
+    if not enabled:
+        return []
+
+    num_roots = len(enabled[0][1])
+    return [{
+        field: values[i] for field, values in enabled
+    } for i in range(num_roots)]
@@ -5,6 +5,7 @@ from molextract.rules.molcas import log
 class MCPDFTEnergy(SingleLineRule):
 
     START_TAG = r"\s+Total MC-PDFT energy for state"
+    PATTERN = r"\s+Total MC-PDFT energy for state\s+\d+\s+(\S+)"
 
     def __init__(self):
         super().__init__(self.START_TAG)
@@ -17,6 +18,7 @@ class MCPDFTEnergy(SingleLineRule):
 class MCPDFTRefEnergy(SingleLineRule):
 
     START_TAG = r"\s+MCSCF reference energy"
+    PATTERN = r"\s+MCSCF reference energy\s+(\S+)"
 
     def __init__(self):
         super().__init__(self.START_TAG)
@@ -28,17 +30,24 @@ class MCPDFTRefEnergy(SingleLineRule):
 
 class MCPDFTModule(log.ModuleRule):
 
+    FIELDS = {
+        "roots": 0,
+        "data.mcsf_ref_energy": 0,
+        "data.total_energy": 1,
+    }
+    # Both energies are combined per root, so neither is streamed
+    STREAMED = ()
+
     def __init__(self):
         rules = [MCPDFTRefEnergy(), MCPDFTEnergy()]
         super().__init__("mcpdft", rules)
 
     def reset(self):
-        results = [rule.reset() for rule in self.rules]
-        ref_energies, energies = results
-        assert len(ref_energies) == len(energies)
-        out = {"module": "mcpdft", "roots": len(ref_energies), "data": []}
-        for ref, energy in zip(ref_energies, energies):
-            root_dict = {"mcsf_ref_energy": ref, "total_energy": energy}
-            out["data"].append(root_dict)
-
-        return out
+        ref_energies, energies = super().reset()
+        if ref_energies is not None and energies is not None:
+            assert len(ref_energies) == len(energies)
+        data = log.zip_roots({
+            "mcsf_ref_energy": ref_energies,
+            "total_energy": energies
+        })
+        return {"module": "mcpdft", "roots": len(data), "data": data}
@@ -2,10 +2,21 @@ from molextract.rule import Rule
 from molextract.rules.abstract import SingleLineRule
 from molextract.rules.molcas import log
 
+try:
+    import numpy as np
+except ImportError:
+    np = None  # type: ignore
+
+
+def _check_numpy(as_array):
+    if as_array and np is None:
+        raise ImportError("as_array requires numpy to be installed")
+
 
 class RASSCFEnergy(SingleLineRule):
 
     START_TAG = "::    RASSCF root number"
+    PATTERN = r"::    RASSCF root number\s+\d+\s+Total energy:\s+(\S+)"
 
     def __init__(self):
         super().__init__(self.START_TAG)
@@ -15,12 +26,18 @@ class RASSCFEnergy(SingleLineRule):
 
 
 class RASSCFOccupation(Rule):
+    """
+    The occupation numbers of each root, as a list of floats per root or,
+    with `as_array`, a 1D float array per root
+    """
 
     START_TAG = r"\s+Natural orbitals and occupation numbers"
     END_TAG_TAG = r"^\s+$"
 
-    def __init__(self):
+    def __init__(self, as_array=False):
         super().__init__(self.START_TAG, self.END_TAG_TAG)
+        _check_numpy(as_array)
+        self.as_array = as_array
         self.state = []
 
     def process_lines(self, start_line):
@@ -32,54 +49,89 @@ class RASSCFOccupation(Rule):
             if line.startswith("Warning!"):
                 continue
             if line.startswith("sym"):
-                occupation.extend(line.split()[2:])
+                # Drop the "sym N:" label
+                occupation.extend(line.split(None, 2)[2:])
             else:
-                occupation.extend(line.split())
+                occupation.append(line)
 
         self.state.append(occupation)
 
     def reset(self):
         floats = []
         for root in self.state:
-            floats.append([float(o) for o in root])
+            text = " ".join(root)
+            if self.as_array:
+                floats.append(np.fromstring(text, sep=" "))
+            else:
+                floats.append([float(o) for o in text.split()])
         self.state.clear()
         return floats
 
 
 class RASSCFCiCoeff(Rule):
+    """
+    The CI coefficients of each root, as a list of [conf_sym, occupation,
+    coeff, weight] rows per root or, with `as_array`, a structured array per
+    root with fields of the same names. With a sink (see `Rule.set_sink`)
+    every row is streamed as a dict of these fields and its "root" (counted
+    from 1) instead.
+    """
 
     START_TAG = r"\s+ printout of CI-coefficients larger than"
     END_TAG_TAG = r"^\s+$"
+    COLUMNS = ("conf_sym", "occupation", "coeff", "weight")
 
-    def __init__(self):
+    def __init__(self, as_array=False):
         super().__init__(self.START_TAG, self.END_TAG_TAG)
+        _check_numpy(as_array)
+        self.as_array = as_array
         self.state = []
+        self._streamed_roots = 0
 
     def process_lines(self, start_line):
         # Don't care about next two lines
         self.skip(2)
-        coeffs = []
-        for line in self:
-            coeffs.append(line.split())
+        if self.sink is None:
+            self.state.append(list(self))
+            return
 
-        self.state.append(coeffs)
+        self._streamed_roots += 1
+        rule_id = self.rule_id()
+        for line in self:
+            record = dict(zip(self.COLUMNS, self._parse_row(line)))
+            self.sink(rule_id, {"root": self._streamed_roots, **record})
 
     def reset(self):
         out = []
         for root in self.state:
-            coeffs = []
-            for data in root:
-                conf_sym = int(data[0])
-                occupation = data[1]
-                coeff = float(data[2])
-                weight = float(data[3])
-
-                coeffs.append([conf_sym, occupation, coeff, weight])
-            out.append(coeffs)
+            if self.as_array:
+                out.append(self._to_array(root))
+            else:
+                out.append([self._parse_row(line) for line in root])
 
         self.state.clear()
+        self._streamed_roots = 0
         return out
 
+    @staticmethod
+    def _parse_row(line):
+        data = line.split()
+        conf_sym = int(data[0])
+        occupation = data[1]
+        coeff = float(data[2])
+        weight = float(data[3])
+        return [conf_sym, occupation, coeff, weight]
+
+    @staticmethod
+    def _to_array(lines):
+        # Every row has an occupation string of the same length
+        width = len(lines[0].split()[1]) if lines else 1
+        dtype = np.dtype([("conf_sym", np.int64), ("occupation", f"U{width}"),
+                          ("coeff", np.float64), ("weight", np.float64)])
+        if not lines:
+            return np.empty(0, dtype=dtype)
+        return np.loadtxt(lines, dtype=dtype, ndmin=1)
+
 
 class RASSCFOrbSpec(Rule):
     START_TAG = r"\+\+    Orbital specifications:"
@@ -128,11 +180,19 @@ class RASSCFCIExpansionSpec(Rule):
 
 
 class RASSCFCartesianCoords(Rule):
+    """
+    The coordinates of each atom, as a list of (label, x, y, z) tuples or,
+    with `as_array`, a structured array with fields of the same names. With a
+    sink (see `Rule.set_sink`) every tuple is streamed instead.
+    """
+
     START_TAG = r"\s+Cartesian coordinates in Angstrom:"
     END_TAG = r"\s+Nuclear repulsion energy"
 
-    def __init__(self):
+    def __init__(self, as_array=False):
         super().__init__(self.START_TAG, self.END_TAG)
+        _check_numpy(as_array)
+        self.as_array = as_array
         self.state = []
 
     def process_lines(self, start_line):
@@ -141,40 +201,78 @@ class RASSCFCartesianCoords(Rule):
             line = line.strip()
             if line.startswith('-'):
                 continue
-
-            split = line.split()
-            label = split[1]
-            floats = [float(val) for val in split[2:]]
-            self.state.append((label, *floats))
+            if self.sink is not None:
+                self.sink(self.rule_id(), self._parse_atom(line))
+            else:
+                self.state.append(line)
 
     def reset(self):
-        tmp = self.state.copy()
+        if self.as_array:
+            out = self._to_array(self.state)
+        else:
+            out = [self._parse_atom(line) for line in self.state]
+
         self.state.clear()
-        return tmp
+        return out
 
+    @staticmethod
+    def _parse_atom(line):
+        split = line.split()
+        label = split[1]
+        floats = [float(val) for val in split[2:]]
+        return (label, *floats)
 
-class RASSCFModule(log.ModuleRule):
+    @staticmethod
+    def _to_array(lines):
+        width = max((len(line.split()[1]) for line in lines), default=1)
+        dtype = np.dtype([("label", f"U{width}"), ("x", np.float64),
+                          ("y", np.float64), ("z", np.float64)])
+        if not lines:
+            return np.empty(0, dtype=dtype)
+        return np.loadtxt(lines, dtype=dtype, usecols=(1, 2, 3, 4), ndmin=1)
 
-    def __init__(self):
+
+class RASSCFModule(log.ModuleRule):
+    """
+    The output of the RASSCF module, with `as_array` the occupations and CI
+    coefficients of each root are NumPy arrays (see `RASSCFOccupation` and
+    `RASSCFCiCoeff`). With a sink only the CI coefficients are streamed, and
+    left out of the roots.
+    """
+
+    FIELDS = {
+        "data.total_energy": 0,
+        "data.ci_coeff": 1,
+        "data.occupation": 2,
+        "active_orbs": 3,
+        "num_basis_funcs": 3,
+        "roots": 4,
+    }
+    STREAMED = (1,)
+
+    def __init__(self, as_array=False):
         rules = [
             RASSCFEnergy(),
-            RASSCFCiCoeff(),
-            RASSCFOccupation(),
+            RASSCFCiCoeff(as_array),
+            RASSCFOccupation(as_array),
             RASSCFOrbSpec(),
             RASSCFCIExpansionSpec()
         ]
         super().__init__("rasscf", rules)
 
     def reset(self):
-        results = [rule.reset() for rule in self.rules]
+        energies, ci_coeffs, occupations, orb_spec, ci_spec = super().reset()
         out = {}
         out["module"] = "rasscf"
         out["data"] = []
-        for i, root in enumerate(results[0]):
-            root_dict = {"root": i + 1}
-            root_dict["total_energy"] = root
-            root_dict["ci_coeff"] = results[1][i]
-            root_dict["occupation"] = results[2][i]
-            out["data"].append(root_dict)
-
-        return {**results[3], **results[4], **out}
+        if self.rules[1].sink is not None:
+            ci_coeffs = None
+        roots = log.zip_roots({
+            "total_energy": energies,
+            "ci_coeff": ci_coeffs,
+            "occupation": occupations
+        })
+        for i, root in enumerate(roots):
+            out["data"].append({"root": i + 1, **root})
+
+        return {**(orb_spec or {}), **(ci_spec or {}), **out}
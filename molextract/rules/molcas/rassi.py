@@ -14,16 +14,19 @@ class RASSIDipoleStrengths(Rule):
     def process_lines(self, start_line):
         self.skip(5)
         for line in self:
-            print(line)
             split = line.split()
             frum = split[0]
             to = split[1]
             osc_strength = split[2]
-            self.state.append({
+            record = {
                 "from": int(frum),
                 "to": int(to),
                 "osc_strength": float(osc_strength)
-            })
+            }
+            if self.sink is not None:
+                self.sink(self.rule_id(), record)
+            else:
+                self.state.append(record)
 
     def reset(self):
         copy = self.state.copy()
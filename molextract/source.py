@@ -0,0 +1,404 @@
+"""
+Line sources that can be handed to `Rule.set_iter`. Every source yields lines
+without their trailing newline, the same as splitting a string on '\\n'.
+"""
+import bz2
+import gzip
+import io
+import lzma
+import mmap
+import os
+import sys
+from bisect import bisect_left
+from itertools import accumulate, chain, repeat
+from operator import add
+from typing import IO, Any, Callable, Dict, Iterable, Iterator, List
+from typing import Optional, Tuple
+
+try:
+    import zstandard  # type: ignore
+except ImportError:
+    zstandard = None  # type: ignore
+
+STDIN_PATH = '-'
+
+# The magic bytes every file of each compression format begins with
+_MAGIC_GZIP = b'\x1f\x8b'
+_MAGIC_XZ = b'\xfd7zXZ\x00'
+_MAGIC_BZ2 = b'BZh'
+_MAGIC_ZSTD = b'\x28\xb5\x2f\xfd'
+_MAGIC_LEN = 6
+
+# How to open a compressed path in text mode, keyed by magic bytes
+_PATH_OPENERS: Dict[bytes, Callable[..., Any]] = {
+    _MAGIC_GZIP: gzip.open,
+    _MAGIC_XZ: lzma.open,
+    _MAGIC_BZ2: bz2.open,
+}
+# How to decompress an already open binary stream, keyed by magic bytes
+_STREAM_OPENERS: Dict[bytes, Callable[[IO[bytes]], Any]] = {
+    _MAGIC_GZIP: lambda f: gzip.GzipFile(fileobj=f, mode='rb'),
+    _MAGIC_XZ: lzma.LZMAFile,
+    _MAGIC_BZ2: bz2.BZ2File,
+}
+if zstandard is not None:
+    _PATH_OPENERS[_MAGIC_ZSTD] = zstandard.open
+    _STREAM_OPENERS[_MAGIC_ZSTD] = (
+        lambda f: zstandard.ZstdDecompressor().stream_reader(f))
+
+
+def compression(magic: bytes) -> Optional[bytes]:
+    """
+    Detect the compression format of data from its first bytes
+
+    :param magic: at least the first 6 bytes of the data
+    :return: the magic bytes of the format, or None if the data is not
+        compressed in a known format
+    """
+    for fmt in [_MAGIC_GZIP, _MAGIC_XZ, _MAGIC_BZ2, _MAGIC_ZSTD]:
+        if magic.startswith(fmt):
+            return fmt
+    return None
+
+
+def is_compressed(path: str) -> bool:
+    """
+    Whether the file at the given path is compressed in a format that
+    `open_text` decompresses
+
+    :param path: the path to the file, or '-' for stdin
+    """
+    if path == STDIN_PATH:
+        return compression(_stdin_buffer().peek(_MAGIC_LEN)) is not None
+
+    with open(path, 'rb') as f:
+        return compression(f.read(_MAGIC_LEN)) is not None
+
+
+def open_text(path: str, encoding: str = 'utf-8') -> IO[str]:
+    """
+    Open a file in text mode, transparently decompressing gzip, xz and bzip2
+    files (and zstd files if the `zstandard` package is installed). The
+    format is detected from the content of the file, not its extension.
+    Decompression is streamed, so the decompressed file is never held in
+    memory or written to disk.
+
+    :param path: the path to the file, or '-' to read from stdin
+    :param encoding: the encoding of the (decompressed) text, defaults to
+        'utf-8'
+    :return: the open text stream
+    """
+    return io.TextIOWrapper(open_binary(path), encoding=encoding)
+
+
+def open_binary(path: str) -> IO[bytes]:
+    """
+    Open a file in binary mode, transparently decompressing it in the same way
+    as `open_text`
+
+    :param path: the path to the file, or '-' to read from stdin
+    :return: the open binary stream of the (decompressed) data
+    """
+    if path == STDIN_PATH:
+        buffer = _stdin_buffer()
+        fmt = compression(buffer.peek(_MAGIC_LEN))
+        if fmt is not None:
+            buffer = io.BufferedReader(_stream_opener(fmt)(buffer))
+        return buffer
+
+    with open(path, 'rb') as f:
+        fmt = compression(f.read(_MAGIC_LEN))
+
+    if fmt is None:
+        return open(path, 'rb')
+
+    opener = _PATH_OPENERS.get(fmt)
+    if opener is None:
+        raise ValueError(f"{path} is zstd compressed, install the zstandard "
+                         "package to read it")
+    return opener(path, 'rb')
+
+
+def _stdin_buffer() -> io.BufferedReader:
+    # Peeking at the magic bytes requires a buffered reader
+    buffer = sys.stdin.buffer
+    if not isinstance(buffer, io.BufferedReader):
+        buffer = io.BufferedReader(buffer)  # type: ignore
+    return buffer
+
+
+def _stream_opener(fmt: bytes) -> Callable[[IO[bytes]], Any]:
+    opener = _STREAM_OPENERS.get(fmt)
+    if opener is None:
+        raise ValueError("stdin is zstd compressed, install the zstandard "
+                         "package to read it")
+    return opener
+
+
+def iter_stream_lines(stream: Iterable[str]) -> Iterator[str]:
+    """
+    Lazily yield the lines of an open text stream (e.g. a file object) with
+    the trailing newline removed. Only one line is held in memory at a time.
+
+    :param stream: the stream to read lines from
+    :return: an iterator over the lines of the stream
+    """
+    return map(str.rstrip, stream, repeat('\n'))
+
+
+def iter_binary_lines(stream: Iterable[bytes]) -> Iterator[bytes]:
+    """
+    Lazily yield the lines of an open binary stream without decoding them,
+    with the trailing newline (either '\\n' or '\\r\\n') removed
+
+    :param stream: the stream to read lines from
+    :return: an iterator over the lines of the stream
+    """
+    return map(bytes.rstrip, stream, repeat(b'\r\n'))
+
+
+def decode_lines(lines: Iterable[bytes],
+                 encoding: str = 'utf-8') -> Iterator[str]:
+    """
+    Lazily decode lines of bytes. Only one line is pulled from the given
+    lines at a time, so other iterators can keep pulling undecoded lines from
+    the same underlying iterator in between.
+
+    :param lines: the lines to decode
+    :param encoding: the encoding of the lines, defaults to 'utf-8'
+    :return: an iterator over the decoded lines
+    """
+    return map(bytes.decode, lines, repeat(encoding))
+
+
+class MmapLines:
+    """
+    An iterator over the lines of a file backed by a read-only memory map of
+    that file. Lines are decoded out of the mapped region a chunk at a time as
+    they are requested, so no part of the file is read up front and the pages
+    of the file can be shared by the OS across concurrent parses of the same
+    file.
+
+    The byte offset of the line most recently returned is available on demand
+    via the `offset` property, and `seek` moves the iterator to any byte
+    offset.
+
+        with MmapLines("styrene.log") as lines:
+            rule.set_iter(lines)
+
+    With an `encoding` of None lines are not decoded at all, and are returned
+    as bytes (see `Rule.set_raw_iter`).
+
+    An instance should be closed (or used as a context manager) once it is no
+    longer needed to release the memory map.
+    """
+
+    CHUNK_SIZE = 1 << 20
+
+    def __init__(self, path: str, encoding: Optional[str] = 'utf-8'):
+        """
+        :param path: the path to the file to map
+        :param encoding: the encoding used to decode lines, defaults to
+            'utf-8'. If None lines are returned as bytes.
+        """
+        self.encoding = encoding
+        self._newline: Any = '\n' if encoding is not None else b'\n'
+        self._crlf: Any = '\r\n' if encoding is not None else b'\r\n'
+        self._file = open(path, 'rb')
+        self._size = os.fstat(self._file.fileno()).st_size
+        self._map: Optional[mmap.mmap] = None
+        if self._size > 0:
+            # Zero length files can not be memory mapped
+            self._map = mmap.mmap(self._file.fileno(),
+                                  0,
+                                  access=mmap.ACCESS_READ)
+
+        # The currently decoded chunk of lines, the byte offset that chunk
+        # starts at and the index of the next line in the chunk to return
+        self._lines: List[Any] = []
+        self._num_lines = 0
+        self._index = 0
+        self._chunk_start = 0
+        self._chunk_end = 0
+        # The byte offsets the lines of the chunk start at, found only once
+        # they are needed
+        self._starts: Optional[List[int]] = None
+
+    @property
+    def offset(self) -> int:
+        """
+        The byte offset of the line most recently returned
+        """
+        return self._line_offset(self._index - 1)
+
+    def tell(self) -> int:
+        """
+        :return: the byte offset of the next line to be returned
+        """
+        if self._index >= self._num_lines:
+            return self._chunk_end
+        return self._line_offset(self._index)
+
+    def seek(self, offset: int):
+        """
+        Move the iterator so that the next line returned begins at the given
+        byte offset
+
+        :param offset: the byte offset
+        """
+        if not 0 <= offset <= self._size:
+            raise ValueError(f'offset {offset} is out of range')
+        self._lines = []
+        self._num_lines = 0
+        self._index = 0
+        self._chunk_start = offset
+        self._chunk_end = offset
+        self._starts = None
+
+    def skip_to(self, find: Callable[[Any, int], int],
+                matches: Callable[[Any], bool]) -> Any:
+        """
+        Move the iterator past the next line that matches, without reading
+        the lines in between. Instead of testing every line, `find` searches
+        the mapped file itself for candidate lines, which are then tested
+        with `matches`.
+
+        :param find: a function taking the memory map and a byte offset, and
+            returning the offset of the next candidate match at or after that
+            offset (or -1 if there is none). Every matching line must hold a
+            candidate, e.g. `find` can search for literal text every match
+            contains.
+        :param matches: a function testing whether a line (decoded the same
+            as lines returned by this iterator) matches
+        :return: the matching line, or None if no line matches in which case
+            the iterator is exhausted
+        """
+        line, start, end = self._find_line(find, matches)
+        self._move_to(min(end + 1, self._size))
+        return line
+
+    def region_to(self, find: Callable[[Any, int], int],
+                  matches: Callable[[Any], bool]) -> Tuple[Any, int, int, Any]:
+        """
+        Move the iterator past the next line that matches just as `skip_to`
+        does, and return where the lines skipped over lie in the memory map so
+        they can be searched as a whole instead of line by line.
+
+        :param find: see `skip_to`
+        :param matches: see `skip_to`
+        :return: a tuple of the memory map, the byte offsets the skipped lines
+            start and end at, and the matching line (or None if no line
+            matches, the skipped lines then run to the end of the file)
+        """
+        pos = self.tell()
+        line, start, end = self._find_line(find, matches)
+        self._move_to(min(end + 1, self._size))
+        return self._map or b'', pos, start, line
+
+    def _find_line(self, find: Callable[[Any, int], int],
+                   matches: Callable[[Any], bool]) -> Tuple[Any, int, int]:
+        # The next line from here that matches and the byte offsets it starts
+        # and ends at, or None and the end of the file if none match
+        pos = self.tell()
+        while self._map is not None:
+            found = find(self._map, pos)
+            if found == -1 or found >= self._size:
+                break
+
+            newline = self._map.rfind(b'\n', pos, found)
+            start = pos if newline == -1 else newline + 1
+            end = self._map.find(b'\n', found)
+            if end == -1:
+                end = self._size
+            line: Any = self._map[start:end]
+            if line.endswith(b'\r'):
+                line = line[:-1]
+            if self.encoding is not None:
+                line = line.decode(self.encoding)
+            pos = min(end + 1, self._size)
+            if matches(line):
+                return line, start, end
+
+        return None, self._size, self._size
+
+    def _move_to(self, offset: int):
+        # Seek to the start of a line, within the current chunk if possible to
+        # avoid decoding it again
+        if self._chunk_start <= offset < self._chunk_end:
+            self._index = bisect_left(self._line_starts(), offset)
+        else:
+            self.seek(offset)
+
+    def close(self):
+        """
+        Release the memory map and the underlying file
+        """
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def _line_offset(self, index: int) -> int:
+        if index <= 0 or self._map is None:
+            return self._chunk_start
+        starts = self._line_starts()
+        return starts[index] if index < len(starts) else self._chunk_end
+
+    def _line_starts(self) -> List[int]:
+        if self._starts is None and self._map is not None:
+            start = self._chunk_start
+            chunk = self._map[start:self._chunk_end]
+            lengths = map(add, map(len, chunk.split(b'\n')), repeat(1))
+            self._starts = list(accumulate(chain([start], lengths)))
+        return self._starts or [self._chunk_start]
+
+    def _next_chunk(self) -> Any:
+        start = self._chunk_end
+        if start >= self._size or self._map is None:
+            raise StopIteration
+
+        # Always end a chunk on a line boundary, even if a single line is
+        # longer than the chunk size
+        limit = start + self.CHUNK_SIZE
+        if limit >= self._size:
+            end = self._size
+        else:
+            end = self._map.rfind(b'\n', start, limit)
+            if end == -1:
+                end = self._map.find(b'\n', limit)
+            end = self._size if end == -1 else end + 1
+
+        text: Any = self._map[start:end]
+        if self.encoding is not None:
+            text = text.decode(self.encoding)
+        newline = self._newline
+        if self._crlf in text:
+            # Match universal newline handling of text mode files
+            text = text.replace(self._crlf, newline)
+        if text.endswith(newline):
+            text = text[:-1]
+
+        self._lines = text.split(newline)
+        self._num_lines = len(self._lines)
+        self._index = 1
+        self._chunk_start = start
+        self._chunk_end = end
+        self._starts = None
+        return self._lines[0]
+
+    def __enter__(self) -> 'MmapLines':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __iter__(self) -> Iterator[Any]:
+        return self
+
+    def __next__(self) -> Any:
+        index = self._index
+        if index < self._num_lines:
+            self._index = index + 1
+            return self._lines[index]
+
+        return self._next_chunk()
@@ -0,0 +1,85 @@
+"""
+Lightweight, picklable descriptions of rule trees. Rules hold parsing state
+and a live iterator, so instead of sharing one rule tree between processes
+or threads, share a RuleSpec and build a fresh rule tree from it wherever one
+is needed.
+"""
+from typing import Any, Type
+
+from molextract.rule import Rule
+
+
+class RuleSpec:
+    """
+    A RuleSpec records a Rule class along with the arguments to construct it
+    with. Any argument may itself be a RuleSpec (or a list / tuple / dict
+    holding RuleSpecs), so a whole rule tree can be described without
+    creating any rules:
+
+        spec = RuleSpec(log.LogRule,
+                        rules=[RuleSpec(rasscf.RASSCFModule),
+                               RuleSpec(mcpdft.MCPDFTModule)])
+        rule = spec.build()
+
+    A RuleSpec only holds the class and its arguments, so it is cheap to
+    pickle as long as the class is importable and the arguments are
+    picklable. Calling a RuleSpec is the same as calling `build`, so it can
+    be used anywhere a rule factory is expected (see `Parser.from_factory`).
+    """
+
+    def __init__(self, rule_cls: Type[Rule], *args, **kwargs):
+        """
+        :param rule_cls: the class of the rule to build
+        :param args: positional arguments to construct the rule with
+        :param kwargs: keyword arguments to construct the rule with
+        """
+        self.rule_cls = rule_cls
+        self.args = args
+        self.kwargs = kwargs
+
+    def build(self) -> Rule:
+        """
+        Construct a new rule tree from this spec, building any nested specs
+
+        :return: the new rule
+        """
+        args = [_build(arg) for arg in self.args]
+        kwargs = {key: _build(value) for key, value in self.kwargs.items()}
+        return self.rule_cls(*args, **kwargs)
+
+    def __call__(self) -> Rule:
+        return self.build()
+
+    def __eq__(self, other: Any) -> bool:
+        if not isinstance(other, RuleSpec):
+            return NotImplemented
+        return (self.rule_cls, self.args,
+                self.kwargs) == (other.rule_cls, other.args, other.kwargs)
+
+    def __hash__(self) -> int:
+        # Consistent with __eq__, lists and dicts of arguments (e.g. the
+        # rules of a RuleListRule) are hashed by their contents
+        return hash((self.rule_cls, _freeze(self.args), _freeze(self.kwargs)))
+
+    def __repr__(self) -> str:
+        args = [repr(arg) for arg in self.args]
+        args += [f"{key}={value!r}" for key, value in self.kwargs.items()]
+        return f"RuleSpec({', '.join([self.rule_cls.__name__] + args)})"
+
+
+def _build(value: Any) -> Any:
+    if isinstance(value, RuleSpec):
+        return value.build()
+    if isinstance(value, (list, tuple)):
+        return type(value)(_build(item) for item in value)
+    if isinstance(value, dict):
+        return {key: _build(item) for key, item in value.items()}
+    return value
+
+
+def _freeze(value: Any) -> Any:
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    if isinstance(value, dict):
+        return frozenset((key, _freeze(item)) for key, item in value.items())
+    return value
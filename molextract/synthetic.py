@@ -0,0 +1,427 @@
+"""
+Generate synthetic OpenMolcas and Gaussian logs of any size, together with the
+output the rules of molextract are expected to parse from them, to test and
+benchmark parsing at a scale the bundled test logs do not reach.
+
+A log is a number of complete runs one after the other. Every Molcas run has
+gateway, seward and scf modules, a RASSCF module with the given number of
+roots, active orbitals and rows of CI coefficients per root, an MC-PDFT
+module, any number of grid_it modules and a RASSI module. Every Gaussian run
+is a TDDFT calculation with the given number of excited states. The values in
+each run are random, but the same seed always gives the same log.
+
+    python -m molextract.synthetic molcas big.log --size-mb 500 --roots 10
+    python -m molextract.synthetic gaussian big.log --runs 100 --truth big.json
+"""
+import argparse
+import random
+import sys
+from typing import Any, Callable, Dict, List, Tuple
+
+from molextract import output
+from molextract.rule import Rule
+from molextract.rules.gaussian import general as gaussian_general
+from molextract.rules.gaussian import log as gaussian_log
+from molextract.rules.gaussian import tddft
+from molextract.rules.molcas import general, log, mcpdft, rasscf, rassi
+
+# The run text and the output of `molcas_rule` / `gaussian_rule` for it
+Run = Tuple[str, List[Any]]
+
+DATE = "Sun Apr  3 00:39:57 2022"
+SEPARATOR = "-" * 95
+MB = 1 << 20
+
+
+def molcas_rule() -> Rule:
+    """
+    :return: the rule tree whose output for each Molcas run is given by
+        `molcas_run`
+    """
+    return log.LogRule(rules=[
+        rasscf.RASSCFModule(),
+        mcpdft.MCPDFTModule(),
+        general.MolProps(),
+        rassi.RASSIModule(),
+    ])
+
+
+def gaussian_rule() -> Rule:
+    """
+    :return: the rule tree whose output for each Gaussian run is given by
+        `gaussian_run`
+    """
+    return gaussian_log.LogRule(
+        rules=[tddft.TDDFTExcitedState(),
+               gaussian_general.DipoleMoment()])
+
+
+def molcas_run(rng: random.Random,
+               roots: int = 5,
+               active_orbs: int = 12,
+               ci_rows: int = 5,
+               modules: int = 5,
+               filler_lines: int = 50) -> Run:
+    """
+    Generate a single Molcas run
+
+    :param rng: the random number generator to draw values from
+    :param roots: the number of RASSCF roots, defaults to 5
+    :param active_orbs: the number of active orbitals, defaults to 12
+    :param ci_rows: the number of CI coefficients printed per root, defaults
+        to 5
+    :param modules: the number of grid_it modules, defaults to 5
+    :param filler_lines: the number of lines no rule parses in every module,
+        defaults to 50
+    :return: the text of the run and the output of `molcas_rule` for it
+    """
+    lines = ["   This run of MOLCAS is using the pymolcas driver", ""]
+    for name in ("gateway", "seward"):
+        lines.extend(_module(name, _filler(rng, filler_lines)))
+
+    dipole = [_number(rng, -10, 10, "11.4E") for _ in range(3)]
+    total = _number(rng, 0, 20, "11.4E")
+    lines.extend(
+        _module("scf", [
+            *_filler(rng, filler_lines),
+            "++    Molecular properties:",
+            "      ---------------------",
+            " ",
+            "      Charge (e):",
+            "                      =    0.0000",
+            "      Dipole Moment (Debye):",
+            "      Origin of the operator (Ang)=    0.0000    0.0000"
+            "    0.0000",
+            "                   X= {}               Y= {}               "
+            "Z= {}           Total= {}".format(*dipole, total),
+            "--",
+            " ",
+        ]))
+    props = [{
+        "dipole": dict(zip("xyz", map(float, dipole)), total=float(total))
+    }]
+
+    rasscf_lines, rasscf_out = _rasscf(rng, roots, active_orbs, ci_rows)
+    lines.extend(_module("rasscf", _filler(rng, filler_lines) + rasscf_lines))
+
+    mcpdft_lines = _filler(rng, filler_lines)
+    mcpdft_data = []
+    for i, root in enumerate(rasscf_out["data"]):
+        total_energy = _number(rng, root["total_energy"] - 8,
+                               root["total_energy"] - 7, ".8f")
+        mcpdft_lines.extend([
+            f"      MCSCF reference energy{root['total_energy']:48.8f}",
+            " ",
+            f"      Total MC-PDFT energy for state{i + 1:5d}"
+            f"{total_energy:>35}",
+            " ",
+        ])
+        mcpdft_data.append({
+            "mcsf_ref_energy": root["total_energy"],
+            "total_energy": float(total_energy)
+        })
+    lines.extend(_module("mcpdft", mcpdft_lines))
+    mcpdft_out = {"module": "mcpdft", "roots": roots, "data": mcpdft_data}
+
+    for _ in range(modules):
+        lines.extend(_module("grid_it", _filler(rng, filler_lines)))
+
+    rassi_lines = _filler(rng, filler_lines) + [
+        "++ Dipole transition strengths (spin-free states):",
+        "   -----------------------------------------------",
+        "     for osc. strength at least  1.00000000E-05",
+        " ",
+        "      From   To        Osc. strength     Einstein coefficients "
+        "Ax, Ay, Az (sec-1)    Total A (sec-1)",
+        "     " + SEPARATOR,
+    ]
+    strengths = []
+    for frum in range(1, roots + 1):
+        for to in range(frum + 1, roots + 1):
+            strength = _number(rng, 0, 1, ".8E")
+            einstein = " ".join(
+                [_number(rng, 0, 1e6, "15.8E") for _ in range(4)])
+            rassi_lines.append(
+                f"     {frum:5d}{to:5d}       {strength}  {einstein}")
+            strengths.append({
+                "from": frum,
+                "to": to,
+                "osc_strength": float(strength)
+            })
+    rassi_lines.extend(["     " + SEPARATOR, "--", " "])
+    lines.extend(_module("rassi", rassi_lines))
+
+    lines.extend([
+        "    Timing: Wall=105670.73 User=3058290.52 System=188935.72",
+        "",
+    ])
+    return "\n".join(lines), [rasscf_out, mcpdft_out, props, [strengths]]
+
+
+def gaussian_run(rng: random.Random,
+                 states: int = 50,
+                 filler_lines: int = 50) -> Run:
+    """
+    Generate a single Gaussian TDDFT run
+
+    :param rng: the random number generator to draw values from
+    :param states: the number of excited states, defaults to 50
+    :param filler_lines: the number of lines no rule parses before, between
+        and after the excited states, defaults to 50
+    :return: the text of the run and the output of `gaussian_rule` for it
+    """
+    lines = [" Entering Gaussian System, Link 0=g16"]
+    lines.extend(_filler(rng, filler_lines))
+    lines.extend([" Excitation energies and oscillator strengths:", " "])
+
+    excited_states = []
+    ev = 2.0
+    for i in range(1, states + 1):
+        ev += rng.uniform(0.001, 0.2)
+        state = {
+            "eV": round(ev, 4),
+            "nm": round(1239.84193 / ev, 2),
+            "f": round(rng.uniform(0, 2), 4)
+        }
+        lines.extend([
+            f" Excited State{i:4d}:      Singlet-A   {state['eV']:9.4f} eV "
+            f"{state['nm']:7.2f} nm  f={state['f']:.4f}  <S**2>=0.000",
+            f"     {147 - i % 3} ->{149 + i % 2}{rng.uniform(-1, 1):15.5f}",
+            f"     {148 - i % 2} ->{150 - i % 2}{rng.uniform(-1, 1):15.5f}",
+            " ",
+        ])
+        excited_states.append(state)
+    lines.extend(_filler(rng, filler_lines))
+
+    dipole = [_number(rng, -10, 10, "19.4f") for _ in range(3)]
+    total = _number(rng, 0, 20, "19.4f")
+    lines.extend([
+        " Dipole moment (field-independent basis, Debye):",
+        "    X={}    Y={}    Z={}  Tot={}".format(*dipole, total),
+        " Quadrupole moment (field-independent basis, Debye-Ang):",
+    ])
+    lines.extend(_filler(rng, filler_lines))
+    lines.extend([f" Normal termination of Gaussian 16 at {DATE}.", ""])
+
+    moment = dict(zip("xyz", map(float, dipole)), total=float(total))
+    return "\n".join(lines), [excited_states, moment]
+
+
+RUNS: Dict[str, Callable[..., Run]] = {
+    "molcas": molcas_run,
+    "gaussian": gaussian_run,
+}
+RULES: Dict[str, Callable[[], Rule]] = {
+    "molcas": molcas_rule,
+    "gaussian": gaussian_rule,
+}
+
+
+def write_log(path: str,
+              program: str,
+              runs: int = 1,
+              size_mb: float = 0,
+              seed: int = 0,
+              **options) -> List[List[Any]]:
+    """
+    Write a synthetic log of at least the given number of runs and size
+
+    :param path: the path of the log to write
+    :param program: one of "molcas" or "gaussian"
+    :param runs: the least number of runs to write, defaults to 1
+    :param size_mb: the least size of the log in MB, defaults to 0
+    :param seed: the seed of the random values, defaults to 0
+    :param options: passed on to `molcas_run` or `gaussian_run`
+    :return: the output of the rule of the program (see `RULES`) for every
+        run of the log, i.e. what `Parser.iter_feed_file` yields for the log
+    """
+    make_run = RUNS[program]
+    rng = random.Random(seed)
+    expected: List[List[Any]] = []
+    size = 0
+    with open(path, "w") as f:
+        while len(expected) < runs or size < size_mb * MB:
+            text, out = make_run(rng, **options)
+            f.write(text)
+            size += len(text)
+            expected.append(out)
+    return expected
+
+
+def _rasscf(rng: random.Random, roots: int, active_orbs: int,
+            ci_rows: int) -> Tuple[List[str], Dict[str, Any]]:
+    num_basis_funcs = active_orbs * 10
+    lines = [
+        "      Cartesian coordinates in Angstrom:",
+        "      " + "-" * 53,
+        "      No.  Label        X            Y            Z        ",
+        "      " + "-" * 53,
+    ]
+    for i in range(1, active_orbs + 1):
+        coords = " ".join(_number(rng, -4, 4, "12.8f") for _ in range(3))
+        lines.append(f"      {i:2d}   {'C' + str(i):<6} {coords}")
+    lines.extend([
+        "      " + "-" * 53,
+        "      Nuclear repulsion energy =  399.59906781",
+        " ",
+        "++    Orbital specifications:",
+        "      -----------------------",
+        " ",
+        f"      Symmetry species{1:27d}",
+        f"      Inactive orbitals{27:26d}",
+        f"      Active orbitals{active_orbs:28d}",
+        f"      Secondary orbitals{num_basis_funcs - 27 - active_orbs:25d}",
+        f"      Number of basis functions{num_basis_funcs:18d}",
+        "--",
+        " ",
+        "++    CI expansion specifications:",
+        "      ----------------------------",
+        " ",
+        f"      Number of CSFs{19404:29d}",
+        f"      Number of root(s) required{roots:15d}",
+        "--",
+        " ",
+    ])
+
+    # Roots a few mHartree apart, lowest first
+    energies = []
+    value = rng.uniform(-2000, -300)
+    for _ in range(roots):
+        energies.append(format(value, ".8f"))
+        value += rng.uniform(0, 0.05)
+
+    ci_coeffs = []
+    for i, energy in enumerate(energies):
+        lines.extend([
+            f"      printout of CI-coefficients larger than  0.05 for root"
+            f"{i + 1:3d}",
+            f"      energy={float(energy):15.6f}",
+            f"      conf/sym  {'1' * active_orbs}     Coeff  Weight",
+        ])
+        rows = []
+        conf_sym = 0
+        for _ in range(ci_rows):
+            conf_sym += rng.randint(1, 1000)
+            occupation = "".join(rng.choices("2ud0", k=active_orbs))
+            coeff = _number(rng, -1, 1, "9.5f")
+            weight = f"{float(coeff) ** 2:.5f}"
+            lines.append(f"      {conf_sym:8d}  {occupation} {coeff} {weight}")
+            rows.append([conf_sym, occupation, float(coeff), float(weight)])
+        lines.append(" ")
+        ci_coeffs.append(rows)
+
+    occupations = []
+    for i in range(roots):
+        lines.append("      Natural orbitals and occupation numbers for root"
+                     f"{i + 1:3d}")
+        values = [_number(rng, 0, 2, "11.6f") for _ in range(active_orbs)]
+        for start in range(0, active_orbs, 10):
+            prefix = "      sym 1:" if start == 0 else "            "
+            lines.append(prefix + "".join(values[start:start + 10]))
+        lines.append(" ")
+        occupations.append([float(value) for value in values])
+
+    for i, energy in enumerate(energies):
+        lines.append(f"::    RASSCF root number{i + 1:3d} Total energy:"
+                     f"{energy:>16}")
+
+    data = [{
+        "root": i + 1,
+        "total_energy": float(energy),
+        "ci_coeff": ci_coeffs[i],
+        "occupation": occupations[i]
+    } for i, energy in enumerate(energies)]
+    return lines, {
+        "active_orbs": active_orbs,
+        "num_basis_funcs": num_basis_funcs,
+        "roots": roots,
+        "module": "rasscf",
+        "data": data
+    }
+
+
+def _module(name: str, lines: List[str]) -> List[str]:
+    return [
+        f"--- Start Module: {name} at {DATE} ---",
+        " ",
+        *lines,
+        f"--- Stop Module: {name} at {DATE} /rc=_RC_ALL_IS_WELL_ ---",
+        " ",
+    ]
+
+
+def _filler(rng: random.Random, count: int) -> List[str]:
+    # Lines that look like the tables of orbital energies found throughout
+    # logs, which no rule parses
+    return [
+        f"      {i:6d}{rng.uniform(-20, 20):16.8f}{rng.uniform(0, 2):10.4f}"
+        for i in range(1, count + 1)
+    ]
+
+
+def _number(rng: random.Random, low: float, high: float, fmt: str) -> str:
+    # A random number as printed in the log, whose float value is the value
+    # the rules parse
+    return format(rng.uniform(low, high), fmt)
+
+
+def main(args=None):
+    """
+    Write a synthetic log from the command line
+
+    :param args: the command line arguments, defaults to None. If None
+        arguments will be pulled from the command line
+    """
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("program", choices=sorted(RUNS))
+    parser.add_argument("path", help="the path of the log to write")
+    parser.add_argument("--runs",
+                        type=int,
+                        default=1,
+                        help="the least number of runs to write, defaults "
+                        "to 1")
+    parser.add_argument("--size-mb",
+                        type=float,
+                        default=0,
+                        help="the least size of the log in MB, defaults to 0")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--filler-lines", type=int, default=50)
+    parser.add_argument("--roots", type=int, help="molcas only")
+    parser.add_argument("--active-orbs", type=int, help="molcas only")
+    parser.add_argument("--ci-rows", type=int, help="molcas only")
+    parser.add_argument("--modules", type=int, help="molcas only")
+    parser.add_argument("--states", type=int, help="gaussian only")
+    parser.add_argument("--truth",
+                        help="also write the expected output of every run "
+                        "to this path as JSON")
+    parsed_args = parser.parse_args(args)
+
+    names = {
+        "molcas": ["roots", "active_orbs", "ci_rows", "modules"],
+        "gaussian": ["states"],
+    }
+    options = {"filler_lines": parsed_args.filler_lines}
+    for program, program_names in names.items():
+        for name in program_names:
+            value = getattr(parsed_args, name)
+            if value is None:
+                continue
+            if program != parsed_args.program:
+                parser.error(f"--{name.replace('_', '-')} is {program} only")
+            options[name] = value
+
+    expected = write_log(parsed_args.path,
+                         parsed_args.program,
+                         runs=parsed_args.runs,
+                         size_mb=parsed_args.size_mb,
+                         seed=parsed_args.seed,
+                         **options)
+    if parsed_args.truth is not None:
+        with open(parsed_args.truth, "w") as f:
+            output.dump(expected, f)
+    print(f"wrote {len(expected)} runs to {parsed_args.path}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+"""
+Incrementally parse a log file that is still being written to, such as the
+log of a running Molcas job.
+"""
+import contextlib
+import os
+import queue
+import threading
+from typing import Any, Callable, Dict, Generator, List, Optional, Tuple
+
+from molextract.rule import Rule, patch_methods
+from molextract.rules.abstract import RuleListRule
+
+# A chunk of complete lines and the byte offset each line starts at, followed
+# by the offset the chunk ends at
+_Chunk = Tuple[List[str], List[int]]
+
+
+class TailParser:
+    """
+    A TailParser parses a growing file one `poll` at a time. Each poll only
+    reads the bytes appended since the previous poll, a chunk at a time, so
+    polling a running job costs O(new data) however large the log is.
+
+    The top-level rule must be a RuleListRule (e.g. a `LogRule`). Every time
+    one of its rules finishes processing its section (e.g. a
+    `ModuleRule("rasscf")` reaching "--- Stop Module: rasscf") the output of
+    that rule is reset and returned by `poll` as a (rule_id, output) record:
+
+        with TailParser(log.LogRule([rasscf.RASSCFModule()]), path) as tail:
+            while job_is_running():
+                for rule_id, output in tail.poll():
+                    print(rule_id, output)
+                print("inside", tail.stack)
+                time.sleep(60)
+
+    A TailParser must be closed, as above or with `close`, to stop the
+    thread running the rules and restore the rules it changed.
+
+    The rules run in a thread of their own, which waits for more lines
+    whenever the data ends part way through a section (the job is still
+    writing it). The rules are thereby suspended between polls exactly where
+    they stopped, e.g. inside `ModuleRule("rasscf")`, and carry on with the
+    lines of the next poll, so no section is ever parsed twice. `stack`
+    holds the rule_ids of the rules processing a section, outermost first.
+    Only complete lines are ever parsed, with the line endings ('\\n' or
+    '\\r\\n') removed.
+
+    With `stream` set, the records rules stream as they parse them (see
+    `Rule.set_sink`) are returned by `poll` as well, giving the partial
+    output of the sections that are not complete yet.
+
+    `offset` and `in_rule` may be saved and passed back in to resume polling
+    from another process. As the state of the rules can not be saved,
+    `offset` is the start of the section being processed, if any, which is
+    then parsed again from its start line.
+    """
+
+    def __init__(self,
+                 rule: RuleListRule,
+                 path: str,
+                 offset: int = 0,
+                 in_rule: bool = False,
+                 encoding: str = 'utf-8',
+                 stream: bool = False,
+                 chunk_size: int = 1 << 20,
+                 max_chunks: int = 4):
+        """
+        :param rule: the top-level rule
+        :param path: the path to the file to parse
+        :param offset: the byte offset to start parsing from, defaults to 0
+        :param in_rule: whether `offset` lies within the top-level rule,
+            defaults to False
+        :param encoding: the encoding of the file, defaults to 'utf-8'
+        :param stream: whether the records streamed by rules are returned by
+            `poll` too, defaults to False
+        :param chunk_size: the number of bytes read at a time, defaults to
+            1 MB
+        :param max_chunks: the number of chunks read ahead of the rules,
+            defaults to 4
+        """
+        if not isinstance(rule, RuleListRule):
+            raise TypeError("TailParser requires a RuleListRule")
+
+        self.rule = rule
+        self.path = path
+        self.encoding = encoding
+        self.chunk_size = chunk_size
+        self.stack: List[str] = []
+        self._records: List[Tuple[str, Any]] = []
+        self._chunks: queue.Queue = queue.Queue(max_chunks)
+        self._error: Optional[BaseException] = None
+        self._ended = False
+        # The byte offset up to which the file was read, the offsets of the
+        # line last read by the rules and of the section being processed
+        self._read_offset = offset
+        self._line = (offset, offset)
+        self._section_start = offset
+        # Undoes the changes made to the rules on close
+        self._restore = contextlib.ExitStack()
+
+        self._restore.enter_context(self._set_sinks(rule, stream))
+        self._restore.enter_context(patch_methods(rule, self._track))
+        self._thread = self._start(in_rule)
+
+    def __enter__(self) -> "TailParser":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def offset(self) -> int:
+        """
+        The byte offset polling may be resumed from, see `in_rule`
+        """
+        if len(self.stack) > 1:
+            return self._section_start
+        return self._line[1]
+
+    @property
+    def in_rule(self) -> bool:
+        """
+        Whether `offset` lies within the top-level rule
+        """
+        return bool(self.stack)
+
+    def poll(self) -> List[Tuple[str, Any]]:
+        """
+        Parse any complete lines appended to the file since the last poll
+
+        :return: a (rule_id, output) record for every rule that finished
+            processing a section, in the order they finished
+        """
+        if os.path.getsize(self.path) < self._read_offset:
+            # The file was truncated or replaced, start over
+            self._stop()
+            with contextlib.suppress(Exception):
+                self.rule.reset()
+            self._read_offset = 0
+            self._line = (0, 0)
+            self.stack.clear()
+            self._thread = self._start(False)
+
+        with open(self.path, 'rb') as f:
+            f.seek(self._read_offset)
+            data = b''
+            for block in iter(lambda: f.read(self.chunk_size), b''):
+                # Only parse complete lines, a partial last line is read
+                # again later
+                data += block
+                end = data.rfind(b'\n') + 1
+                if end:
+                    self._put(self._split(data[:end], self._read_offset))
+                    self._read_offset += end
+                    data = data[end:]
+
+        self._chunks.join()
+        if self._error is not None:
+            raise self._error
+
+        records = self._records[:]
+        self._records.clear()
+        return records
+
+    def close(self):
+        """
+        Stop the thread running the rules, and restore the rules
+        """
+        self._stop()
+        self._restore.close()
+
+    def _add_record(self, rule_id: str, output: Any):
+        self._records.append((rule_id, output))
+
+    @contextlib.contextmanager
+    def _set_sinks(self, rule: RuleListRule,
+                   stream: bool) -> Generator[None, None, None]:
+        # Collect the records of the rule for `poll`
+        section_sink, sink = rule.section_sink, rule.sink
+        rule.section_sink = self._add_record
+        if stream:
+            rule.set_sink(self._add_record)
+        try:
+            yield
+        finally:
+            rule.section_sink = section_sink
+            if stream:
+                rule.set_sink(sink)
+
+    def _start(self, in_rule: bool) -> threading.Thread:
+        self._error = None
+        self._ended = False
+        thread = threading.Thread(target=self._run, args=(in_rule,))
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def _stop(self):
+        if self._thread.is_alive():
+            self._chunks.put(None)
+            self._thread.join()
+
+    def _put(self, chunk: _Chunk):
+        if self._error is None:
+            self._chunks.put(chunk)
+
+    def _split(self, data: bytes, offset: int) -> _Chunk:
+        lines = []
+        starts = [offset]
+        for raw_line in data.split(b'\n')[:-1]:
+            starts.append(starts[-1] + len(raw_line) + 1)
+            if raw_line.endswith(b'\r'):
+                raw_line = raw_line[:-1]
+            lines.append(raw_line.decode(self.encoding))
+        return lines, starts
+
+    def _run(self, in_rule: bool):
+        # Run the top-level rule over the lines of every poll, the same way
+        # a Parser does
+        lines = self._iter_lines()
+        try:
+            self.rule.set_iter(lines)
+            if in_rule:
+                self._run_rule("")
+            for line in lines:
+                if self.rule.start_tag_matches(line):
+                    self._run_rule(line)
+        except Exception as e:
+            if not self._ended:
+                self._error = e
+        finally:
+            lines.close()
+            # Let polls go on without waiting for the rules
+            while not self._ended:
+                chunk = self._chunks.get()
+                self._chunks.task_done()
+                self._ended = chunk is None
+
+    def _run_rule(self, start_line: str):
+        self.rule.process_lines(start_line)
+        # The output of every section was already handed to section_sink
+        self.rule.reset()
+
+    def _iter_lines(self) -> Generator[str, None, None]:
+        while True:
+            chunk = self._chunks.get()
+            if chunk is None:
+                self._chunks.task_done()
+                self._ended = True
+                return
+            lines, starts = chunk
+            try:
+                for i, line in enumerate(lines):
+                    self._line = (starts[i], starts[i + 1])
+                    yield line
+            finally:
+                # Every line of the chunk has been processed as far as it can
+                # be, or the rules failed
+                self._chunks.task_done()
+
+    def _track(self, rule: Rule) -> Dict[str, Callable]:
+        # Wrap the process_lines method of a rule to keep `stack` up to date
+        process_lines = rule.process_lines
+
+        def tracked_process_lines(start_line):
+            if len(self.stack) == 1:
+                self._section_start = self._line[0]
+            self.stack.append(rule.rule_id())
+            try:
+                process_lines(start_line)
+            finally:
+                self.stack.pop()
+
+        return {"process_lines": tracked_process_lines}
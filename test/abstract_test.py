@@ -1,5 +1,10 @@
+from unittest import mock
+
 import pytest
 
+from molextract import source
+from molextract.rule import Rule
+from molextract.rules.abstract import RuleListRule, SingleLineRule
 from util import IntRule, WordRule, IntOrWordRule
 
 
@@ -23,6 +28,41 @@ def test_slr_process_lines():
     assert word_rule.reset() == ["1", "2", "3"]
 
 
+def test_slr_pattern():
+    """
+    The groups captured by PATTERN are processed by process_groups, lines it
+    does not match by process
+    """
+
+    class EnergyRule(SingleLineRule):
+        PATTERN = r"Energy:\s+(\S+)\s+Error:\s+(\S+)"
+
+        def __init__(self):
+            super().__init__("Energy:")
+
+        def process(self, line):
+            return line
+
+    rule = EnergyRule()
+    for line in ["Energy: -1.5 Error: 0.25", "Energy: unknown"]:
+        rule.process_lines(line)
+    assert rule.reset() == [[-1.5, 0.25], "Energy: unknown"]
+
+
+def test_slr_sink():
+    rule = IntRule()
+    records = []
+    rule.set_sink(lambda *record: records.append(record))
+    rule.process_lines("1")
+    rule.process_lines("2")
+    assert records == [("IntRule", 1), ("IntRule", 2)]
+    assert rule.reset() == []
+
+    rule.set_sink(None)
+    rule.process_lines("3")
+    assert rule.reset() == [3]
+
+
 def test_slr_on_end_tag_matched():
     """
     SingleLineRule do not support matching end tags
@@ -51,3 +91,351 @@ def test_rlr_process_lines():
 
     rlr.process_lines(next(data))
     assert rlr.reset() == [[3, 4], ["hello_world", "foo_bar"]]
+
+
+def test_rlr_process_lines_no_debug():
+    """
+    rule_id is not resolved for debug messages that are not emitted
+    """
+    data = "3 hello_world END".split()
+    with mock.patch.object(Rule, 'rule_id') as mock_rule_id:
+        rlr = IntOrWordRule()
+        rlr.set_iter(iter(data))
+        rlr.process_lines("START")
+        rlr.set_raw_iter(iter([line.encode() for line in data]))
+        rlr.process_lines("START")
+    assert mock_rule_id.call_count == 0
+    assert rlr.reset() == [[3, 3], ["hello_world", "hello_world"]]
+
+
+def test_rlr_dispatch_first_match_wins():
+    """
+    "3" matches both IntRule and WordRule, the first rule in the list wins
+    """
+    rlr = RuleListRule("START", "END", rules=[WordRule(), IntRule()])
+    rlr.set_iter(iter("3 hello END".split()))
+    rlr.process_lines("START")
+    assert rlr.reset() == [["3", "hello"], []]
+
+    rlr.rules.reverse()
+    rlr.set_iter(iter("3 hello END".split()))
+    rlr.process_lines("START")
+    assert rlr.reset() == [[3], ["hello"]]
+
+
+def test_rlr_dispatch_fallback():
+    """
+    Rules that can not be combined into a single regex are tested in turn
+    """
+
+    class GroupRule(SingleLineRule):
+
+        def __init__(self):
+            super().__init__(r"(\d)\1")
+
+        def process(self, line):
+            return line
+
+    class SearchRule(GroupRule):
+
+        def __init__(self):
+            Rule.__init__(self, r"\d+", check_only_beginning=False)
+            self._data = []
+
+    data = "11 12 a3 END".split()
+    for rules, expected in [
+        ([GroupRule(), SearchRule()], [["11"], ["12", "a3"]]),
+        ([SearchRule(), WordRule()], [["11", "12", "a3"], []]),
+    ]:
+        rlr = RuleListRule("START", "END", rules=rules)
+        rlr.set_iter(iter(data))
+        with mock.patch('molextract.rules.abstract._compile_dispatch',
+                        return_value=None):
+            rlr.process_lines("START")
+        fallback = rlr.reset()
+
+        rlr = RuleListRule("START", "END", rules=rules)
+        rlr.set_iter(iter(data))
+        rlr.process_lines("START")
+        assert rlr.reset() == fallback == expected
+
+
+def test_rlr_raw_iter():
+    """
+    Bytes mode must give the same output as parsing decoded lines, whether
+    or not the rules can be dispatched with a single regex
+    """
+
+    class GroupRule(SingleLineRule):
+
+        def __init__(self):
+            super().__init__(r"(\d)\1")
+
+        def process(self, line):
+            return line
+
+    data = "11 12 hello 33 END after".split()
+    for rules in [[IntRule(), WordRule()], [GroupRule(), WordRule()]]:
+        rlr = RuleListRule("START", "END", rules=rules)
+        rlr.set_iter(iter(data))
+        rlr.process_lines("START")
+        expected = rlr.reset()
+
+        raw = iter([line.encode() for line in data])
+        rlr.set_raw_iter(raw)
+        rlr.process_lines("START")
+        assert rlr.reset() == expected
+        assert next(raw) == b"after"
+
+
+def test_rlr_raw_iter_nested():
+    rlr = RuleListRule("START", "STOP", rules=[IntOrWordRule()])
+    data = [b"1", b"START", b"2", b"two", b"END", b"3", b"STOP"]
+    rlr.set_raw_iter(iter(data))
+    rlr.process_lines("START")
+    assert rlr.reset() == [[[2], ["two"]]]
+
+    rlr.set_raw_iter(iter(data[:3]))
+    with pytest.raises(ValueError):
+        rlr.process_lines("START")
+
+
+def test_rlr_set_sink():
+    """
+    A sink is passed down to every nested rule
+    """
+    rlr = RuleListRule("LOG", "STOP", rules=[IntOrWordRule(), IntRule()])
+    records = []
+    rlr.set_sink(lambda *record: records.append(record))
+    rlr.set_iter(iter("START 1 hello END 2 STOP".split()))
+    rlr.process_lines("LOG")
+    assert rlr.reset() == [[[], []], []]
+    assert records == [("IntRule", 1), ("WordRule", "hello"), ("IntRule", 2)]
+
+
+def test_rlr_early_termination():
+    """
+    Once every rule is complete no more lines are read, and the parent
+    RuleListRule stops as well
+    """
+    int_rule = IntRule()
+    int_rule.single_shot = True
+    word_rule = WordRule()
+    word_rule.is_complete = lambda: bool(word_rule._data)
+    inner = RuleListRule("START", "END", rules=[int_rule, word_rule])
+    outer = RuleListRule("LOG", "STOP", rules=[inner])
+
+    lines = iter("START 1 hello 2 END STOP after".split())
+    outer.set_iter(lines)
+    with mock.patch.object(Rule, 'rule_id') as mock_rule_id:
+        outer.process_lines("LOG")
+    # Only resolved for debug messages that are emitted
+    assert mock_rule_id.call_count == 0
+    assert outer.is_complete()
+    assert outer.reset() == [[[1], ["hello"]]]
+    assert next(lines) == "2"
+
+    # A rule that is not complete keeps the whole section being read
+    word_rule.is_complete = lambda: False
+    lines = iter("START 1 hello 2 END STOP after".split())
+    outer.set_iter(lines)
+    outer.process_lines("LOG")
+    assert not outer.is_complete()
+    assert outer.reset() == [[[1, 2], ["hello"]]]
+    assert list(lines) == ["after"]
+
+
+def test_rlr_select():
+
+    class FieldsRule(RuleListRule):
+        FIELDS = {"data.ints": 0, "data.words": 1}
+
+        def __init__(self):
+            super().__init__("START", "END", rules=[IntRule(), WordRule()])
+
+    rlr = FieldsRule()
+    data = "1 hello 2 END".split()
+    for fields, expected in [
+        (["data.ints"], [[1, 2], None]),
+        (["data"], [[1, 2], ["hello"]]),
+        (["WordRule"], [None, ["hello"]]),
+        ([], [None, None]),
+        (None, [[1, 2], ["hello"]]),
+    ]:
+        rlr.select(fields)
+        rlr.set_iter(iter(data))
+        rlr.process_lines("START")
+        assert rlr.reset() == expected
+
+    for fields in [["data.foo"], ["WordRule.foo"]]:
+        with pytest.raises(ValueError):
+            rlr.select(fields)
+
+
+def test_rlr_select_skips_section():
+    """
+    The section of a disabled rule is skipped to its end_tag without being
+    processed, in str and bytes mode
+    """
+    inner = IntOrWordRule()
+    outer = RuleListRule("LOG", "STOP", rules=[inner, IntRule()])
+    outer.select(["IntRule"])
+
+    data = "START 1 hello END 2 STOP".split()
+    outer.set_iter(iter(data))
+    outer.process_lines("LOG")
+    assert outer.reset() == [None, [2]]
+
+    outer.set_raw_iter(iter([line.encode() for line in data]))
+    outer.process_lines("LOG")
+    assert outer.reset() == [None, [2]]
+
+
+def test_rlr_search_region(tmp_path):
+    """
+    Searching a buffer for the lines of SingleLineRules must give the same
+    output and stop at the same line as reading every line
+    """
+
+    class EnergyRule(SingleLineRule):
+        PATTERN = r"\s+Energy\s+(\S+)"
+
+        def __init__(self):
+            super().__init__(r"\s+Energy")
+
+    data = "\n  Energy 1.5\n42\n\n  Energy 2.5\nsome Energy\nword 7\r\nEND\n3"
+    path = tmp_path / 'data.in'
+    path.write_text(data)
+    rlr = RuleListRule("START", "END", rules=[EnergyRule(), IntRule()])
+    expected = [[1.5, 2.5], [42]]
+
+    rlr.set_iter(iter(data.replace("\r", "").split("\n")))
+    rlr.process_lines("START")
+    assert rlr.reset() == expected
+
+    for encoding in ['utf-8', None]:
+        with source.MmapLines(str(path), encoding) as lines:
+            if encoding is None:
+                rlr.set_raw_iter(lines)
+            else:
+                rlr.set_iter(lines)
+            with mock.patch.object(rlr,
+                                   "_process_region",
+                                   wraps=rlr._process_region) as region:
+                rlr.process_lines("START")
+            region.assert_called_once()
+            assert rlr.reset() == expected
+            assert list(lines) == ["3" if encoding else b"3"]
+
+    with source.MmapLines(str(path)) as lines:
+        rlr.set_iter(lines)
+        rlr.select(["IntRule"])
+        rlr.process_lines("START")
+        assert rlr.reset() == [None, [42]]
+
+    path.write_text("  Energy 1.5\n")
+    with source.MmapLines(str(path)) as lines:
+        rlr.set_iter(lines)
+        with pytest.raises(ValueError):
+            rlr.process_lines("START")
+
+
+def test_rlr_tag_overlaps():
+
+    class TagRule(SingleLineRule):
+
+        def __init__(self, tag, check_only_beginning=True):
+            super().__init__(tag)
+            self._check_only_beginning = check_only_beginning
+
+    def overlaps(a, b, check_only_beginning=True):
+        rules = [TagRule(a), TagRule(b, check_only_beginning)]
+        return RuleListRule(rules=rules).tag_overlaps() == [(0, 1)]
+
+    assert not overlaps("Energy", "Energies")
+    assert overlaps("Energy", "Ener")
+    assert overlaps("Energy", r"Energy\s+\d+")
+    assert not overlaps(r"\s+Energy", "Energy")
+    assert overlaps(r"\s+Energy", "  Energy")
+    assert not overlaps(r"\s+ Energy", " Energy")
+    assert overlaps(r"\s* Energy", " Energy")
+    assert not overlaps(r"\s?Energy", "  Energy")
+    assert overlaps(r"\s+", "  Energy")
+    assert overlaps(r"\d+", r"\w+")
+    assert overlaps("Energy|Total", "Total")
+    assert overlaps("Energy", "Total", check_only_beginning=False)
+    assert RuleListRule(rules=IntOrWordRule().rules).tag_overlaps() == [(0, 1)]
+
+
+@pytest.mark.parametrize("tag", ["{}", "{}(x)?"])
+def test_rlr_adaptive(tag):
+    """
+    Rules that match more often are tested first once the rule is reset,
+    without changing the output, whether the start_tags are combined into a
+    single regex or tested in turn
+    """
+
+    class LetterRule(SingleLineRule):
+
+        def __init__(self, letter):
+            super().__init__(tag.format(letter))
+            self.letter = letter
+
+        def rule_id(self):
+            return self.letter
+
+        def process(self, line):
+            return line
+
+    def make_rule(adaptive):
+        rules = [LetterRule(letter) for letter in "ABC"] + [WordRule()]
+        return RuleListRule("START", "END", rules=rules, adaptive=adaptive)
+
+    data = ["A", "B", "C", "C", "Cx", "word", "C", "END"]
+    expected = [["A"], ["B"], ["C", "C", "Cx", "C"], ["word"]]
+    adaptive = make_rule(True)
+    for _ in range(2):
+        adaptive.set_iter(iter(data))
+        adaptive.process_lines("START")
+        assert adaptive.reset() == expected
+
+    rules = adaptive.rules
+    assert adaptive._ordered_rules() == [rules[2], rules[0], rules[1], rules[3]]
+    assert (adaptive._get_dispatch() is None) == (tag != "{}")
+
+    # The WordRule overlaps with the others, so is never moved before them
+    data = ["word"] * 10 + ["A", "END"]
+    adaptive.set_iter(iter(data))
+    adaptive.process_lines("START")
+    assert adaptive.reset() == [["A"], [], [], ["word"] * 10]
+    assert adaptive._ordered_rules()[-1] is rules[3]
+
+    ordered = make_rule(False)
+    ordered.set_order({"C": 5, "B": 1})
+    assert ordered._ordered_rules() == [
+        ordered.rules[2], ordered.rules[1], ordered.rules[0], ordered.rules[3]
+    ]
+    ordered.set_iter(iter(data))
+    ordered.process_lines("START")
+    assert ordered.reset() == [["A"], [], [], ["word"] * 10]
+
+    # The order is only logged when debug messages are emitted
+    for enabled in [False, True]:
+        ordered = make_rule(False)
+        ordered.set_order({"C": 5})
+        with mock.patch('molextract.debug.is_enabled', return_value=enabled), \
+                mock.patch('molextract.debug.logger.debug') as mock_debug:
+            ordered._ordered_rules()
+        assert mock_debug.call_count == enabled
+
+
+def test_rlr_set_adaptive():
+    inner = IntOrWordRule()
+    outer = RuleListRule(rules=[inner])
+    outer.set_adaptive()
+    assert outer.adaptive and inner.adaptive
+
+    outer.set_order({"IntRule": 3, "WordRule": 5})
+    assert inner._hits == [3, 5]
+    # IntRule and WordRule overlap, so keep their order
+    assert inner._ordered_rules() == inner.rules
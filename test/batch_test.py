@@ -0,0 +1,107 @@
+import os
+import pickle
+
+from molextract import batch
+from molextract.parser import Parser
+from molextract.rules.gaussian import log as gaussian_log, tddft
+from molextract.rules.molcas import log, mcpdft, rasscf
+from util import molextract_test_file, IntRule
+
+import pytest
+
+
+def test_expand_paths(tmp_path):
+    for name in ['a.log', 'b.log', 'c.txt']:
+        (tmp_path / name).write_text('')
+    file_list = tmp_path / 'files.txt'
+    file_list.write_text('x.log\n  \ny.log\n')
+
+    paths = batch.expand_paths([str(tmp_path / '*.log'), 'missing.log'],
+                               str(file_list))
+    assert paths == [
+        str(tmp_path / 'a.log'),
+        str(tmp_path / 'b.log'), 'missing.log', 'x.log', 'y.log'
+    ]
+
+
+def test_parse_files():
+    rule = log.LogRule([rasscf.RASSCFModule(), mcpdft.MCPDFTModule()])
+    parser = Parser(rule)
+    styrene = str(molextract_test_file("styrene.log"))
+    expected = parser.feed_file(styrene)
+
+    # Parsing should not stop the parser from being sent to workers
+    pickle.dumps(parser)
+
+    paths = [styrene, "missing.log", styrene]
+    for jobs in [1, 2]:
+        results = list(batch.parse_files(parser, paths, jobs))
+        assert sorted(path for path, _, _ in results) == sorted(paths)
+        for path, data, error in results:
+            if path == styrene:
+                assert data == expected
+                assert error is None
+            else:
+                assert data is None
+                assert error.startswith("FileNotFoundError")
+
+
+@pytest.mark.parametrize("name", ["b-carotene.log", "styrene.log"])
+def test_parse_files_after_mmap(name):
+    """
+    Searching a memory map caches closures in the rules, which must not stop
+    the parser from being sent to workers
+    """
+    if name == "b-carotene.log":
+        parser = Parser(gaussian_log.LogRule([tddft.TDDFTExcitedState()]))
+    else:
+        rule = log.LogRule([rasscf.RASSCFModule(), mcpdft.MCPDFTModule()])
+        parser = Parser(rule, fields=["mcpdft"])
+    path = str(molextract_test_file(name))
+    expected = parser.feed_file(path, use_mmap=True)
+
+    copy = pickle.loads(pickle.dumps(parser))
+    assert copy.feed_file(path, use_mmap=True) == expected
+    assert list(batch.parse_files(parser, [path],
+                                  2)) == [(path, expected, None)]
+
+
+class CrashRule(IntRule):
+
+    def process(self, line):
+        if line == "0":
+            # Kill the worker process, as running out of memory would
+            os._exit(1)
+        return super().process(line)
+
+
+def test_parse_files_broken_pool(tmp_path):
+    paths = []
+    for i in range(20):
+        path = tmp_path / f"{i}.log"
+        path.write_text(str(i))
+        paths.append(str(path))
+
+    results = list(batch.parse_files(Parser(CrashRule()), paths, 2))
+    assert sorted(path for path, _, _ in results) == sorted(paths)
+    parsed = 0
+    for path, data, error in results:
+        if error is None:
+            assert data == [int(os.path.basename(path)[:-4])]
+            parsed += 1
+        else:
+            assert error.startswith("BrokenProcessPool")
+    errors = {path: error for path, _, error in results}
+    assert errors[paths[0]] is not None
+    # The files left once the pool broke are parsed by a new pool
+    assert parsed > 10
+
+
+def test_parse_file():
+    styrene = str(molextract_test_file("styrene.log"))
+    parser = Parser(rasscf.RASSCFModule())
+    expected = (styrene, parser.feed_file(styrene), None)
+    assert batch.parse_file(parser, styrene) == expected
+    path, data, error = batch.parse_file(parser, "missing.log")
+    assert (path, data) == ("missing.log", None)
+    assert error.startswith("FileNotFoundError")
@@ -0,0 +1,134 @@
+import os
+import pickle
+from unittest import mock
+
+from molextract.cache import ResultCache, rule_fingerprint, _class_digest
+from molextract.parser import Parser
+from molextract.rules.abstract import RuleListRule
+from molextract.rules.molcas import log, rasscf
+from util import IntRule, WordRule, molextract_test_file
+
+
+def int_list_rule():
+    return RuleListRule(start_tag="START", end_tag="END", rules=[IntRule()])
+
+
+def test_rule_fingerprint():
+    fingerprint = rule_fingerprint(int_list_rule())
+    assert fingerprint == rule_fingerprint(int_list_rule())
+
+    other = RuleListRule(start_tag="START", end_tag="STOP", rules=[IntRule()])
+    assert fingerprint != rule_fingerprint(other)
+    other = RuleListRule(start_tag="START", end_tag="END", rules=[WordRule()])
+    assert fingerprint != rule_fingerprint(other)
+    other = RuleListRule(start_tag="START", end_tag="END", rules=[])
+    assert fingerprint != rule_fingerprint(other)
+
+    rule = int_list_rule()
+    rule.rules[0].some_option = True
+    assert fingerprint != rule_fingerprint(rule)
+
+    module = rasscf.RASSCFModule()
+    fingerprint = rule_fingerprint(module)
+    # The source of each class is only read once
+    with mock.patch('inspect.getsource') as getsource:
+        assert rule_fingerprint(module) == fingerprint
+    getsource.assert_not_called()
+
+    _class_digest.cache_clear()
+    try:
+        with mock.patch('inspect.getsource', return_value="changed source"):
+            assert rule_fingerprint(module) != fingerprint
+    finally:
+        _class_digest.cache_clear()
+
+
+def test_feed_file_cache(tmp_path):
+    cache = ResultCache(str(tmp_path / 'cache'))
+    input_file = tmp_path / 'data.in'
+    input_file.write_text('START\n1\n2\nEND')
+
+    parser = Parser(int_list_rule(), cache=cache)
+    assert parser.feed_file(str(input_file)) == [[1, 2]]
+
+    with mock.patch.object(parser, '_feed_lines') as mock_feed_lines:
+        assert parser.feed_file(str(input_file)) == [[1, 2]]
+        assert mock_feed_lines.call_count == 0
+
+    # Changing the file invalidates the cached output
+    input_file.write_text('START\n3\nEND')
+    os.utime(input_file, ns=(0, 0))
+    assert parser.feed_file(str(input_file)) == [[3]]
+
+    # Changing the rule invalidates the cached output
+    parser = Parser(RuleListRule("START", "END", rules=[WordRule()]),
+                    cache=cache)
+    assert parser.feed_file(str(input_file)) == [["3"]]
+
+    # Identical content at another path is found by its content hash
+    copy = tmp_path / 'copy.in'
+    copy.write_text('START\n3\nEND')
+    with mock.patch.object(parser, '_feed_lines') as mock_feed_lines:
+        assert parser.feed_file(str(copy)) == [["3"]]
+        assert mock_feed_lines.call_count == 0
+
+    cache.clear()
+    assert os.listdir(tmp_path / 'cache' / 'results') == []
+
+
+def test_cache_eviction(tmp_path):
+    size = len(pickle.dumps("x" * 40, pickle.HIGHEST_PROTOCOL))
+    cache = ResultCache(str(tmp_path), max_bytes=int(size * 2.5))
+    cache.put("a", "x" * 40)
+    cache.put("b", "y" * 40)
+    os.utime(cache._result_path("a"), ns=(1, 1))
+    os.utime(cache._result_path("b"), ns=(2, 2))
+
+    assert cache.get("a") == (True, "x" * 40)
+    cache.put("c", "z" * 40)
+    assert cache.get("a")[0]
+    assert cache.get("b") == (False, None)
+    assert cache.get("c")[0]
+
+    # Results that can not be pickled are not cached
+    cache.put("d", lambda: None)
+    assert cache.get("d") == (False, None)
+
+
+def test_cache_eviction_scans(tmp_path):
+    cache = ResultCache(str(tmp_path), max_bytes=1000)
+    with mock.patch.object(cache, 'evict', wraps=cache.evict) as evict:
+        for i in range(10):
+            cache.put(str(i), "x" * 10)
+        # The directory is only scanned by the first put
+        assert evict.call_count == 1
+
+        for i in range(10):
+            cache.put(str(i), "x" * 100)
+        assert evict.call_count > 1
+    assert sum(e.stat().st_size for e in cache._entries()) <= 1000
+
+
+def test_cache_types(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    value = {1: (1.5, "a"), "b": [(1, 2)]}
+    cache.put("a", value)
+    assert cache.get("a") == (True, value)
+
+    # A cached result is the same as a parsed one
+    path = str(molextract_test_file("styrene.log"))
+    parser = Parser(log.LogRule([rasscf.RASSCFModule()]), cache=cache)
+    parsed = parser.feed_file(path)
+    assert repr(parser.feed_file(path)) == repr(parsed)
+
+
+def test_cache_parser_pickle(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    parser = Parser.from_factory(rasscf.RASSCFModule, cache=cache)
+    copy = pickle.loads(pickle.dumps(parser))
+    assert copy.cache.directory == cache.directory
+    assert parser.clone().cache is cache
+
+    path = str(molextract_test_file("styrene.log"))
+    parser = Parser(log.LogRule([rasscf.RASSCFModule()]), cache=cache)
+    assert parser.feed_file(path) == parser.feed_file(path)
@@ -22,3 +22,37 @@ def test_color_notty(mock_isatty):
 
     mock_isatty.return_value = False
     assert debug.Color.RED == ''
+
+
+@mock.patch('sys.stderr.isatty', return_value=True)
+def test_log_tags_disabled(mock_isatty):
+    with mock.patch.object(debug.logger, 'debug') as mock_debug:
+        debug.log_start_tag("Foo", "Rule")
+        debug.log_end_tag("Bar", "Rule")
+
+    assert not debug.is_enabled()
+    assert mock_debug.call_count == 0
+    assert mock_isatty.call_count == 0
+
+
+def test_log_tags_enabled():
+    level = debug.logger.level
+    debug.logger.setLevel(debug.logging.DEBUG)
+    debug._tag_colors.cache_clear()
+    try:
+        with mock.patch.object(debug.logger, 'debug') as mock_debug, \
+                mock.patch('sys.stderr.isatty', return_value=False) as isatty:
+            assert debug.is_enabled()
+            debug.log_start_tag("Foo", "Rule")
+            debug.log_end_tag("Bar", "Rule")
+    finally:
+        debug.logger.setLevel(level)
+        debug._tag_colors.cache_clear()
+
+    assert mock_debug.call_count == 2
+    start_msg = mock_debug.call_args_list[0][0][0]
+    assert start_msg.startswith("Foo".ljust(debug.TAG_LEFT_JUST))
+    assert start_msg.endswith("Rule")
+
+    # Each color is resolved once, not once per message
+    assert isatty.call_count == 3
@@ -21,6 +21,8 @@ def test_tddft_excited_state():
         expected_out = json.loads(f.read())
 
     assert parser.feed(data) == expected_out
+    path = str(util.molextract_test_file("b-carotene.log"))
+    assert parser.feed_file(path, use_mmap=True) == expected_out
 
 
 def test_dipole_moment():
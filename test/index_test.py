@@ -0,0 +1,128 @@
+import shutil
+from unittest import mock
+
+import pytest
+
+from molextract.index import ModuleIndex, ModuleSection
+from molextract.parser import Parser
+from molextract.rules.molcas import log, mcpdft, rasscf
+from molextract.rules.gaussian import tddft
+from util import molextract_test_file, IntRule
+
+DATA = b"""\
+header
+--- Start Module: foo at today ---
+1
+--- Stop Module: foo at today /rc=_RC_ALL_IS_WELL_ ---
+--- Start Module: bar at today ---
+2
+--- Stop Module: bar at today ---
+--- Start Module: foo at today ---
+3
+4
+--- Stop Module: foo at today ---
+--- Start Module: foo
+5
+"""
+
+
+def test_build(tmp_path):
+    path = tmp_path / 'data.log'
+    path.write_bytes(DATA)
+    index = ModuleIndex.build(str(path))
+
+    assert [s.name for s in index.sections] == ['foo', 'bar', 'foo', 'foo']
+    start = DATA.index(b'--- Start Module: bar')
+    stop = DATA.index(b'--- Start Module: foo at today ---\n3')
+    assert index.find('bar') == [ModuleSection('bar', start, stop)]
+    assert index.find('foo')[-1].stop is None
+    assert index.find('baz') == []
+
+    path.write_bytes(b'')
+    assert ModuleIndex.build(str(path)).sections == []
+
+
+def test_sidecar(tmp_path):
+    path = tmp_path / 'data.log'
+    path.write_bytes(DATA)
+
+    index = ModuleIndex.for_file(str(path))
+    assert (tmp_path / 'data.log.mxidx').exists()
+    with mock.patch.object(ModuleIndex, 'build') as mock_build:
+        loaded = ModuleIndex.for_file(str(path))
+        assert mock_build.call_count == 0
+    assert loaded.sections == index.sections
+
+    # A changed file is indexed again
+    path.write_bytes(DATA[:DATA.index(b'--- Start Module: bar')])
+    assert len(ModuleIndex.for_file(str(path)).sections) == 1
+
+
+def test_feed_indexed(tmp_path):
+    path = tmp_path / 'data.log'
+    path.write_bytes(DATA)
+    parser = Parser(log.ModuleRule("foo", rules=[IntRule()]))
+
+    assert parser.feed_indexed(str(path)) == [[1]]
+    assert parser.feed_indexed(str(path), occurrence=1) == [[3, 4]]
+    assert parser.feed_indexed(str(path), occurrence=-2) == [[3, 4]]
+    assert parser.feed_indexed(str(path), occurrence=5) is None
+    with pytest.raises(ValueError):
+        parser.feed_indexed(str(path), occurrence=-1)
+
+    parser = Parser(
+        log.LogRule([
+            log.ModuleRule("bar", rules=[IntRule()]),
+            log.ModuleRule("foo", rules=[IntRule()]),
+        ]))
+    assert parser.feed_indexed(str(path), occurrence=0) == [[[2]], [[1]]]
+
+    with pytest.raises(ValueError):
+        Parser(log.LogRule([IntRule()])).feed_indexed(str(path))
+    with pytest.raises(ValueError):
+        Parser(tddft.TDDFTExcitedState()).feed_indexed(str(path))
+
+
+def test_feed_indexed_molcas(tmp_path):
+    path = tmp_path / 'styrene.log'
+    shutil.copy(molextract_test_file("styrene.log"), path)
+    rules = [rasscf.RASSCFModule(), mcpdft.MCPDFTModule()]
+    parser = Parser(log.LogRule(rules))
+
+    assert parser.feed_indexed(str(path)) == parser.feed_file(str(path))
+
+    parser = Parser(mcpdft.MCPDFTModule())
+    expected = parser.feed_file(str(path))
+    assert parser.feed_indexed(str(path), occurrence=-1) == expected
+
+
+def test_feed_indexed_options(tmp_path):
+    path = tmp_path / 'data.log'
+    path.write_bytes(DATA[:DATA.index(b'--- Start Module: foo\n')])
+
+    def log_rule():
+        return log.LogRule([
+            log.ModuleRule("bar", rules=[IntRule()]),
+            log.ModuleRule("foo", rules=[IntRule()]),
+        ])
+
+    expected = [[[2]], [[1, 3, 4]]]
+
+    # The rules are run as by feed_file
+    assert Parser(log_rule()).feed_indexed(str(path)) == expected
+    assert Parser(log_rule(), binary=True).feed_indexed(str(path)) == expected
+
+    parser = Parser(log_rule(), profile=True)
+    assert parser.feed_indexed(str(path)) == expected
+    stats = parser.profiler.stats
+    assert stats["IntRule"]["calls"] == 4
+    for rule in [parser.rule] + parser.rule.rules:
+        assert "process_lines" not in vars(rule)
+
+    rule = log_rule()
+    rule.set_adaptive()
+    records = []
+    rule.section_sink = lambda rule_id, output: records.append(output)
+    assert Parser(rule).feed_indexed(str(path)) == [[[]], [[]]]
+    assert records == [[[1]], [[2]], [[3, 4]]]
+    assert rule._hits == [1, 2]
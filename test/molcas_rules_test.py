@@ -1,5 +1,7 @@
+import io
 import json
 import textwrap
+from unittest import mock
 
 from molextract.rules.molcas import log, mcpdft, rasscf, rassi, general
 from molextract.parser import Parser
@@ -149,6 +151,71 @@ def test_rasscf_ci_expansion():
     assert parser.feed(data) == {"roots": 5}
 
 
+def test_rasscf_header_early_termination():
+    """
+    A header only query whose rules are single_shot stops reading the log
+    once both headers are parsed
+    """
+    rules = [rasscf.RASSCFOrbSpec(), rasscf.RASSCFCIExpansionSpec()]
+    parser = Parser(log.LogRule([log.ModuleRule("rasscf", rules=rules)]))
+    with open(molextract_test_file("styrene.log")) as f:
+        data = f.read()
+
+    # RASSCF prints both headers twice, the last ones are kept by default
+    stream = io.StringIO(data)
+    expected = parser.feed_stream(stream)
+    assert stream.tell() > len(data) // 2
+
+    for rule in rules:
+        rule.single_shot = True
+    stream = io.StringIO(data)
+    orb_spec, ci_spec = parser.feed_stream(stream)[0]
+    assert [orb_spec, ci_spec] == expected[0]
+    assert stream.tell() < len(data) // 2
+
+
+def test_select_matches_full_output(tmp_path):
+    """
+    Selecting fields gives the same values as parsing everything, even when
+    the selected rules are complete before the end of their sections
+    """
+
+    def make_rule():
+        return log.LogRule([rasscf.RASSCFModule(), general.MolProps()])
+
+    # The rasscf module prints molecular properties of its own, which are not
+    # part of the MolProps of the log
+    path = str(molextract_test_file("FMNhq_Ph-2.log"))
+    full_rasscf, full_props = Parser(make_rule()).feed_file(path)
+    parser = Parser(make_rule(), fields=["rasscf.active_orbs", "MolProps"])
+    for use_mmap in [False, True]:
+        rasscf_out, props = parser.feed_file(path, use_mmap=use_mmap)
+        assert props == full_props
+        assert rasscf_out["active_orbs"] == full_rasscf["active_orbs"]
+
+    # With two rasscf modules the values of the last one are kept
+    with open(molextract_test_file("styrene.log")) as f:
+        lines = f.read().splitlines(keepends=True)
+    start = next(
+        i for i, line in enumerate(lines) if "Start Module: rasscf" in line)
+    end = next(
+        i for i, line in enumerate(lines) if "Stop Module: rasscf" in line)
+    module = "".join(lines[start:end + 1]).replace(
+        "Active orbitals                           10",
+        "Active orbitals                           99")
+    path = str(tmp_path / "two_rasscf.log")
+    with open(path, "w") as f:
+        f.write("".join(lines[:end + 1]) + module + "".join(lines[end + 1:]))
+
+    full_rasscf = Parser(make_rule()).feed_file(path)[0]
+    assert full_rasscf["active_orbs"] == 99
+    parser = Parser(make_rule(), fields=["rasscf.active_orbs"])
+    for binary in [False, True]:
+        parser.binary = binary
+        rasscf_out = parser.feed_file(path)[0]
+        assert rasscf_out["active_orbs"] == full_rasscf["active_orbs"]
+
+
 def test_rasscf_coords():
     parser = Parser(rasscf.RASSCFCartesianCoords())
     data = """\
@@ -207,6 +274,125 @@ def test_rasscf_module():
     assert parser.feed(data) == expected_out
 
 
+def test_rasscf_module_select():
+    with open(molextract_test_file("styrene.log")) as f:
+        data = f.read()
+    with open(molextract_test_file("styrene_rasscf.json")) as f:
+        full = json.loads(f.read())
+
+    rule = log.LogRule([rasscf.RASSCFModule(), mcpdft.MCPDFTModule()])
+    parser = Parser(rule, fields=["rasscf.data.total_energy", "rasscf.roots"])
+    rasscf_out, mcpdft_out = parser.feed(data)
+    assert mcpdft_out is None
+    assert rasscf_out == {
+        "roots":
+            full["roots"],
+        "module":
+            "rasscf",
+        "data": [{
+            "root": root["root"],
+            "total_energy": root["total_energy"]
+        } for root in full["data"]]
+    }
+
+    path = str(molextract_test_file("styrene.log"))
+    for binary in [False, True]:
+        parser.binary = binary
+        assert parser.feed_file(path, use_mmap=True) == [rasscf_out, None]
+
+    # The skipped sections are not parsed at all
+    with mock.patch.object(rasscf.RASSCFCiCoeff, "process_lines") as m:
+        parser.feed(data)
+    m.assert_not_called()
+
+    parser.select(None)
+    assert parser.feed(data)[0] == full
+
+
+def test_rasscf_as_array():
+    np = pytest.importorskip("numpy")
+    with open(molextract_test_file("styrene.log")) as f:
+        data = f.read()
+
+    expected = Parser(rasscf.RASSCFModule()).feed(data)
+    out = Parser(rasscf.RASSCFModule(as_array=True)).feed(data)
+    assert len(out["data"]) == len(expected["data"])
+    for root, expected_root in zip(out["data"], expected["data"]):
+        occupation = root["occupation"]
+        assert occupation.dtype == np.float64
+        assert occupation.tolist() == expected_root["occupation"]
+
+        ci_coeff = root["ci_coeff"]
+        assert ci_coeff.dtype.names == ("conf_sym", "occupation", "coeff",
+                                        "weight")
+        rows = [list(row) for row in ci_coeff.tolist()]
+        assert rows == expected_root["ci_coeff"]
+
+    expected = Parser(rasscf.RASSCFCartesianCoords()).feed(data)
+    coords = Parser(rasscf.RASSCFCartesianCoords(as_array=True)).feed(data)
+    assert coords.tolist() == expected
+    assert coords["x"].dtype == np.float64
+
+
+def test_rasscf_as_array_without_numpy():
+    with mock.patch.object(rasscf, "np", None):
+        assert rasscf.RASSCFModule().reset()["data"] == []
+        with pytest.raises(ImportError):
+            rasscf.RASSCFModule(as_array=True)
+
+
+def test_rasscf_sink():
+    """
+    With a sink every record is streamed as it is parsed and left out of the
+    output, except for the values combined per root
+    """
+    with open(molextract_test_file("styrene.log")) as f:
+        data = f.read()
+
+    def log_rule():
+        return log.LogRule(
+            rules=[rasscf.RASSCFModule(),
+                   rasscf.RASSCFCartesianCoords()])
+
+    expected, expected_coords = Parser(log_rule()).feed(data)
+    records = []
+    out = Parser(log_rule(),
+                 sink=lambda *record: records.append(record)).feed(data)
+    assert out[0]["data"] == [{
+        key: value for key, value in root.items() if key != "ci_coeff"
+    } for root in expected["data"]]
+    assert all(root["occupation"] for root in out[0]["data"])
+    assert out[0]["active_orbs"] == expected["active_orbs"]
+    assert out[1] == []
+    streamed = {rule_id for rule_id, _ in records}
+    assert streamed == {"RASSCFCiCoeff", "RASSCFCartesianCoords"}
+
+    rows = [(r["root"],
+             [r["conf_sym"], r["occupation"], r["coeff"], r["weight"]])
+            for rule_id, r in records
+            if rule_id == "RASSCFCiCoeff"]
+    assert rows == [(root["root"], row)
+                    for root in expected["data"]
+                    for row in root["ci_coeff"]]
+
+    coords = [r for rule_id, r in records if rule_id == "RASSCFCartesianCoords"]
+    assert coords == expected_coords
+
+
+def test_mcpdft_sink():
+    with open(molextract_test_file("styrene.log")) as f:
+        data = f.read()
+
+    rule = log.LogRule([mcpdft.MCPDFTModule()])
+    expected = Parser(rule).feed(data)
+    records = []
+    rule = log.LogRule([mcpdft.MCPDFTModule()])
+    assert Parser(rule,
+                  sink=lambda *r: records.append(r)).feed(data) == expected
+    assert expected[0]["roots"] > 0
+    assert records == []
+
+
 def test_rassi_dipole_strengths():
     parser = Parser(rassi.RASSIDipoleStrengths())
     data = textwrap.dedent("""\
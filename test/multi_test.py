@@ -0,0 +1,81 @@
+import io
+import pathlib
+
+from molextract import synthetic
+from molextract.multi import MultiParser
+from molextract.parser import Parser
+from molextract.rules.molcas import general, log, mcpdft, rasscf
+from util import molextract_test_file, IntRule, IntOrWordRule
+
+import pytest
+
+
+def make_parsers(binary=False):
+    return {
+        "rasscf": Parser(log.LogRule([rasscf.RASSCFModule()]), binary=binary),
+        "mcpdft": Parser(log.LogRule([mcpdft.MCPDFTModule()]), binary=binary),
+        "props": Parser(log.LogRule([general.MolProps()]), binary=binary),
+        # Done as soon as the first rasscf module is parsed
+        "module": Parser(rasscf.RASSCFModule(), binary=binary),
+    }
+
+
+@pytest.mark.parametrize("chunk_lines,max_chunks", [(4096, 8), (1, 1), (7, 2)])
+def test_feed_file(chunk_lines, max_chunks):
+    path = str(molextract_test_file("FMNhq_Ph-2.log"))
+    expected = {
+        name: parser.feed_file(path) for name, parser in make_parsers().items()
+    }
+
+    for binary in [False, True]:
+        for use_mmap in [False, True]:
+            multi = MultiParser(make_parsers(binary), chunk_lines, max_chunks)
+            assert multi.feed_file(path, use_mmap=use_mmap) == expected
+
+    data = pathlib.Path(path).read_text()
+    multi = MultiParser(make_parsers(), chunk_lines, max_chunks)
+    assert multi.feed(data) == expected
+    assert multi.feed_stream(io.StringIO(data)) == expected
+
+
+def test_feed_synthetic(tmp_path):
+    path = tmp_path / "synthetic.log"
+    expected = synthetic.write_log(str(path), "molcas", roots=8)[0]
+    multi = MultiParser(make_parsers())
+    out = multi.feed_file(str(path))
+    assert out["rasscf"] == [expected[0]]
+    assert out["mcpdft"] == [expected[1]]
+    assert out["props"] == [expected[2]]
+    assert out["module"] == expected[0]
+
+
+def test_stops_reading():
+    read = []
+
+    def lines():
+        for i in range(10000):
+            read.append(i)
+            yield "START" if i == 0 else "END" if i == 2 else str(i)
+
+    multi = MultiParser({"a": Parser(IntOrWordRule())}, chunk_lines=1)
+    assert multi._feed_lines(lines()) == {"a": [[1], []]}
+    assert len(read) < 100
+
+
+def test_errors():
+    with pytest.raises(ValueError):
+        MultiParser({})
+
+    parser = Parser(IntRule())
+    with pytest.raises(ValueError):
+        MultiParser({"a": parser, "b": parser})
+    MultiParser({"a": parser, "b": parser.clone()})
+
+    with pytest.raises(ValueError):
+        MultiParser({"a": parser, "b": Parser(IntRule(), binary=True)})
+
+    # An error in one parser is raised once the others are done
+    parsers = {"a": Parser(IntOrWordRule()), "b": Parser(IntRule())}
+    multi = MultiParser(parsers, chunk_lines=1, max_chunks=1)
+    with pytest.raises(ValueError):
+        multi.feed("START\n1\nfoo\n2")
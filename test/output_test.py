@@ -0,0 +1,61 @@
+import io
+import json
+from unittest import mock
+
+import pytest
+
+from molextract import output
+
+
+@pytest.mark.parametrize("fast", [True, False])
+def test_dumps(fast):
+    data = {"a": [1, 2.5, None], "b": {"c": "d"}, "e": (1, 2)}
+    if not fast:
+        with mock.patch.object(output, "orjson", None):
+            out = output.dumps(data)
+    else:
+        out = output.dumps(data)
+
+    assert "\n" not in out
+    assert json.loads(out) == {
+        "a": [1, 2.5, None],
+        "b": {
+            "c": "d"
+        },
+        "e": [1, 2]
+    }
+
+
+def test_dump():
+    for fmt in output.FORMATS:
+        stream = io.StringIO()
+        output.dump({"a": [1, 2]}, stream, fmt)
+        out = stream.getvalue()
+        assert out.endswith("\n")
+        assert json.loads(out) == {"a": [1, 2]}
+        assert (out.count("\n") > 1) == (fmt == "json")
+
+    with pytest.raises(ValueError):
+        output.dump({}, io.StringIO(), "xml")
+
+
+def test_dump_arrays():
+    np = pytest.importorskip("numpy")
+    dtype = np.dtype([("label", "U2"), ("x", np.float64)])
+    data = {
+        "occupation": np.array([1.5, 0.5]),
+        "coords": np.array([("C", 1.0), ("H", 2.0)], dtype=dtype),
+        "roots": np.int64(2),
+    }
+    expected = {
+        "occupation": [1.5, 0.5],
+        "coords": [["C", 1.0], ["H", 2.0]],
+        "roots": 2,
+    }
+    for fmt in output.FORMATS:
+        stream = io.StringIO()
+        output.dump(data, stream, fmt)
+        assert json.loads(stream.getvalue()) == expected
+
+    with pytest.raises(TypeError):
+        output.dumps({"a": object()})
@@ -1,8 +1,12 @@
+import io
+import json
+import pathlib
 from unittest import mock
 
 from molextract.parser import Parser
 from molextract.rules.abstract import RuleListRule
-from util import IntRule
+from molextract.rules.molcas import rasscf
+from util import molextract_test_file, IntRule, IntOrWordRule
 
 import pytest
 
@@ -26,7 +30,23 @@ def test_feed():
     assert p.feed("hello world") is None, msg
 
 
-@mock.patch('molextract.parser.Parser.feed', return_value='foo')
+def test_feed_stream(tmp_path):
+    rlr = RuleListRule(start_tag="START", end_tag="END", rules=[IntRule()])
+    p = Parser(rlr)
+    assert p.feed_stream(io.StringIO("START\n1\n2\n3\nEND\n")) == [[1, 2, 3]]
+    assert p.feed_stream(io.StringIO("START\n1\nEND")) == [[1]]
+    assert p.feed_stream(io.StringIO("")) is None
+
+    input_file = tmp_path / 'data.in'
+    input_file.write_text('foo\nSTART\n1\n2\n3\nEND\nbar\n')
+    assert p.feed_file(str(input_file)) == [[1, 2, 3]]
+
+    # feed_stream should not handle any unexpected end of data
+    with pytest.raises(ValueError):
+        p.feed_stream(io.StringIO("START\n1\n2\n"))
+
+
+@mock.patch('molextract.parser.Parser.feed_file', return_value='foo')
 def test_cli(mock_feed, tmp_path):
     input_file = tmp_path / 'data.in'
     input_file.write_text('START\n1\n2\n3\nEND')
@@ -36,3 +56,129 @@ def test_cli(mock_feed, tmp_path):
 
     p.cli([str(input_file)])
     assert mock_feed.call_count == 1
+
+
+def test_cli_select(tmp_path, capsys):
+    input_file = tmp_path / 'data.in'
+    input_file.write_text('START\n1\nhello\nEND')
+
+    p = Parser(IntOrWordRule())
+    p.cli([str(input_file), '--select', 'WordRule'])
+    assert json.loads(capsys.readouterr().out) == [None, ["hello"]]
+
+    with pytest.raises(SystemExit):
+        p.cli([str(input_file), '--select', 'foo'])
+
+
+def test_cli_format(tmp_path, capsys):
+    input_file = tmp_path / 'data.in'
+    input_file.write_text('START\n1\nhello\n2\nEND')
+
+    p = Parser(IntOrWordRule())
+    p.cli([str(input_file)])
+    out = capsys.readouterr().out
+    assert out.count('\n') > 1
+    assert json.loads(out) == [[1, 2], ["hello"]]
+
+    p.cli([str(input_file), '--format', 'compact'])
+    out = capsys.readouterr().out
+    assert out.count('\n') == 1
+    assert json.loads(out) == [[1, 2], ["hello"]]
+
+    p.cli([str(input_file), '--format', 'ndjson'])
+    records = [json.loads(line) for line in capsys.readouterr().out.split()]
+    assert records == [
+        {
+            "rule": "IntRule",
+            "data": [1]
+        },
+        {
+            "rule": "WordRule",
+            "data": ["hello"]
+        },
+        {
+            "rule": "IntRule",
+            "data": [2]
+        },
+    ]
+    assert p.rule.section_sink is None
+
+    # The output of a rule that combines the output of its rules is written
+    # as a whole
+    path = str(molextract_test_file("styrene.log"))
+    p = Parser(rasscf.RASSCFModule())
+    p.cli([path, '--format', 'ndjson'])
+    out = capsys.readouterr().out
+    assert out.count('\n') == 1
+    assert json.loads(out) == json.loads(json.dumps(p.feed_file(path)))
+
+
+def test_cli_profile(tmp_path, capsys):
+    input_file = tmp_path / 'data.in'
+    input_file.write_text('START\n1\nhello\n2\nEND')
+
+    p = Parser(IntOrWordRule())
+    p.cli([str(input_file), str(input_file), '--profile', 'json'])
+    captured = capsys.readouterr()
+    assert len(captured.out.split('\n')) == 3
+    stats = json.loads(captured.err)
+    assert stats["IntOrWordRule"]["calls"] == 2
+    assert stats["IntRule"]["calls"] == 4
+
+    p.cli([str(input_file), '--profile'])
+    assert capsys.readouterr().err.startswith("rule_id")
+
+
+def test_iter_feed(tmp_path):
+    rlr = RuleListRule(start_tag="START", end_tag="END", rules=[IntRule()])
+    p = Parser(rlr)
+    data = "START\n1\n2\nEND\nfoo\nSTART\n3\nEND\nSTART\nEND\nbar"
+    expected = [[[1, 2]], [[3]], [[]]]
+
+    results = p.iter_feed(data)
+    assert next(results) == expected[0], "results should be lazily yielded"
+    assert list(results) == expected[1:]
+
+    assert list(p.iter_feed(data.replace('\n', ' '), delim=' ')) == expected
+    assert list(p.iter_feed_stream(io.StringIO(data))) == expected
+    assert list(p.iter_feed("foo\nbar")) == []
+
+    input_file = tmp_path / 'data.in'
+    input_file.write_text(data)
+    for use_mmap in [False, True]:
+        results = p.iter_feed_file(str(input_file), use_mmap=use_mmap)
+        assert list(results) == expected
+
+
+def test_cli_batch(tmp_path, capsys):
+    for name, data in [('a.in', 'START\n1\nEND'), ('b.in', 'START\n2\n3\nEND'),
+                       ('c.in', 'START\n4\n')]:
+        (tmp_path / name).write_text(data)
+    file_list = tmp_path / 'files.txt'
+    file_list.write_text(f"{tmp_path / 'b.in'}\n\n")
+
+    rlr = RuleListRule(start_tag="START", end_tag="END", rules=[IntRule()])
+    p = Parser(rlr)
+
+    glob_args = [str(tmp_path / '*.in')]
+    list_args = [str(tmp_path / 'a.in'), str(tmp_path / 'c.in')]
+    list_args += ['--file-list', str(file_list), '--jobs', '2']
+    for args in [glob_args, list_args]:
+        p.cli(args)
+        records = [
+            json.loads(line)
+            for line in capsys.readouterr().out.split('\n')
+            if line
+        ]
+        by_file = {pathlib.Path(r['file']).name: r for r in records}
+
+        assert len(records) == 3
+        assert by_file['a.in'] == {
+            'file': str(tmp_path / 'a.in'),
+            'data': [[1]]
+        }
+        assert by_file['b.in']['data'] == [[2, 3]]
+        assert 'Unexpected end' in by_file['c.in']['error']
+
+    with pytest.raises(SystemExit):
+        p.cli([str(tmp_path / '*.missing')])
@@ -0,0 +1,93 @@
+import io
+import json
+from unittest import mock
+
+from molextract import parser as parser_module
+from molextract import profiling
+from molextract.parser import Parser
+from molextract.rules.abstract import RuleListRule
+from util import IntRule, IntOrWordRule
+
+
+def test_profiler():
+    rule = IntOrWordRule()
+    parser = Parser(rule, profile=True)
+    data = "START\n1\nhello\n2\nEND\nSTART\nEND"
+    assert list(parser.iter_feed(data)) == [[[1, 2], ["hello"]], [[], []]]
+
+    stats = parser.profiler.stats
+    assert set(stats) == {"IntOrWordRule", "IntRule", "WordRule"}
+    assert stats["IntOrWordRule"]["calls"] == 2
+    assert stats["IntOrWordRule"]["lines"] == 5
+    assert stats["IntOrWordRule"]["start_tests"] == 2
+    assert stats["IntOrWordRule"]["start_matches"] == 2
+    assert stats["IntOrWordRule"]["end_tests"] == 5
+    assert stats["IntOrWordRule"]["end_matches"] == 2
+    assert stats["IntOrWordRule"]["resets"] == 2
+    assert stats["IntRule"]["calls"] == 2
+    assert stats["IntRule"]["lines"] == 0
+    assert stats["IntRule"]["resets"] == 2
+    assert stats["WordRule"]["calls"] == 1
+    # The lines routed by the combined start_tag regex are counted too
+    assert stats["IntRule"]["start_tests"] == 3
+    assert stats["IntRule"]["start_matches"] == 2
+    assert stats["WordRule"]["start_tests"] == 3
+    assert stats["WordRule"]["start_matches"] == 1
+
+    # The same counts as testing each rule in turn
+    fallback = Parser(IntOrWordRule(), profile=True)
+    with mock.patch.object(RuleListRule, "_get_dispatch", return_value=None):
+        list(fallback.iter_feed(data))
+    for rule_id in ["IntRule", "WordRule"]:
+        assert fallback.profiler.stats[rule_id]["start_matches"] == \
+            stats[rule_id]["start_matches"]
+
+    outer = stats["IntOrWordRule"]
+    assert 0 <= outer["self_time"] <= outer["process_time"]
+
+    table = parser.profiler.report().split("\n")
+    assert table[0].split()[0] == "rule_id"
+    assert table[1].split()[0] == "IntOrWordRule"
+    stream = io.StringIO()
+    parser.profiler.dump(stream, "json")
+    assert json.loads(stream.getvalue()) == stats
+
+    # The rules are only instrumented while parsing
+    assert parser.feed(data) == [[1, 2], ["hello"]]
+    for r in [rule] + rule.rules:
+        assert "process_lines" not in vars(r)
+        assert "reset" not in vars(r)
+        assert "_get_dispatch" not in vars(r)
+
+
+def test_profiler_disabled():
+    assert Parser(IntRule()).profiler is None
+    with mock.patch.object(profiling, "MOLEXTRACT_PROFILE", "1"), \
+            mock.patch.object(parser_module, "_exit_profilers", []), \
+            mock.patch("atexit.register") as register:
+        parser = Parser(IntRule())
+        assert parser.profiler is not None
+        # The exit handler is only registered once per process
+        Parser(IntRule())
+        register.assert_called_once()
+        assert Parser(IntRule(), profile=False).profiler is None
+
+        parser.feed("1")
+        stream = io.StringIO()
+        with mock.patch("sys.stderr", stream):
+            register.call_args[0][0]()
+        # Only the profiler that parsed something is reported
+        assert stream.getvalue() == parser.profiler.report() + "\n"
+
+
+def test_profiler_nested_rules():
+    inner = IntOrWordRule()
+    outer = RuleListRule("LOG", "STOP", rules=[inner, IntRule()])
+    parser = Parser(outer, profile=True)
+    data = "LOG\nSTART\n1\nEND\n2\nSTOP"
+    assert parser.feed(data) == [[[1], []], [2]]
+
+    stats = parser.profiler.stats
+    assert stats["RuleListRule"]["lines"] == 5
+    assert stats["IntOrWordRule"]["lines"] == 2
+    assert stats["IntRule"]["calls"] == 2
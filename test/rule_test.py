@@ -1,9 +1,14 @@
+import pickle
+import re
 from unittest import mock
 
 import pytest
 
+from molextract import rule as rule_module
 from molextract.rule import Rule
 from molextract import debug
+from molextract import source
+from util import IntOrWordRule
 
 
 def test_start_tag_matches():
@@ -22,8 +27,9 @@ def test_start_tag_matches():
     assert rule.start_tag_matches("prefix Foo suffix")
 
 
+@mock.patch('molextract.debug.is_enabled', return_value=True)
 @mock.patch('molextract.debug.log_start_tag')
-def test_log_start_tag(mock_log_start_tag):
+def test_log_start_tag(mock_log_start_tag, mock_is_enabled):
     rule = Rule("Foo", "Bar", False)
     for level in debug.LOG_NAME_TO_LEVEL:
         with mock.patch('molextract.debug.MOLEXTRACT_LOG_LEVEL', level):
@@ -56,8 +62,9 @@ def test_end_tag_matches():
     assert rule.end_tag_matches("prefix Bar suffix")
 
 
+@mock.patch('molextract.debug.is_enabled', return_value=True)
 @mock.patch('molextract.debug.log_end_tag')
-def test_log_end_tag(mock_log_end_tag):
+def test_log_end_tag(mock_log_end_tag, mock_is_enabled):
     rule = Rule("Foo", "Bar", False)
     for level in debug.LOG_NAME_TO_LEVEL:
         with mock.patch('molextract.debug.MOLEXTRACT_LOG_LEVEL', level):
@@ -74,6 +81,19 @@ def test_log_end_tag(mock_log_end_tag):
             mock_log_end_tag.reset_mock()
 
 
+@mock.patch('molextract.debug.log_start_tag')
+@mock.patch('molextract.debug.log_end_tag')
+def test_log_tags_disabled(mock_log_end_tag, mock_log_start_tag):
+    rule = Rule("Foo", "Bar", False)
+    with mock.patch.object(rule, 'rule_id') as mock_rule_id:
+        assert rule.start_tag_matches("Foo")
+        assert rule.end_tag_matches("Bar")
+
+    assert mock_rule_id.call_count == 0
+    assert mock_log_start_tag.call_count == 0
+    assert mock_log_end_tag.call_count == 0
+
+
 def test_skip():
     rule = Rule("Foo", "Bar")
     rule.set_iter(iter("abcd"))
@@ -117,3 +137,185 @@ def test_rule_iter():
     rule.set_iter(iter([]))
     with pytest.raises(ValueError):
         list(rule)
+
+
+@pytest.mark.parametrize("pattern,expected", [
+    ("Foo Bar", ("Foo Bar", True, "Foo Bar")),
+    (r"\+\+    Orbital specifications:",
+     ("++    Orbital specifications:", True, "++    Orbital specifications:")),
+    (r"\s+This run of MOLCAS", ("", False, "This run of MOLCAS")),
+    (r"\s+-+$", ("", False, "-")),
+    (r"^\s+$", ("", False, "")),
+    (r"Foo\d+Bar", ("Foo", False, "Foo")),
+    (r"Fo+Bar", ("Fo", False, "Bar")),
+    (r"Foo?Bar", ("Fo", False, "Bar")),
+    (r"Foo{2}", ("Fo", False, "Fo")),
+    (r"Foo|Bar", ("", False, "")),
+    (r"(Foo)", ("", False, "")),
+    (r".*", ("", False, "")),
+])  # yapf: disable
+def test_literal_parts(pattern, expected):
+    assert rule_module._literal_parts(pattern) == expected
+
+
+@pytest.mark.parametrize("pattern", [
+    "Foo", r"Foo\.", r"\s+Foo", r"Fo+\s*Bar", r"Foo?Bar", r"(?i)foo", ".*",
+    r"^\s+$", r"\s+-+$", "Foo|Bar"
+])
+def test_tag_fast_path(pattern):
+    """
+    The literal fast path must agree with the plain regex on every line
+    """
+    lines = [
+        "", " ", "Foo", "FooBar", "Foo Bar", "Foo.", "FooX", "  Foo",
+        "prefix Foo", "FoBar", "Fooo  Bar", "FOO", "Bar", "---", "  ---", "\t"
+    ]
+    compiled_re = re.compile(pattern)
+    for check_only_beginning in [True, False]:
+        rule = Rule(pattern, pattern, check_only_beginning)
+        match = compiled_re.match
+        if not check_only_beginning:
+            match = compiled_re.search
+        for line in lines:
+            expected = match(line) is not None
+            assert rule.start_tag_matches(line) == expected, line
+            assert rule.end_tag_matches(line) == expected, line
+
+
+def test_pickle():
+    rule = Rule("Foo", "Bar", False)
+    rule.set_iter(iter(["data", "prefix Bar"]))
+
+    copy = pickle.loads(pickle.dumps(rule))
+    assert copy.start_tag_matches("prefix Foo")
+    assert copy.end_tag_matches("prefix Bar")
+    assert list(rule) == ["data"]
+
+    # The iterator is not pickled
+    with pytest.raises(ValueError):
+        next(copy)
+
+
+@pytest.mark.parametrize("pattern", [
+    "Foo", r"Foo\.", r"\s+Foo", r"Fo+\s*Bar", r"(?i)foo", ".*", r"\s+-+$",
+    "Foo|Bar"
+])
+def test_raw_tag_filters(pattern):
+    """
+    The bytes filters must agree with matching the decoded line
+    """
+    lines = ["", "Foo", "FooBar", "Foo.", "  Foo", "prefix Foo", "FOO", "---"]
+    for check_only_beginning in [True, False]:
+        rule = Rule(pattern, pattern, check_only_beginning)
+        start_filter, end_filter = rule.raw_tag_filters()
+        for line in lines:
+            expected = rule.start_tag_matches(line)
+            assert start_filter(line.encode()) == expected, line
+            assert end_filter(line.encode()) == expected, line
+
+
+def test_raw_tag_filters_accept_all():
+    """
+    Tags that can not be matched against bytes, and overridden matching
+    methods, must not reject any line
+    """
+    rule = Rule("Énergie", "Foo")
+    start_filter, end_filter = rule.raw_tag_filters()
+    assert start_filter(b"Bar")
+    assert not end_filter(b"Bar")
+
+    rule.end_tag_matches = lambda line: True
+    assert rule.raw_tag_filters()[1](b"Bar")
+
+
+def test_set_raw_iter():
+    rule = Rule("Foo", "End")
+    rule.set_raw_iter(iter([b"caf\xc3\xa9", b"End", b"after"]), "utf-8")
+    assert list(rule) == ["café"]
+
+    rule.set_iter(iter(["data", "End"]))
+    assert rule._raw_iterator is None
+    assert list(rule) == ["data"]
+
+
+@pytest.mark.parametrize("end_tag", ["END", r"\s+END", r"^\s*$", "E(?=N)"])
+def test_skip_to_end(tmp_path, end_tag):
+    """
+    Skipping must stop at the same line whatever the source of lines is
+    """
+    data = "a\n  ENDING\n\nb\nEND\nc"
+    path = tmp_path / 'data.in'
+    path.write_text(data)
+    rule = Rule("START", end_tag)
+
+    rule.set_iter(iter(data.split("\n")))
+    expected = rule.skip_to_end()
+    remaining = list(rule._iterator)
+
+    lines = iter([line.encode() for line in data.split("\n")])
+    rule.set_raw_iter(lines)
+    assert rule.skip_to_end() == expected
+    assert list(lines) == [line.encode() for line in remaining]
+
+    for encoding in ['utf-8', None]:
+        with source.MmapLines(str(path), encoding) as lines:
+            if encoding is None:
+                rule.set_raw_iter(lines)
+            else:
+                rule.set_iter(lines)
+            assert rule.skip_to_end() == expected
+            if encoding is None:
+                lines = source.decode_lines(lines)
+            assert list(lines) == remaining
+
+    rule.set_iter(iter(["a", "b"]))
+    with pytest.raises(ValueError):
+        rule.skip_to_end()
+
+
+@pytest.mark.parametrize("pattern,searchable", [
+    ("END", True),
+    (r"\s+-+$", True),
+    (r"^\s+$", False),
+    (r"\s+\d", True),
+    (r"\d(?=x)", False),
+    (r"\A\s+", False),
+    (r"(?i)end", False),
+])  # yapf: disable
+def test_compile_finder(pattern, searchable):
+    finder = rule_module._compile_finder(re.compile(pattern), True)
+    assert (finder is not None) == searchable
+
+
+def test_patch_methods():
+    rule = IntOrWordRule()
+    rules = list(rule_module.walk(rule))
+    assert rules == [rule] + rule.rules
+
+    def own_reset():
+        return "own"
+
+    rule.rules[0].reset = own_reset
+    calls = []
+
+    def wrap(nested):
+        reset = nested.reset
+
+        def counted_reset():
+            calls.append(nested.rule_id())
+            return reset()
+
+        return {"reset": counted_reset}
+
+    with rule_module.patch_methods(rule, wrap):
+        assert rule.reset() == ["own", []]
+    assert calls == ["IntOrWordRule", "IntRule", "WordRule"]
+
+    # The original methods are restored, including those of the instance
+    assert rule.rules[0].reset is own_reset
+    assert "reset" not in vars(rule) and "reset" not in vars(rule.rules[1])
+
+    with pytest.raises(ValueError):
+        with rule_module.patch_methods(rule, wrap):
+            raise ValueError
+    assert "reset" not in vars(rule)
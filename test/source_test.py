@@ -0,0 +1,163 @@
+import bz2
+import gzip
+import io
+import lzma
+import sys
+
+import pytest
+
+from molextract import source
+from molextract.parser import Parser
+from molextract.rules.molcas import rasscf
+from util import molextract_test_file
+
+
+def test_iter_stream_lines():
+    stream = io.StringIO("a\nb\n\nc")
+    assert list(source.iter_stream_lines(stream)) == ["a", "b", "", "c"]
+    assert list(source.iter_stream_lines(io.StringIO(""))) == []
+
+
+@pytest.mark.parametrize("chunk_size", [1, 4, 1 << 20])
+def test_mmap_lines(tmp_path, chunk_size):
+    path = tmp_path / 'data.in'
+    path.write_bytes(b"foo\nbar baz\r\n\nqux")
+
+    with source.MmapLines(str(path)) as lines:
+        lines.CHUNK_SIZE = chunk_size
+        assert next(lines) == "foo"
+        assert lines.offset == 0
+        assert lines.tell() == 4
+        assert next(lines) == "bar baz"
+        assert lines.offset == 4
+        assert list(lines) == ["", "qux"]
+        assert lines.offset == 14
+
+        lines.seek(4)
+        assert next(lines) == "bar baz"
+        lines.seek(0)
+        assert list(lines) == ["foo", "bar baz", "", "qux"]
+
+        with pytest.raises(ValueError):
+            lines.seek(100)
+
+
+def test_mmap_lines_empty(tmp_path):
+    path = tmp_path / 'data.in'
+    path.write_bytes(b"")
+
+    with source.MmapLines(str(path)) as lines:
+        assert list(lines) == []
+
+
+def test_mmap_lines_matches_stream():
+    path = str(molextract_test_file("styrene.log"))
+    with open(path) as f:
+        expected = list(source.iter_stream_lines(f))
+
+    with source.MmapLines(path) as lines:
+        assert list(lines) == expected
+
+    parser = Parser(rasscf.RASSCFModule())
+    assert parser.feed_file(path, use_mmap=True) == parser.feed_file(path)
+
+
+@pytest.mark.parametrize("compress",
+                         [gzip.compress, lzma.compress, bz2.compress])
+def test_open_text_compressed(tmp_path, compress):
+    path = tmp_path / 'data.in'
+    path.write_bytes(compress(b"foo\nbar\n"))
+
+    assert source.is_compressed(str(path))
+    with source.open_text(str(path)) as f:
+        assert list(source.iter_stream_lines(f)) == ["foo", "bar"]
+
+
+def test_open_text_zstd(tmp_path):
+    zstandard = pytest.importorskip("zstandard")
+    path = tmp_path / 'data.in'
+    path.write_bytes(zstandard.ZstdCompressor().compress(b"foo\nbar\n"))
+
+    with source.open_text(str(path)) as f:
+        assert list(source.iter_stream_lines(f)) == ["foo", "bar"]
+
+
+def test_open_text_plain(tmp_path):
+    path = tmp_path / 'data.in'
+    path.write_bytes(b"foo\nbar\n")
+
+    assert not source.is_compressed(str(path))
+    with source.open_text(str(path)) as f:
+        assert list(source.iter_stream_lines(f)) == ["foo", "bar"]
+
+
+def test_feed_file_compressed(tmp_path):
+    path = molextract_test_file("styrene.log")
+    compressed = tmp_path / 'styrene.log.gz'
+    compressed.write_bytes(gzip.compress(path.read_bytes()))
+
+    parser = Parser(rasscf.RASSCFModule())
+    expected = parser.feed_file(str(path))
+    assert parser.feed_file(str(compressed)) == expected
+    assert parser.feed_file(str(compressed), use_mmap=True) == expected
+
+
+@pytest.mark.parametrize("compress", [lambda data: data, gzip.compress])
+def test_feed_file_stdin(compress, monkeypatch):
+    data = molextract_test_file("styrene.log").read_bytes()
+    stdin = io.TextIOWrapper(io.BufferedReader(io.BytesIO(compress(data))))
+    monkeypatch.setattr(sys, "stdin", stdin)
+
+    parser = Parser(rasscf.RASSCFModule())
+    expected = parser.feed(data.decode())
+    assert parser.feed_file(source.STDIN_PATH) == expected
+
+
+def test_binary_lines(tmp_path):
+    path = tmp_path / 'data.in'
+    path.write_bytes(b"foo\nbar baz\r\n\nqux")
+
+    with source.MmapLines(str(path), encoding=None) as lines:
+        lines.CHUNK_SIZE = 4
+        assert list(lines) == [b"foo", b"bar baz", b"", b"qux"]
+
+    with open(path, 'rb') as f:
+        lines = list(source.iter_binary_lines(f))
+    assert lines == [b"foo", b"bar baz", b"", b"qux"]
+    assert list(source.decode_lines(
+        iter(lines))) == ["foo", "bar baz", "", "qux"]
+
+
+@pytest.mark.parametrize("use_mmap", [False, True])
+def test_feed_file_binary(tmp_path, use_mmap):
+    path = str(molextract_test_file("styrene.log"))
+    expected = Parser(rasscf.RASSCFModule()).feed_file(path)
+
+    parser = Parser(rasscf.RASSCFModule(), binary=True)
+    assert parser.feed_file(path, use_mmap=use_mmap) == expected
+    assert list(parser.iter_feed_file(path, use_mmap)) == [expected]
+
+
+@pytest.mark.parametrize("encoding", ['utf-8', None])
+def test_mmap_lines_skip_to(tmp_path, encoding):
+    path = tmp_path / 'data.in'
+    path.write_bytes(b"a\nEND x\r\nb\nEND y\nc")
+
+    def find(buffer, pos):
+        return buffer.find(b"END", pos)
+
+    def decoded(text):
+        return text if encoding is not None else text.encode()
+
+    with source.MmapLines(str(path), encoding) as lines:
+        assert next(lines) == decoded("a")
+        # The first candidate does not match
+        assert lines.skip_to(
+            find, lambda line: line.endswith(decoded("y"))) == decoded("END y")
+        assert list(lines) == [decoded("c")]
+
+        lines.seek(0)
+        assert lines.skip_to(find, bool) == decoded("END x")
+        assert next(lines) == decoded("b")
+        assert lines.skip_to(find, lambda line: False) is None
+        assert list(lines) == []
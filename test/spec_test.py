@@ -0,0 +1,80 @@
+import pickle
+import threading
+
+from molextract import RuleSpec
+from molextract.parser import Parser
+from molextract.rules.molcas import log, mcpdft, rasscf
+from util import molextract_test_file, IntOrWordRule, IntRule
+
+
+def log_spec():
+    rules = [RuleSpec(rasscf.RASSCFModule), RuleSpec(mcpdft.MCPDFTModule)]
+    return RuleSpec(log.LogRule, rules=rules)
+
+
+def test_build():
+    spec = log_spec()
+    rule = spec.build()
+    assert isinstance(rule, log.LogRule)
+    expected = [rasscf.RASSCFModule, mcpdft.MCPDFTModule]
+    assert [type(r) for r in rule.rules] == expected
+
+    other = spec()
+    assert other is not rule
+    assert all(a is not b for a, b in zip(rule.rules, other.rules))
+
+    copy = pickle.loads(pickle.dumps(spec))
+    assert copy == spec
+    assert repr(copy) == repr(spec)
+    assert hash(copy) == hash(spec)
+    assert len({spec, copy, log_spec()}) == 1
+    assert log_spec() in {spec: "log"}
+    assert "RASSCFModule" in repr(spec)
+
+    spec = RuleSpec(log.ModuleRule, "test", rules=(RuleSpec(IntRule),))
+    rule = spec.build()
+    assert rule.rules[0] is not spec.build().rules[0]
+    assert isinstance(rule.rules, tuple)
+
+
+def test_parser_from_factory():
+    parser = Parser.from_factory(IntOrWordRule)
+    parser.rule.rules[0].process_lines("42")
+
+    clone = parser.clone()
+    assert clone.factory is IntOrWordRule
+    assert clone.rule is not parser.rule
+    assert clone.feed("START\n1\nEND") == [[1], []]
+
+    # Parsers created from a factory are pickled as just the factory
+    copy = pickle.loads(pickle.dumps(parser))
+    assert copy.feed("START\n1\nEND") == [[1], []]
+    assert parser.feed("START\n1\nEND") == [[42, 1], []]
+
+    # Other parsers are copied along with their state
+    parser = Parser(IntOrWordRule())
+    parser.rule.rules[0].process_lines("42")
+    assert parser.clone().feed("START\n1\nEND") == [[42, 1], []]
+
+
+def test_parser_clone_threads():
+    path = str(molextract_test_file("styrene.log"))
+    parser = Parser.from_factory(log_spec())
+    expected = parser.feed_file(path)
+
+    results = []
+
+    def parse(thread_parser):
+        for _ in range(5):
+            results.append(thread_parser.feed_file(path))
+
+    threads = [
+        threading.Thread(target=parse, args=(parser.clone(),)) for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(results) == 20
+    assert all(result == expected for result in results)
@@ -0,0 +1,81 @@
+import json
+
+from molextract import synthetic
+from molextract.parser import Parser
+
+import pytest
+
+
+@pytest.mark.parametrize("program", ["molcas", "gaussian"])
+@pytest.mark.parametrize("binary", [False, True])
+@pytest.mark.parametrize("use_mmap", [False, True])
+def test_write_log(tmp_path, program, binary, use_mmap):
+    path = tmp_path / "synthetic.log"
+    expected = synthetic.write_log(str(path), program, runs=3, seed=1)
+    assert len(expected) == 3
+
+    parser = Parser(synthetic.RULES[program](), binary=binary)
+    assert list(parser.iter_feed_file(path, use_mmap=use_mmap)) == expected
+
+
+def test_write_log_options(tmp_path):
+    path = tmp_path / "synthetic.log"
+    rasscf_out, mcpdft_out, props, rassi_out = synthetic.write_log(
+        str(path), "molcas", roots=3, active_orbs=25, ci_rows=7)[0]
+    assert rasscf_out["roots"] == 3
+    assert rasscf_out["active_orbs"] == 25
+    assert len(rasscf_out["data"]) == 3
+    for root in rasscf_out["data"]:
+        assert len(root["ci_coeff"]) == 7
+        assert len(root["ci_coeff"][0][1]) == 25
+        assert len(root["occupation"]) == 25
+    assert mcpdft_out["roots"] == 3
+    assert len(props) == 1
+    assert [(s["from"], s["to"]) for s in rassi_out[0]] == [(1, 2), (1, 3),
+                                                            (2, 3)]
+
+    excited_states, _ = synthetic.write_log(str(path), "gaussian", states=4)[0]
+    assert len(excited_states) == 4
+
+    with pytest.raises(TypeError):
+        synthetic.write_log(str(path), "gaussian", roots=3)
+
+
+def test_write_log_size(tmp_path):
+    path = tmp_path / "synthetic.log"
+    expected = synthetic.write_log(str(path), "gaussian", size_mb=0.1)
+    assert path.stat().st_size >= 0.1 * synthetic.MB
+    assert len(expected) > 1
+
+    # The same seed gives the same log
+    data = path.read_bytes()
+    synthetic.write_log(str(path), "gaussian", runs=len(expected))
+    assert path.read_bytes() == data
+
+
+def test_main(tmp_path, capsys):
+    path = tmp_path / "synthetic.log"
+    truth = tmp_path / "truth.json"
+    synthetic.main(
+        ["molcas", str(path), "--runs", "2", "--roots", "2", "--truth",
+         str(truth)])  # yapf: disable
+    expected = json.loads(truth.read_text())
+    assert len(expected) == 2
+
+    parser = Parser(synthetic.molcas_rule())
+    assert json.loads(json.dumps(list(parser.iter_feed_file(path)))) == expected
+
+    with pytest.raises(SystemExit):
+        synthetic.main(["gaussian", str(path), "--roots", "2"])
+    assert "--roots is molcas only" in capsys.readouterr().err
+
+
+@pytest.mark.parametrize("program", ["molcas", "gaussian"])
+def test_adaptive_order(tmp_path, program):
+    path = tmp_path / "synthetic.log"
+    expected = synthetic.write_log(str(path), program, runs=4, seed=2)
+
+    rule = synthetic.RULES[program]()
+    rule.set_adaptive()
+    parser = Parser(rule)
+    assert list(parser.iter_feed_file(path)) == expected
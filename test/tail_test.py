@@ -0,0 +1,144 @@
+from molextract.parser import Parser
+from molextract.rules.molcas import log, mcpdft, rasscf
+from molextract.tail import TailParser
+from util import molextract_test_file, IntOrWordRule
+
+import pytest
+
+
+def test_poll(tmp_path):
+    path = tmp_path / 'job.log'
+    path.write_text('')
+    tail = TailParser(IntOrWordRule(), str(path))
+    assert tail.poll() == []
+
+    with open(path, 'a') as f:
+        f.write('foo\nSTART\n1\nhel')
+    assert tail.poll() == [('IntRule', [1])]
+    assert tail.in_rule
+
+    with open(path, 'a') as f:
+        f.write('lo\n2\nEND\n3\nSTART\n')
+    assert tail.poll() == [('WordRule', ['hello']), ('IntRule', [2])]
+    assert tail.in_rule
+
+    # Resume from the saved state
+    tail = TailParser(IntOrWordRule(), str(path), tail.offset, tail.in_rule)
+    with open(path, 'a') as f:
+        f.write('4\n')
+    assert tail.poll() == [('IntRule', [4])]
+
+    # The file was truncated
+    path.write_text('START\n5\n')
+    assert tail.poll() == [('IntRule', [5])]
+
+    with pytest.raises(TypeError):
+        TailParser(rasscf.RASSCFEnergy(), str(path))
+
+
+def test_poll_molcas_log(tmp_path):
+    """
+    Write a log a few lines at a time and make sure every module is
+    emitted once, as soon as it is complete, with the same output as parsing
+    the whole file
+    """
+    with open(molextract_test_file("styrene.log"), 'rb') as f:
+        data = f.read()
+
+    path = tmp_path / 'styrene.log'
+    path.write_bytes(b'')
+    rules = [rasscf.RASSCFModule(), mcpdft.MCPDFTModule()]
+    tail = TailParser(log.LogRule(rules), str(path))
+
+    records = []
+    step = 50000
+    for i in range(0, len(data), step):
+        with open(path, 'ab') as f:
+            f.write(data[i:i + step])
+        records.extend(tail.poll())
+
+    parser = Parser(log.LogRule([rasscf.RASSCFModule(), mcpdft.MCPDFTModule()]))
+    expected = parser.feed_file(str(path))
+    assert records == list(zip(['RASSCFModule', 'MCPDFTModule'], expected))
+    assert not tail.in_rule
+    assert tail.offset == len(data)
+
+
+def test_poll_suspended(tmp_path):
+    """
+    Stop writing part way through the rasscf module, the module is carried
+    on with by the next poll instead of being parsed again
+    """
+    with open(molextract_test_file("styrene.log"), 'rb') as f:
+        lines = f.read().splitlines(keepends=True)
+    head = b''.join(lines[:2000])
+    start = len(b''.join(lines[:1774]))
+
+    path = tmp_path / 'styrene.log'
+    path.write_bytes(head)
+    tail = TailParser(log.LogRule([rasscf.RASSCFModule()]),
+                      str(path),
+                      stream=True,
+                      chunk_size=4096)
+    records = tail.poll()
+    assert tail.stack[:2] == ['LogRule', 'RASSCFModule']
+    assert tail.in_rule
+    assert tail.offset == start
+    # The CI coefficients of the roots printed so far were streamed already
+    roots = [r['root'] for i, r in records if i == 'RASSCFCiCoeff']
+    assert set(roots) == {1, 2}
+
+    with open(path, 'ab') as f:
+        f.write(b''.join(lines[2000:]))
+    records += tail.poll()
+    tail.close()
+    assert tail.stack == []
+
+    # Every record is emitted once, as when parsing the whole file
+    expected = []
+    parser = Parser(log.LogRule([rasscf.RASSCFModule()]),
+                    sink=lambda rule_id, record: expected.append(
+                        (rule_id, record)))
+    modules = parser.feed_file(str(path))
+    expected.append(('RASSCFModule', modules[0]))
+    assert records == expected
+
+    # Resuming from the saved state parses the module again from its start
+    expected = Parser(log.LogRule([rasscf.RASSCFModule()])).feed_file(str(path))
+    tail = TailParser(log.LogRule([rasscf.RASSCFModule()]), str(path), start,
+                      True)
+    assert tail.poll() == [('RASSCFModule', expected[0])]
+
+
+def test_poll_crlf(tmp_path):
+    path = tmp_path / 'job.log'
+    path.write_bytes(b'START\r\nhello\r\n1\r\nEND\r\n')
+    tail = TailParser(IntOrWordRule(), str(path), chunk_size=3)
+    assert tail.poll() == [('WordRule', ['hello']), ('IntRule', [1])]
+    assert not tail.in_rule
+    assert tail.offset == path.stat().st_size
+
+
+def test_poll_error(tmp_path):
+    path = tmp_path / 'job.log'
+    path.write_text('START\n1\n2x\n' + '3\n' * 10)
+    tail = TailParser(IntOrWordRule(), str(path), max_chunks=1, chunk_size=2)
+    with pytest.raises(ValueError):
+        tail.poll()
+
+
+def test_context_manager(tmp_path):
+    path = tmp_path / 'job.log'
+    path.write_text('START\n1\n')
+    rule = IntOrWordRule()
+    with TailParser(rule, str(path), stream=True) as tail:
+        assert tail.poll() == [('IntRule', 1), ('IntRule', [])]
+        assert "process_lines" in vars(rule)
+        assert tail._thread.is_alive()
+
+    # The thread is stopped and the rules are left as they were
+    assert not tail._thread.is_alive()
+    assert rule.section_sink is None
+    assert rule.sink is None and rule.rules[0].sink is None
+    for nested in [rule] + rule.rules:
+        assert "process_lines" not in vars(nested)